@@ -8,6 +8,11 @@ Usage:
     python scripts/retrain.py --feedback feedback.jsonl --feedback-repeat 10
     python scripts/retrain.py --no-augmentation
     python scripts/retrain.py --training-data path/to/combined_cleaned.csv --output-dir path/to/classification/
+    python scripts/retrain.py --n-jobs 8
+    python scripts/retrain.py --feedback feedback.jsonl --no-cache
+    python scripts/retrain.py --feedback feedback.jsonl --model sgd --publish --output-dir /srv/nimblist/models
+    python scripts/retrain.py --feedback feedback.jsonl --warm-start-from src/nimblist/Nimblist.classification --compare-cold
+    python scripts/retrain.py --sweep --sweep-max-features 5000,15000,30000 --latency-slo-ms 5
 
 Pipeline improvements over the original training notebooks:
   - Quantity/size tokens (500g, 2L, 6 pack, x4) stripped from product names
@@ -18,6 +23,26 @@ Pipeline improvements over the original training notebooks:
   - Final deployment models are trained on ALL data; a separate evaluation pass
     on a held-out split gives honest accuracy metrics
   - Feedback rows are oversampled (default 5x) as verified ground truth
+  - The primary model's evaluation and deployment passes and every sub-model
+    are trained in parallel on --n-jobs processes, with logs in the usual order
+  - Identical (name, category, sub-category) rows — repeated feedback, names
+    that truncate to the same 'milk' — are trained as one row with a summed
+    sample weight instead of as copies
+  - Preprocessing cleans each distinct name once, in chunks spread over --n-jobs
+    processes, and augmentation works on whole columns; the training set is
+    identical to the one the row-by-row version built
+  - Intermediate artifacts (cleaned and augmented datasets, TF-IDF matrices,
+    fitted models) are cached by content under --cache-dir, so a rerun only
+    recomputes the stages whose inputs or code changed
+  - --model sgd trains log-loss SGD classifiers instead, which
+    scripts/update_models.py can update in place from new feedback (partial_fit);
+    --publish saves the result as a new model version that running
+    classification workers load without a restart
+  - --warm-start-from starts each deployment fit from the previously deployed
+    model's coefficients, mapped onto the new vocabulary and classes
+  - --sweep compares primary model configurations on held-out accuracy and on
+    what they cost to serve (size, load time, memory, single-item latency)
+    instead of training the deployment models; sub-models are not swept
 
 clean_text() and _lemmatize_word() below MUST stay identical to the copies in
 src/nimblist/Nimblist.classification/app.py — they define the shared preprocessing
@@ -25,17 +50,28 @@ contract between training and inference.
 """
 
 import argparse
+import hashlib
+import multiprocessing
+import inspect
 import json
 import os
 import re
+import shutil
 import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 import pandas as pd
 import numpy as np
+import scipy.sparse
+import sklearn
 from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
+from joblib import Parallel, delayed
 
 # ---------------------------------------------------------------------------
 # Paths
@@ -45,6 +81,15 @@ REPO_ROOT = os.path.dirname(SCRIPT_DIR)
 DEFAULT_TRAINING_CSV = os.path.join(SCRIPT_DIR, 'ClassificationModel', 'combined_cleaned.csv')
 DEFAULT_OUTPUT_DIR = os.path.join(REPO_ROOT, 'src', 'nimblist', 'Nimblist.classification')
 SUB_MODELS_SUBDIR = 'sub_category_models'
+DEFAULT_CACHE_DIR = os.path.join(SCRIPT_DIR, 'ClassificationModel', 'cache')
+PRIMARY_MODEL_FILE = 'supermarket_classifier_logreg.joblib'
+PRIMARY_VECTORIZER_FILE = 'tfidf_vectorizer_logreg.joblib'
+# Published versions live in <model dir>/versions/<version>/, and CURRENT holds
+# the name of the live one; each version has a VERSION_MANIFEST describing it.
+# Must match the classification app.
+VERSIONS_SUBDIR = 'versions'
+CURRENT_VERSION_FILE = 'CURRENT'
+VERSION_MANIFEST = 'model_version.json'
 
 # ---------------------------------------------------------------------------
 # Text preprocessing — MUST stay identical to app.py's versions
@@ -93,6 +138,30 @@ def clean_text(text: str) -> str:
     text = ' '.join(_lemmatize_word(w) for w in text.split())
     return text
 
+
+def _clean_chunk(names) -> list:
+    return [clean_text(n) for n in names]
+
+
+def clean_texts(names: pd.Series, n_jobs: int = 1, chunk_size: int = 20_000) -> pd.Series:
+    """
+    names.apply(clean_text), computed faster. Each distinct name is cleaned once
+    (feedback rows are repeated, and catalogue names recur across retailers);
+    when there are more than chunk_size of them they are cleaned in chunks on
+    n_jobs worker processes (-1 = one per core). The chunks come back in order,
+    so the result is the same for any n_jobs.
+    """
+    if names.empty:
+        return names.astype(str)
+    unique = pd.unique(names)
+    chunks = [unique[i:i + chunk_size] for i in range(0, len(unique), chunk_size)]
+    if n_jobs == 1 or len(chunks) < 2:
+        cleaned = _clean_chunk(unique)
+    else:
+        results = Parallel(n_jobs=n_jobs)(delayed(_clean_chunk)(chunk) for chunk in chunks)
+        cleaned = [name for chunk in results for name in chunk]
+    return names.map(dict(zip(unique, cleaned)))
+
 # ---------------------------------------------------------------------------
 # Data loading
 # ---------------------------------------------------------------------------
@@ -106,12 +175,51 @@ def load_base_training_data(csv_path: str) -> pd.DataFrame:
     return df[['generic_product_name', 'newCat', 'newSubCat']].copy()
 
 
-def load_feedback(jsonl_path: str) -> pd.DataFrame:
+_ISO_TIME_RE = re.compile(r'(?P<base>\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?)?)'
+                          r'(?:\.(?P<fraction>\d+))?(?P<offset>Z|[+-]\d{2}:?\d{2})?', re.IGNORECASE)
+
+
+def _parse_time(value: str) -> datetime:
+    """
+    An ISO 8601 timestamp as an aware datetime (UTC when it has no offset).
+    Also takes what .NET's DateTimeOffset writes and datetime.fromisoformat
+    rejects before Python 3.11: a Z offset, and fractional seconds of any
+    length (cut to microseconds). Raises ValueError for anything else.
+    """
+    match = _ISO_TIME_RE.fullmatch(value.strip())
+    if not match:
+        raise ValueError(f'not an ISO 8601 timestamp: {value!r}')
+    text = match['base']
+    if match['fraction']:
+        text += '.' + match['fraction'][:6].ljust(6, '0')
+    offset = match['offset']
+    if offset:
+        text += '+00:00' if offset.upper() == 'Z' else offset if ':' in offset else f'{offset[:3]}:{offset[3:]}'
+    parsed = datetime.fromisoformat(text)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _parse_recorded_at(obj: dict):
+    """A feedback row's recorded_at as a datetime; None (with a warning) when it is missing or unreadable."""
+    recorded_at = obj.get('recorded_at')
+    if not recorded_at:
+        return None
+    try:
+        return _parse_time(recorded_at)
+    except (TypeError, ValueError) as e:
+        print(f'  Warning: ignoring unreadable recorded_at: {e}')
+        return None
+
+
+def load_feedback(jsonl_path: str, since: str = None) -> pd.DataFrame:
     """
     Load feedback from GET /api/classificationfeedback/export.
     Each line: {item_name, category, sub_category, recorded_at}
-    Rows with null category are skipped (user removed the classification).
+    Rows with null category are skipped (user removed the classification), as
+    are rows recorded at or before since (an ISO timestamp) when it is given,
+    and then also rows whose recorded_at cannot be read.
     """
+    since = _parse_time(since) if since else None
     records = []
     with open(jsonl_path, encoding='utf-8') as f:
         for line in f:
@@ -120,6 +228,10 @@ def load_feedback(jsonl_path: str) -> pd.DataFrame:
                 continue
             try:
                 obj = json.loads(line)
+                if since and obj.get('recorded_at'):
+                    recorded_at = _parse_recorded_at(obj)
+                    if recorded_at is None or recorded_at <= since:
+                        continue
                 if obj.get('category'):
                     records.append({
                         'generic_product_name': obj['item_name'],
@@ -128,8 +240,28 @@ def load_feedback(jsonl_path: str) -> pd.DataFrame:
                     })
             except json.JSONDecodeError as e:
                 print(f'  Warning: skipping malformed line: {e}')
-    print(f'  {len(records):,} usable feedback records (category != null)')
-    return pd.DataFrame(records)
+    print(f'  {len(records):,} usable feedback records (category != null)'
+          + (f' recorded after {since.isoformat()}' if since else ''))
+    return pd.DataFrame(records, columns=['generic_product_name', 'newCat', 'newSubCat'])
+
+
+def feedback_watermark(jsonl_path: str):
+    """
+    The latest recorded_at in a feedback export, as written there, or None;
+    the since for the next incremental update. Unreadable timestamps are
+    ignored.
+    """
+    latest, latest_at = None, None
+    with open(jsonl_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                obj = json.loads(line) if line.strip() else {}
+            except json.JSONDecodeError:
+                continue
+            recorded_at = _parse_recorded_at(obj) if isinstance(obj, dict) else None
+            if recorded_at and (latest_at is None or recorded_at > latest_at):
+                latest, latest_at = obj['recorded_at'], recorded_at
+    return latest
 
 # ---------------------------------------------------------------------------
 # Data augmentation
@@ -143,154 +275,768 @@ def augment_training_data(df: pd.DataFrame, max_drop: int = 2) -> pd.DataFrame:
     toward the right — so left-truncation produces examples that look like
     what users actually type ('whole milk', 'milk' from 'organic whole milk').
 
-    max_drop=2 means each name produces at most 2 shorter variants.
-    """
-    rows = []
-    for _, row in df.iterrows():
-        words = row['generic_product_name'].split()
-        for drop in range(1, min(max_drop + 1, len(words))):
-            shorter = ' '.join(words[drop:]).strip()
-            if shorter:
-                rows.append({
-                    'generic_product_name': shorter,
-                    'newCat': row['newCat'],
-                    'newSubCat': row['newSubCat'],
-                })
-    return pd.DataFrame(rows)
+    max_drop=2 means each name produces at most 2 shorter variants. Variants
+    come out grouped by source row, fewest words dropped first, and keep the
+    source row's other columns (category, sub-category, weight).
+    """
+    columns = list(df.columns)
+    labels = [c for c in columns if c != 'generic_product_name']
+    words = df['generic_product_name'].str.split()
+    n_words = words.str.len()
+    parts = []
+    for drop in range(1, max_drop + 1):
+        keep = (n_words > drop).to_numpy()
+        if not keep.any():
+            break
+        part = df.loc[keep, labels].assign(
+            generic_product_name=words[keep].str[drop:].str.join(' '),
+            _row=np.flatnonzero(keep),
+        )
+        parts.append(part)
+    if not parts:
+        return df.iloc[:0][columns]
+    # Stable sort on the source row keeps each row's variants in drop order.
+    aug = pd.concat(parts).sort_values('_row', kind='stable')
+    # Rebuilt from plain lists so column dtypes are inferred as before.
+    return pd.DataFrame({c: aug[c].tolist() for c in columns})
+
+
+
+def collapse_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Merge identical (name, category, sub-category) rows into one whose weight
+    is the sum of theirs. Training on the result with sample weights fits the
+    same models as training on every copy.
+    """
+    return df.groupby(['generic_product_name', 'newCat', 'newSubCat'], sort=False, as_index=False)['weight'].sum()
+
+# ---------------------------------------------------------------------------
+# Artifact cache
+# ---------------------------------------------------------------------------
+
+# Pickled estimators and the numbers they hold depend on these.
+_LIB_VERSIONS = (sklearn.__version__, np.__version__, scipy.__version__)
+
+
+def _source_digest(*fns) -> str:
+    """Hash of the source of the functions that compute an artifact; editing one invalidates it."""
+    return hashlib.sha256(''.join(inspect.getsource(fn) for fn in fns).encode()).hexdigest()
+
+
+def _digest(*parts) -> str:
+    """Cache key over pandas objects and float arrays (by content) and JSON-serialisable settings."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (pd.Series, pd.DataFrame)):
+            h.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+        elif isinstance(part, np.ndarray):
+            h.update(np.ascontiguousarray(part, dtype=np.float64).tobytes())
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# Entry in a cached frame's .npz holding its column dtypes.
+_FRAME_DTYPES = '__dtypes__'
+
+
+class ArtifactCache:
+    """
+    Content-addressed store for intermediate retraining artifacts, saved as
+    <root>/<stage>/<key>.*. A key hashes everything its artifact was computed
+    from (input contents, settings, the source of the code and the library
+    versions), so a hit is always safe to reuse and any change is a miss.
+    Entries are never updated in place; delete the directory to reclaim space.
+
+    Datasets are stored column by column in compressed .npz files, with their
+    dtypes so a hit returns the same frame as the miss that saved it; TF-IDF
+    matrices as scipy sparse .npz and fitted estimators with joblib.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, stage: str, key: str, ext: str) -> str:
+        return os.path.join(self.root, stage, f'{key}{ext}')
+
+    def _write(self, path: str, save) -> None:
+        """save(tmp_path), then rename into place so readers never see a partial file."""
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, '.gitignore'), 'w') as f:
+                f.write('*\n')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        root, ext = os.path.splitext(path)
+        tmp = f'{root}.{os.getpid()}.tmp{ext}'
+        save(tmp)
+        os.replace(tmp, path)
+
+    def load_frame(self, stage: str, key: str):
+        path = self._path(stage, key, '.npz')
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            dtypes = json.loads(str(data[_FRAME_DTYPES])) if _FRAME_DTYPES in data.files else {}
+            return pd.DataFrame({c: pd.Series(data[c].tolist(), dtype=dtypes.get(c))
+                                 for c in data.files if c != _FRAME_DTYPES})
+
+    def save_frame(self, stage: str, key: str, df: pd.DataFrame) -> None:
+        columns = {c: df[c].to_numpy(dtype=str if df[c].dtype.kind in 'OUT' else None) for c in df.columns}
+        columns[_FRAME_DTYPES] = np.array(json.dumps({c: str(df[c].dtype) for c in df.columns}))
+        self._write(self._path(stage, key, '.npz'), lambda tmp: np.savez_compressed(tmp, **columns))
+
+    def load_matrix(self, stage: str, key: str):
+        path = self._path(stage, key, '.npz')
+        return scipy.sparse.load_npz(path) if os.path.exists(path) else None
+
+    def save_matrix(self, stage: str, key: str, matrix) -> None:
+        self._write(self._path(stage, key, '.npz'), lambda tmp: scipy.sparse.save_npz(tmp, matrix))
+
+    def load_object(self, stage: str, key: str):
+        path = self._path(stage, key, '.joblib')
+        return joblib.load(path) if os.path.exists(path) else None
+
+    def save_object(self, stage: str, key: str, obj) -> None:
+        self._write(self._path(stage, key, '.joblib'), lambda tmp: joblib.dump(obj, tmp))
+
+
+def prepare_source(path: str, loader, weight: int, max_drop: int, n_jobs: int = 1, cache=None):
+    """
+    One input file, ready to merge: (cleaned, augmented). cleaned is
+    loader(path) with a weight column and clean_text applied, minus names that
+    cleaned to nothing; augmented holds its left-truncated variants (none when
+    max_drop is 0). Cached on the file's content and the preprocessing code.
+    """
+    key = None
+    if cache:
+        code = _source_digest(loader, _lemmatize_word, clean_text, clean_texts, augment_training_data)
+        key = _digest(_file_digest(path), loader.__name__, weight, max_drop, code)
+        cleaned = cache.load_frame('cleaned', key)
+        augmented = cache.load_frame('augmented', key)
+        if cleaned is not None and augmented is not None:
+            print(f'Using cached preprocessing of {path}')
+            return cleaned, augmented
+
+    df = loader(path)
+    df['weight'] = weight
+    df['generic_product_name'] = clean_texts(df['generic_product_name'], n_jobs=n_jobs)
+    # Drop any rows whose name reduced to empty string after preprocessing
+    df = df[df['generic_product_name'].str.strip() != ''].reset_index(drop=True)
+    aug = augment_training_data(df, max_drop=max_drop)
+    if key:
+        cache.save_frame('cleaned', key, df)
+        cache.save_frame('augmented', key, aug)
+    return df, aug
 
 # ---------------------------------------------------------------------------
 # Vectorizer / model helpers
 # ---------------------------------------------------------------------------
 
-def _make_vectorizer() -> TfidfVectorizer:
-    return TfidfVectorizer(
-        stop_words='english',
-        max_features=15_000,
-        ngram_range=(1, 2),
-        sublinear_tf=True,
-    )
+PRIMARY_VEC_KWARGS = dict(stop_words='english', max_features=15_000, ngram_range=(1, 2), sublinear_tf=True)
+# Sub-models have far less data than the primary — use smaller feature count
+# to avoid over-fitting the vocabulary to training samples.
+SUB_VEC_KWARGS = dict(stop_words='english', max_features=5_000, ngram_range=(1, 2), sublinear_tf=True)
+
+
+def _fit_vectorizer(X: pd.Series, weights: pd.Series, vec_kwargs: dict) -> TfidfVectorizer:
+    """
+    TfidfVectorizer(**vec_kwargs) fitted as if each row of X appeared weights
+    times: the max_features cut uses weighted term counts and the idf uses
+    weighted document frequencies, computed the way TfidfVectorizer.fit does.
+
+    This makes the deployment fit equal to one on the repeated rows. The
+    evaluation pass is not equal to the old one: see _evaluate_primary().
+    """
+    w = weights.to_numpy(dtype=np.int64)
+    count_kwargs = {k: v for k, v in vec_kwargs.items() if k not in ('max_features', 'sublinear_tf')}
+    counter = CountVectorizer(**count_kwargs)
+    counts = counter.fit_transform(X)
+    vocabulary = counter.vocabulary_
+
+    limit = vec_kwargs.get('max_features')
+    if limit is not None and len(vocabulary) > limit:
+        tfs = counts.T @ w
+        kept = np.sort((-tfs).argsort()[:limit])
+        new_index = {old: new for new, old in enumerate(kept)}
+        vocabulary = {t: new_index[i] for t, i in vocabulary.items() if i in new_index}
+        counts = counts[:, kept]
+
+    df = ((counts > 0).T @ w).astype(np.float64)
+    df += 1.0
+    idf = np.full_like(df, fill_value=w.sum() + 1, dtype=np.float64)
+    idf /= df
+    np.log(idf, out=idf)
+    idf += 1.0
+
+    vec = TfidfVectorizer(**vec_kwargs)
+    vec.vocabulary_ = vocabulary
+    vec.idf_ = idf
+    return vec
+
+
+MODEL_KINDS = ('logreg', 'sgd')
+
+
+def _make_model(model: str = 'logreg'):
+    # class_weight='balanced' is applied through _fit_model's sample weights.
+    if model == 'sgd':
+        # Log-loss (logistic) SGD: supports partial_fit for scripts/update_models.py.
+        return SGDClassifier(loss='log_loss', alpha=1e-5, random_state=42)
+    return LogisticRegression(max_iter=1000, random_state=42)
+
+
+def _balanced_weights(y: pd.Series, weights: pd.Series) -> np.ndarray:
+    """Sample weights times class_weight='balanced', with classes sized by total weight rather than row count."""
+    totals = weights.groupby(y.to_numpy()).sum()
+    class_weight = totals.sum() / (len(totals) * totals)
+    return weights.to_numpy(dtype=np.float64) * y.map(class_weight).to_numpy(dtype=np.float64)
+
+
+def _sample_weights(y: pd.Series, weights: pd.Series, model: str) -> np.ndarray:
+    """_balanced_weights(), normalised to a mean of 1 for SGD."""
+    sample_weight = _balanced_weights(y, weights)
+    if model == 'sgd':
+        # SGD's step size scales with the sample weight, and collapsed rows can
+        # weigh thousands; normalise to a mean of 1 so no single step overshoots.
+        sample_weight = sample_weight / sample_weight.mean()
+    return sample_weight
+
+
+def _vectorize(X: pd.Series, weights: pd.Series, vec_kwargs: dict, cache=None):
+    """
+    _fit_vectorizer(X, weights, vec_kwargs) and its TF-IDF matrix for X, from
+    the cache when X, the weights, the settings and the code are unchanged.
+    Returns (vectorizer, matrix, key); key is None without a cache.
+    """
+    key = None
+    if cache:
+        key = _digest(X, weights, vec_kwargs, _source_digest(_fit_vectorizer), _LIB_VERSIONS)
+        vec = cache.load_object('tfidf', key)
+        matrix = cache.load_matrix('tfidf', key)
+        if vec is not None and matrix is not None:
+            return vec, matrix, key
+    vec = _fit_vectorizer(X, weights, vec_kwargs)
+    matrix = vec.transform(X)
+    if key:
+        cache.save_object('tfidf', key, vec)
+        cache.save_matrix('tfidf', key, matrix)
+    return vec, matrix, key
+
+
+def _fit_model(matrix, y: pd.Series, weights: pd.Series, model: str = 'logreg', cache=None, matrix_key=None,
+               init=None):
+    """
+    A model of the given kind fit on a _vectorize() matrix; cached when the
+    matrix came with a key. init, from _align_coefficients(), is a
+    (coef, intercept) pair the solver starts from instead of zero.
+    """
+    key = None
+    if cache and matrix_key:
+        key = _digest(matrix_key, y, weights, model, _make_model(model).get_params(),
+                      _source_digest(_fit_model, _make_model, _sample_weights, _balanced_weights), _LIB_VERSIONS,
+                      *(init or ()))
+        mdl = cache.load_object('model', key)
+        if mdl is not None:
+            return mdl
+    mdl = _make_model(model)
+    sample_weight = _sample_weights(y, weights, model)
+    if init is None:
+        mdl.fit(matrix, y, sample_weight=sample_weight)
+    elif model == 'sgd':
+        mdl.fit(matrix, y, coef_init=init[0], intercept_init=init[1], sample_weight=sample_weight)
+    else:
+        mdl.set_params(warm_start=True)
+        mdl.coef_, mdl.intercept_ = init
+        mdl.fit(matrix, y, sample_weight=sample_weight)
+        mdl.set_params(warm_start=False)
+    if key:
+        cache.save_object('model', key, mdl)
+    return mdl
+
+
+def _align_coefficients(previous, vectorizer, classes):
+    """
+    The coefficients of previous, a (model, vectorizer) pair, rearranged for
+    vectorizer's features and the given classes: (coef, intercept) in the
+    shape a fit on them produces, for _fit_model's init. Features and classes
+    the previous model did not know start at zero. None when no class or no
+    feature carries over.
+    """
+    old_model, old_vectorizer = previous
+    coef, intercept = old_model.coef_, old_model.intercept_
+    if coef.shape[0] == 1:
+        # Two classes are stored as one row scoring the second against the first.
+        coef, intercept = np.vstack([-coef / 2, coef / 2]), np.concatenate([-intercept / 2, intercept / 2])
+
+    old_rows = {c: i for i, c in enumerate(old_model.classes_)}
+    rows = [(i, old_rows[c]) for i, c in enumerate(classes) if c in old_rows]
+    old_vocabulary = old_vectorizer.vocabulary_
+    columns = [(j, old_vocabulary[t]) for t, j in vectorizer.vocabulary_.items() if t in old_vocabulary]
+    if not rows or not columns:
+        return None
 
+    new_rows, old_row_index = (np.array(a) for a in zip(*rows))
+    new_cols, old_cols = (np.array(a) for a in zip(*columns))
+    aligned_coef = np.zeros((len(classes), len(vectorizer.vocabulary_)))
+    aligned_coef[np.ix_(new_rows, new_cols)] = coef[np.ix_(old_row_index, old_cols)]
+    aligned_intercept = np.zeros(len(classes))
+    aligned_intercept[new_rows] = intercept[old_row_index]
+    if len(classes) == 2:
+        return aligned_coef[1:] - aligned_coef[:1], aligned_intercept[1:] - aligned_intercept[:1]
+    return aligned_coef, aligned_intercept
 
-def _make_model() -> LogisticRegression:
-    return LogisticRegression(class_weight='balanced', max_iter=1000, random_state=42)
+
+def _n_iter(mdl) -> int:
+    return int(np.max(mdl.n_iter_))
+
+
+def _fit_deployment(matrix, y: pd.Series, weights: pd.Series, vectorizer, model: str, cache, matrix_key,
+                    previous=None, compare_cold: bool = False):
+    """
+    The deployment fit, warm-started from previous (a (model, vectorizer)
+    pair) when given. Returns (model, note); the note reports the warm start,
+    and with compare_cold the iterations and time saved against a cold fit
+    (both fits then bypass the cache so the timings are real).
+    """
+    init = _align_coefficients(previous, vectorizer, np.unique(y.to_numpy())) if previous else None
+    if init is None:
+        return _fit_model(matrix, y, weights, model, cache, matrix_key), ''
+    if compare_cold:
+        cache = None
+    start = time.perf_counter()
+    mdl = _fit_model(matrix, y, weights, model, cache, matrix_key, init)
+    warm_seconds = time.perf_counter() - start
+    note = f'warm start: {_n_iter(mdl)} iterations, {warm_seconds:.2f}s'
+    if compare_cold:
+        start = time.perf_counter()
+        cold = _fit_model(matrix, y, weights, model)
+        cold_seconds = time.perf_counter() - start
+        note += (f' vs cold: {_n_iter(cold)} iterations, {cold_seconds:.2f}s'
+                 f' ({_n_iter(cold) - _n_iter(mdl)} iterations, {cold_seconds - warm_seconds:.2f}s saved)')
+    return mdl, note
+
+
+def _split(X, y, weights):
+    """80/20 evaluation split, stratified unless a class has too few rows for it."""
+    try:
+        return train_test_split(X, y, weights, test_size=0.20, random_state=42, stratify=y)
+    except ValueError:
+        return train_test_split(X, y, weights, test_size=0.20, random_state=42)
 
 # ---------------------------------------------------------------------------
 # Training
 # ---------------------------------------------------------------------------
 
-def train_primary_model(X: pd.Series, y: pd.Series):
-    """
-    Two-pass training:
-      Pass 1 — evaluation: vectorizer fit on train split only (honest accuracy metrics).
-      Pass 2 — deployment: vectorizer fit on ALL data (maximum vocabulary coverage).
-    Returns the deployment (all-data) model and vectorizer.
-    """
-    # Pass 1: evaluation
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.20, random_state=42, stratify=y
-    )
-    vec_eval = _make_vectorizer()
-    vec_eval.fit(X_train)
-    mdl_eval = _make_model()
-    mdl_eval.fit(vec_eval.transform(X_train), y_train)
+def _evaluate_primary(X: pd.Series, y: pd.Series, weights: pd.Series, model: str = 'logreg', cache=None) -> list:
+    """
+    Evaluation pass: vectorizer and model fit on an 80% split only, so the
+    held-out accuracy is honest (which is also why it is never warm-started
+    from a model that saw the held-out rows). Returns the log lines.
+
+    The split is over distinct rows (see collapse_duplicates()), so copies of
+    one name can no longer sit on both sides of it, and each held-out row
+    counts with its weight: accuracy and the report's support are in weighted
+    rows. Figures are therefore not comparable with runs from before rows were
+    collapsed, which split the copies and scored each one separately.
+    """
+    X_train, X_test, y_train, y_test, w_train, w_test = _split(X, y, weights)
+    vec_eval, matrix, key = _vectorize(X_train, w_train, PRIMARY_VEC_KWARGS, cache)
+    mdl_eval = _fit_model(matrix, y_train, w_train, model, cache, key)
     y_pred = mdl_eval.predict(vec_eval.transform(X_test))
-    acc = accuracy_score(y_test, y_pred)
-    print(f'\n  Evaluation accuracy (held-out 20%): {acc:.3f}')
-    print(classification_report(y_test, y_pred, zero_division=0))
+    acc = accuracy_score(y_test, y_pred, sample_weight=w_test)
+    return [f'\n  Evaluation accuracy (held-out 20%): {acc:.3f}',
+            classification_report(y_test, y_pred, sample_weight=w_test, zero_division=0)]
 
-    # Pass 2: deployment — fit vectorizer on all data
-    print('  Training deployment model on full dataset...')
-    vec_final = _make_vectorizer()
-    vec_final.fit(X)
-    mdl_final = _make_model()
-    mdl_final.fit(vec_final.transform(X), y)
 
-    return mdl_final, vec_final
+def _fit_primary(X: pd.Series, y: pd.Series, weights: pd.Series, model: str = 'logreg', cache=None,
+                 previous=None, compare_cold: bool = False):
+    """
+    Deployment pass: vectorizer fit on ALL data (maximum vocabulary coverage).
+    Returns (model, vectorizer, warm start note); see _fit_deployment().
+    """
+    vec_final, matrix, key = _vectorize(X, weights, PRIMARY_VEC_KWARGS, cache)
+    mdl, note = _fit_deployment(matrix, y, weights, vec_final, model, cache, key, previous, compare_cold)
+    return mdl, vec_final, note
 
 
-def train_sub_models(df: pd.DataFrame):
+def _train_sub_model(primary_cat: str, df_sub: pd.DataFrame, model: str = 'logreg', cache=None,
+                     previous=None, compare_cold: bool = False):
     """
-    Train one LogReg sub-classifier per primary category.
-    Uses the same two-pass approach: evaluation on a held-out split,
-    then deployment model fit on all data for that category.
+    One sub-classifier for a primary category, with the same two-pass
+    approach as the primary model; the deployment fit is warm-started from
+    previous like the primary's. Returns (key, model, vectorizer, log line);
+    key is None when the category is skipped.
     """
-    sub_models = {}
-    sub_vectorizers = {}
+    df_sub = df_sub[df_sub['newSubCat'].str.strip() != '']
+    n_samples = int(df_sub['weight'].sum())
 
-    for primary_cat in sorted(df['newCat'].unique()):
-        df_sub = df[df['newCat'] == primary_cat].copy()
-        df_sub = df_sub[df_sub['newSubCat'].str.strip() != '']
+    if n_samples < 10:
+        return None, None, None, f"  Skipping '{primary_cat}': only {n_samples} samples"
+    if df_sub['newSubCat'].nunique() < 2:
+        return None, None, None, f"  Skipping '{primary_cat}': only one sub-category"
 
-        if len(df_sub) < 10:
-            print(f"  Skipping '{primary_cat}': only {len(df_sub)} samples")
-            continue
-        if df_sub['newSubCat'].nunique() < 2:
-            print(f"  Skipping '{primary_cat}': only one sub-category")
-            continue
+    X = df_sub['generic_product_name']
+    y = df_sub['newSubCat']
+    w = df_sub['weight']
 
-        X = df_sub['generic_product_name']
-        y = df_sub['newSubCat']
+    # Evaluation split
+    X_train, X_test, y_train, y_test, w_train, w_test = _split(X, y, w)
+    vec_eval, matrix, key = _vectorize(X_train, w_train, SUB_VEC_KWARGS, cache)
+    mdl_eval = _fit_model(matrix, y_train, w_train, model, cache, key)
+    acc = accuracy_score(y_test, mdl_eval.predict(vec_eval.transform(X_test)), sample_weight=w_test)
 
-        # Evaluation split
-        try:
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.20, random_state=42, stratify=y
-            )
-        except ValueError:
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.20, random_state=42
-            )
+    # Deployment: fit on all data for this category
+    vec_final, matrix, key = _vectorize(X, w, SUB_VEC_KWARGS, cache)
+    mdl_final, note = _fit_deployment(matrix, y, w, vec_final, model, cache, key, previous, compare_cold)
 
-        # Sub-models have far less data than the primary — use smaller feature count
-        # to avoid over-fitting the vocabulary to training samples.
-        sub_vec_kwargs = dict(stop_words='english', max_features=5_000,
-                              ngram_range=(1, 2), sublinear_tf=True)
+    return (sanitize_filename(primary_cat), mdl_final, vec_final,
+            f"  '{primary_cat}' — {n_samples:,} samples, {y.nunique()} sub-cats, eval acc={acc:.3f}"
+            + (f'; {note}' if note else ''))
 
-        vec_eval = TfidfVectorizer(**sub_vec_kwargs)
-        vec_eval.fit(X_train)
-        mdl_eval = _make_model()
-        mdl_eval.fit(vec_eval.transform(X_train), y_train)
-        acc = accuracy_score(y_test, mdl_eval.predict(vec_eval.transform(X_test)))
 
-        print(f"  '{primary_cat}' — {len(df_sub):,} samples, "
-              f"{y.nunique()} sub-cats, eval acc={acc:.3f}")
+def train_models(df: pd.DataFrame, n_jobs: int = 1, cache=None, model: str = 'logreg', previous=None,
+                 compare_cold: bool = False):
+    """
+    Train the primary model (evaluation and deployment passes) and one
+    sub-model per primary category. All of these fits are independent, so
+    they run as one batch of tasks on n_jobs worker processes: the two primary
+    passes (the largest fits) first, then the sub-models in category order.
+    Results, and their log lines, are consumed in submission order, so the
+    output reads as it did sequentially and does not depend on n_jobs.
+    previous, from load_previous_models(), warm-starts the deployment fits.
+    Returns (primary_model, primary_vectorizer, sub_models, sub_vectorizers).
+    """
+    previous_primary, previous_subs = previous or (None, {})
+    X, y, w = df['generic_product_name'], df['newCat'], df['weight']
+    tasks = [delayed(_evaluate_primary)(X, y, w, model, cache),
+             delayed(_fit_primary)(X, y, w, model, cache, previous_primary, compare_cold)]
+    tasks += [delayed(_train_sub_model)(cat, df[df['newCat'] == cat], model, cache,
+                                        previous_subs.get(sanitize_filename(cat)), compare_cold)
+              for cat in sorted(df['newCat'].unique())]
+    results = Parallel(n_jobs=n_jobs, return_as='generator')(tasks)
 
-        # Deployment: fit on all data for this category
-        vec_final = TfidfVectorizer(**sub_vec_kwargs)
-        vec_final.fit(X)
-        mdl_final = _make_model()
-        mdl_final.fit(vec_final.transform(X), y)
+    print('\n=== Training primary model ===')
+    for line in next(results):
+        print(line)
+    print('  Training deployment model on full dataset...')
+    primary_model, primary_vectorizer, note = next(results)
+    if note:
+        print(f'  {note}')
 
-        key = sanitize_filename(primary_cat)
-        sub_models[key] = mdl_final
-        sub_vectorizers[key] = vec_final
+    print('\n=== Training sub-category models ===')
+    sub_models = {}
+    sub_vectorizers = {}
+    for key, mdl, vec, log in results:
+        print(log)
+        if key is not None:
+            sub_models[key] = mdl
+            sub_vectorizers[key] = vec
 
-    return sub_models, sub_vectorizers
+    return primary_model, primary_vectorizer, sub_models, sub_vectorizers
 
 
 def sanitize_filename(name: str) -> str:
     name = re.sub(r'[^\w\-]+', '_', name)
     return name.strip('_')
 
+# ---------------------------------------------------------------------------
+# Model files and versions
+# ---------------------------------------------------------------------------
+
+def new_version_name(kind: str) -> str:
+    """A version name that sorts chronologically, e.g. 20250501T100000Z-full."""
+    return f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{kind}"
+
+
+def save_models(directory: str, primary_model, primary_vectorizer, sub_models: dict, sub_vectorizers: dict,
+                manifest: dict) -> None:
+    """Write a model set in the layout the classification app loads, plus its manifest."""
+    sub_dir = os.path.join(directory, SUB_MODELS_SUBDIR)
+    os.makedirs(sub_dir, exist_ok=True)
+    joblib.dump(primary_model, os.path.join(directory, PRIMARY_MODEL_FILE))
+    joblib.dump(primary_vectorizer, os.path.join(directory, PRIMARY_VECTORIZER_FILE))
+    for key, mdl in sub_models.items():
+        joblib.dump(mdl, os.path.join(sub_dir, f'model_sub_{key}.joblib'))
+        joblib.dump(sub_vectorizers[key], os.path.join(sub_dir, f'vectorizer_sub_{key}.joblib'))
+    with open(os.path.join(directory, VERSION_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_models(directory: str):
+    """(primary_model, primary_vectorizer, sub_models, sub_vectorizers, manifest) saved by save_models()."""
+    primary_model = joblib.load(os.path.join(directory, PRIMARY_MODEL_FILE))
+    primary_vectorizer = joblib.load(os.path.join(directory, PRIMARY_VECTORIZER_FILE))
+    sub_models, sub_vectorizers = {}, {}
+    sub_dir = os.path.join(directory, SUB_MODELS_SUBDIR)
+    for filename in sorted(os.listdir(sub_dir)) if os.path.isdir(sub_dir) else []:
+        kind, _, key = filename.removesuffix('.joblib').partition('_sub_')
+        if kind == 'model':
+            sub_models[key] = joblib.load(os.path.join(sub_dir, filename))
+        elif kind == 'vectorizer':
+            sub_vectorizers[key] = joblib.load(os.path.join(sub_dir, filename))
+    manifest_path = os.path.join(directory, VERSION_MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    return primary_model, primary_vectorizer, sub_models, sub_vectorizers, manifest
+
+
+def load_previous_models(path: str):
+    """
+    The models to warm-start from: the live version when path is a --publish
+    directory, otherwise the model files in path. Returns
+    ((primary_model, primary_vectorizer), {sub-model key: (model, vectorizer)}).
+    """
+    version = current_version(path)
+    primary_model, primary_vectorizer, sub_models, sub_vectorizers, _ = load_models(
+        version_dir(path, version) if version else path)
+    return ((primary_model, primary_vectorizer),
+            {key: (mdl, sub_vectorizers[key]) for key, mdl in sub_models.items() if key in sub_vectorizers})
+
+
+def current_version(model_dir: str):
+    """The name of the live published version in model_dir, or None."""
+    try:
+        with open(os.path.join(model_dir, CURRENT_VERSION_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_dir(model_dir: str, version: str) -> str:
+    return os.path.join(model_dir, VERSIONS_SUBDIR, version)
+
+
+def publish_version(model_dir: str, primary_model, primary_vectorizer, sub_models: dict, sub_vectorizers: dict,
+                    manifest: dict, keep: int = 5) -> str:
+    """
+    Save a model set as manifest['version'] (made unique if already taken) and
+    make it the live version.
+    The files are complete before CURRENT is switched (atomically), so a worker
+    never loads a half-written version. Only the newest keep versions are kept.
+    Returns the version's directory.
+    """
+    version = manifest['version']
+    suffix = 1
+    while os.path.exists(version_dir(model_dir, version)):
+        suffix += 1
+        version = f"{manifest['version']}.{suffix}"
+    manifest['version'] = version
+    directory = version_dir(model_dir, version)
+    tmp_dir = f'{directory}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    save_models(tmp_dir, primary_model, primary_vectorizer, sub_models, sub_vectorizers, manifest)
+    os.replace(tmp_dir, directory)
+
+    tmp_current = os.path.join(model_dir, f'{CURRENT_VERSION_FILE}.tmp')
+    with open(tmp_current, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(tmp_current, os.path.join(model_dir, CURRENT_VERSION_FILE))
+
+    versions = sorted(v for v in os.listdir(os.path.join(model_dir, VERSIONS_SUBDIR)) if not v.endswith('.tmp'))
+    for old in versions[:-keep] if keep > 0 else []:
+        if old != version:
+            shutil.rmtree(version_dir(model_dir, old), ignore_errors=True)
+    return directory
+
+# ---------------------------------------------------------------------------
+# Model selection sweep
+# ---------------------------------------------------------------------------
+
+def _sweep_candidate(X: pd.Series, y: pd.Series, weights: pd.Series, vec_kwargs: dict, model: str,
+                     directory: str, cache=None) -> float:
+    """
+    Fit one primary model configuration on the evaluation split and save it to
+    directory as the app would load it. Returns its held-out accuracy.
+    """
+    X_train, X_test, y_train, y_test, w_train, w_test = _split(X, y, weights)
+    vec, matrix, key = _vectorize(X_train, w_train, vec_kwargs, cache)
+    mdl = _fit_model(matrix, y_train, w_train, model, cache, key)
+    acc = accuracy_score(y_test, mdl.predict(vec.transform(X_test)), sample_weight=w_test)
+    os.makedirs(directory, exist_ok=True)
+    joblib.dump(mdl, os.path.join(directory, PRIMARY_MODEL_FILE))
+    joblib.dump(vec, os.path.join(directory, PRIMARY_VECTORIZER_FILE))
+    return acc
+
+
+def _rss_mb() -> float:
+    """Resident memory of this process; the peak where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        import resource  # Unix only, and only needed for --sweep
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _measure_serving(directory: str, names: list, warmup: int = 50) -> dict:
+    """
+    Load the model in directory and classify names one at a time the way
+    /predict does (clean_text, transform, predict_proba). Meant to run in a
+    fresh process, so the memory figures are the model's own.
+    """
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    vec = joblib.load(os.path.join(directory, PRIMARY_VECTORIZER_FILE))
+    mdl = joblib.load(os.path.join(directory, PRIMARY_MODEL_FILE))
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for name in names:
+        start = time.perf_counter()
+        mdl.predict_proba(vec.transform([clean_text(name)]))
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies[warmup:] if len(latencies) > warmup else latencies) * 1000
+    return {
+        'load_s': load_seconds,
+        'rss_mb': _rss_mb() - rss_before,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def _pareto_front(rows: list) -> set:
+    """Indices of the rows no other row beats on both accuracy and p99 latency."""
+    return {
+        i for i, row in enumerate(rows)
+        if not any(other['accuracy'] >= row['accuracy'] and other['p99_ms'] <= row['p99_ms']
+                   and (other['accuracy'] > row['accuracy'] or other['p99_ms'] < row['p99_ms'])
+                   for other in rows)
+    }
+
+
+def sweep(df: pd.DataFrame, max_features: list, ngram_max: list, models: list, n_jobs: int = 1, cache=None,
+          samples: int = 1000, latency_slo_ms: float = None) -> list:
+    """
+    Train every combination of primary max_features, n-gram range and model
+    kind on the evaluation split, in parallel on n_jobs processes, then measure
+    each one's serving cost one at a time, each in a fresh process so they
+    neither share memory nor compete for CPU. Prints a table of held-out
+    accuracy, artifact size, load time, memory added by loading, and
+    single-item p50/p99 latency over up to samples held-out names, marking the
+    accuracy / p99 Pareto front and the most accurate candidate within
+    latency_slo_ms. Returns the table rows.
+
+    Only the primary model is swept. Sub-models keep SUB_VEC_KWARGS, and the
+    serving figures leave out the sub-model a /predict also runs, so they
+    understate its end-to-end cost.
+    """
+    X, y, w = df['generic_product_name'], df['newCat'], df['weight']
+    candidates = [
+        (model, dict(PRIMARY_VEC_KWARGS, max_features=features, ngram_range=(1, n)))
+        for model in models for features in max_features for n in ngram_max
+    ]
+    names = _split(X, y, w)[1].tolist()[:samples]
+    print(f'\n=== Sweeping {len(candidates)} primary model configurations ===')
+
+    with tempfile.TemporaryDirectory(prefix='nimblist-sweep-') as tmp:
+        directories = [os.path.join(tmp, str(i)) for i in range(len(candidates))]
+        accuracies = Parallel(n_jobs=n_jobs)(
+            delayed(_sweep_candidate)(X, y, w, vec_kwargs, model, directory, cache)
+            for (model, vec_kwargs), directory in zip(candidates, directories))
+
+        rows = []
+        spawn = multiprocessing.get_context('spawn')
+        for (model, vec_kwargs), directory, acc in zip(candidates, directories, accuracies):
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                serving = pool.submit(_measure_serving, directory, names).result()
+            size = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))
+            rows.append(dict(
+                model=model, max_features=vec_kwargs['max_features'], ngram_range=vec_kwargs['ngram_range'],
+                current=(model == 'logreg' and vec_kwargs == PRIMARY_VEC_KWARGS),
+                accuracy=acc, size_mb=size / (1024 * 1024), **serving))
+
+    front = _pareto_front(rows)
+    within_slo = [row for row in rows if latency_slo_ms is None or row['p99_ms'] <= latency_slo_ms]
+    best = max(within_slo, key=lambda row: (row['accuracy'], -row['p99_ms'])) if within_slo else None
+
+    print(f"\n{'model':<7} {'features':>8} {'ngrams':>6} {'acc':>6} {'size MB':>8} {'load s':>7} "
+          f"{'RSS MB':>7} {'p50 ms':>7} {'p99 ms':>7}  pareto")
+    for i, row in sorted(enumerate(rows), key=lambda item: item[1]['p99_ms']):
+        flags = ['*' if i in front else ' ']
+        if row is best:
+            flags.append('best within SLO' if latency_slo_ms is not None else 'most accurate')
+        if row['current']:
+            flags.append('(current)')
+        print(f"{row['model']:<7} {row['max_features']:>8,} {'1-%d' % row['ngram_range'][1]:>6} "
+              f"{row['accuracy']:>6.3f} {row['size_mb']:>8.2f} {row['load_s']:>7.3f} {row['rss_mb']:>7.1f} "
+              f"{row['p50_ms']:>7.3f} {row['p99_ms']:>7.3f}  {' '.join(flags)}")
+    print(f'\n* = Pareto-optimal on held-out accuracy and p99 latency ({len(names):,} single-item requests each).')
+    print(f"Sub-models are not swept (they keep max_features={SUB_VEC_KWARGS['max_features']:,}); "
+          'the figures exclude them.')
+    if latency_slo_ms is not None and best is None:
+        print(f'No configuration meets a p99 of {latency_slo_ms} ms.')
+    return rows
+
+
+def _int_list(value: str) -> list:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Retrain Nimblist classification models')
     parser.add_argument('--training-data', default=DEFAULT_TRAINING_CSV,
                         help=f'Path to combined_cleaned.csv (default: {DEFAULT_TRAINING_CSV})')
     parser.add_argument('--feedback', default=None,
                         help='Path to JSONL feedback file from GET /api/classificationfeedback/export')
     parser.add_argument('--feedback-repeat', type=int, default=5,
-                        help='How many times to repeat each feedback row (default: 5)')
+                        help='Weight of each feedback row, as if repeated this many times (default: 5)')
     parser.add_argument('--no-augmentation', action='store_true',
                         help='Disable left-truncation data augmentation')
     parser.add_argument('--augmentation-drop', type=int, default=2,
                         help='Max words to drop from the left per name (default: 2)')
     parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR,
                         help=f'Where to save model files (default: {DEFAULT_OUTPUT_DIR})')
-    args = parser.parse_args()
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help='Worker processes for preprocessing and model training; -1 = all cores (default: -1)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Where to cache intermediate artifacts (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Recompute every stage and leave the cache untouched')
+    parser.add_argument('--model', choices=MODEL_KINDS, default='logreg',
+                        help='logreg (default) or sgd, which scripts/update_models.py can update incrementally')
+    parser.add_argument('--publish', action='store_true',
+                        help='Save as a new model version under OUTPUT_DIR/versions and make it live, '
+                             'instead of overwriting the model files in OUTPUT_DIR')
+    parser.add_argument('--keep-versions', type=int, default=5,
+                        help='With --publish, how many model versions to keep (default: 5)')
+    parser.add_argument('--warm-start-from', default=None,
+                        help='Model directory (or --publish directory) whose models start the deployment fits')
+    parser.add_argument('--compare-cold', action='store_true',
+                        help='With --warm-start-from, also fit each deployment model cold and report the savings')
+    parser.add_argument('--sweep', action='store_true',
+                        help='Compare primary model configurations on accuracy and serving cost instead of '
+                             f"training; sub-models are not swept and keep max_features="
+                             f"{SUB_VEC_KWARGS['max_features']:,}")
+    parser.add_argument('--sweep-max-features', type=_int_list, default=[5_000, 10_000, 15_000, 30_000],
+                        help='Comma-separated primary max_features values to sweep (default: 5000,10000,15000,30000)')
+    parser.add_argument('--sweep-ngram-max', type=_int_list, default=[1, 2],
+                        help='Comma-separated largest n-gram sizes to sweep (default: 1,2)')
+    parser.add_argument('--sweep-models', type=lambda v: v.split(','), default=['logreg'],
+                        help=f'Comma-separated model kinds to sweep, from {", ".join(MODEL_KINDS)} (default: logreg)')
+    parser.add_argument('--sweep-samples', type=int, default=1000,
+                        help='Held-out names timed one at a time per configuration (default: 1000)')
+    parser.add_argument('--latency-slo-ms', type=float, default=None,
+                        help='With --sweep, pick the most accurate configuration whose p99 is within this')
+    args = parser.parse_args(argv)
+    unknown_models = set(args.sweep_models) - set(MODEL_KINDS)
+    if unknown_models:
+        parser.error(f'--sweep-models: unknown model kinds {sorted(unknown_models)}')
 
     # ------------------------------------------------------------------
     # Load and merge data
@@ -300,75 +1046,90 @@ def main():
         print('Ensure combined_cleaned.csv is in scripts/ClassificationModel/')
         sys.exit(1)
 
-    df = load_base_training_data(args.training_data)
+    cache = None if args.no_cache else ArtifactCache(args.cache_dir)
+    previous = None
+    if args.warm_start_from:
+        try:
+            previous = load_previous_models(args.warm_start_from)
+        except (OSError, ValueError) as e:
+            print(f'ERROR: Could not load models to warm-start from in {args.warm_start_from}: {e}')
+            sys.exit(1)
+        print(f'Warm-starting from the models in {args.warm_start_from} ({len(previous[1])} sub-models)')
+    max_drop = 0 if args.no_augmentation else args.augmentation_drop
+
+    # clean_text is applied to all names before augmentation so variants are
+    # generated from already-normalised text.
+    sources = [prepare_source(args.training_data, load_base_training_data, 1, max_drop, args.n_jobs, cache)]
 
+    feedback_until = None
     if args.feedback:
         if not os.path.exists(args.feedback):
             print(f'ERROR: Feedback file not found at {args.feedback}')
             sys.exit(1)
         print(f'Loading feedback from: {args.feedback}')
-        fb = load_feedback(args.feedback)
-        if len(fb) > 0:
-            repeated = pd.concat([fb] * args.feedback_repeat, ignore_index=True)
-            df = pd.concat([df, repeated], ignore_index=True)
-            print(f'  Dataset after merging feedback ({args.feedback_repeat}x): {len(df):,} rows')
+        feedback_until = feedback_watermark(args.feedback)
+        fb = prepare_source(args.feedback, load_feedback, args.feedback_repeat, max_drop, args.n_jobs, cache)
+        if len(fb[0]) > 0:
+            sources.append(fb)
+            print(f'  Merging {len(fb[0]):,} feedback rows (weighted {args.feedback_repeat}x)')
         else:
             print('  No usable feedback; training on base data only.')
     else:
         print('No feedback file provided; training on base data only.')
 
-    # ------------------------------------------------------------------
-    # Preprocess: apply clean_text to all names up front so augmented
-    # variants are generated from already-normalised text.
-    # ------------------------------------------------------------------
-    print('\nApplying text preprocessing...')
-    df['generic_product_name'] = df['generic_product_name'].apply(clean_text)
-    # Drop any rows whose name reduced to empty string after preprocessing
-    df = df[df['generic_product_name'].str.strip() != ''].reset_index(drop=True)
-    print(f'  {len(df):,} rows after preprocessing')
+    df = pd.concat([cleaned for cleaned, _ in sources], ignore_index=True)
+    print(f'\n{len(df):,} rows after preprocessing')
 
-    # ------------------------------------------------------------------
-    # Augmentation
-    # ------------------------------------------------------------------
-    if not args.no_augmentation:
-        print(f'\nAugmenting training data (max_drop={args.augmentation_drop})...')
-        aug = augment_training_data(df, max_drop=args.augmentation_drop)
-        df = pd.concat([df, aug], ignore_index=True)
+    if max_drop:
+        print(f'\nAugmenting training data (max_drop={max_drop})...')
+        df = pd.concat([df] + [augmented for _, augmented in sources], ignore_index=True)
         print(f'  {len(df):,} rows after augmentation')
     else:
         print('\nAugmentation disabled.')
 
-    print(f'\nFinal training set: {len(df):,} rows')
+    df = collapse_duplicates(df)
+    print(f'\nFinal training set: {len(df):,} distinct rows, {df["weight"].sum():,} weighted samples')
     print(f'Primary categories: {sorted(df["newCat"].unique())}')
 
+    if args.sweep:
+        sweep(df, args.sweep_max_features, args.sweep_ngram_max, args.sweep_models, n_jobs=args.n_jobs,
+              cache=cache, samples=args.sweep_samples, latency_slo_ms=args.latency_slo_ms)
+        return
+
     # ------------------------------------------------------------------
     # Train
     # ------------------------------------------------------------------
-    print('\n=== Training primary model ===')
-    primary_model, primary_vectorizer = train_primary_model(
-        df['generic_product_name'], df['newCat']
-    )
-
-    print('\n=== Training sub-category models ===')
-    sub_models, sub_vectorizers = train_sub_models(df)
+    primary_model, primary_vectorizer, sub_models, sub_vectorizers = train_models(
+        df, n_jobs=args.n_jobs, cache=cache, model=args.model, previous=previous, compare_cold=args.compare_cold)
 
     # ------------------------------------------------------------------
     # Save
     # ------------------------------------------------------------------
-    sub_dir = os.path.join(args.output_dir, SUB_MODELS_SUBDIR)
-    os.makedirs(sub_dir, exist_ok=True)
+    now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    manifest = {
+        'version': new_version_name('full'),
+        'kind': 'full',
+        'model': args.model,
+        'created_at': now,
+        'full_trained_at': now,
+        'parent': None,
+        'online_updates': 0,
+        'feedback_until': feedback_until,
+        'training_samples': int(df['weight'].sum()),
+    }
+    models = (primary_model, primary_vectorizer, sub_models, sub_vectorizers)
 
-    primary_model_path = os.path.join(args.output_dir, 'supermarket_classifier_logreg.joblib')
-    primary_vec_path = os.path.join(args.output_dir, 'tfidf_vectorizer_logreg.joblib')
-    print(f'\nSaving primary model     -> {primary_model_path}')
-    joblib.dump(primary_model, primary_model_path)
-    print(f'Saving primary vectorizer -> {primary_vec_path}')
-    joblib.dump(primary_vectorizer, primary_vec_path)
+    if args.publish:
+        directory = publish_version(args.output_dir, *models, manifest, keep=args.keep_versions)
+        print(f"\nPublished model version {manifest['version']} -> {directory}")
+        print('Classification workers using this directory as MODEL_DIR load it within MODEL_RELOAD_SECONDS.')
+        return
 
-    for key, mdl in sub_models.items():
-        joblib.dump(mdl, os.path.join(sub_dir, f'model_sub_{key}.joblib'))
-        joblib.dump(sub_vectorizers[key], os.path.join(sub_dir, f'vectorizer_sub_{key}.joblib'))
-    print(f'Saved {len(sub_models)} sub-models -> {sub_dir}')
+    primary_model_path = os.path.join(args.output_dir, PRIMARY_MODEL_FILE)
+    print(f'\nSaving primary model, vectorizer and {len(sub_models)} sub-models -> {args.output_dir}')
+    save_models(args.output_dir, *models, manifest)
+    print(f'  {primary_model_path}')
+    print(f'  {os.path.join(args.output_dir, SUB_MODELS_SUBDIR)}')
 
     print('\nDone. Restart the classification container to load the new models:')
     print('  docker compose restart Nimblist.classification')
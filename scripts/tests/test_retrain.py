@@ -0,0 +1,132 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import retrain
+
+_NAMES = pd.Series([
+    'whole milk', 'semi skimmed milk', 'free range eggs', 'large free range eggs', 'cheddar cheese',
+    'mature cheddar cheese', 'white bread', 'wholemeal bread', 'smoked salmon', 'salmon fillets',
+    'greek yoghurt', 'natural yoghurt', 'chopped tomatoes', 'cherry tomatoes', 'tomato puree',
+])
+_WEIGHTS = pd.Series([1, 5, 1, 2, 1, 1, 3, 1, 7, 1, 1, 4, 1, 1, 2])
+
+
+class TestFitVectorizer(unittest.TestCase):
+    """_fit_vectorizer on weighted distinct rows must match TfidfVectorizer fitted on the repeated rows."""
+
+    def assertMatchesRepeatedFit(self, vec_kwargs):
+        ours = retrain._fit_vectorizer(_NAMES, _WEIGHTS, vec_kwargs)
+        reference = TfidfVectorizer(**vec_kwargs).fit(_NAMES.repeat(_WEIGHTS))
+        self.assertEqual(ours.vocabulary_, reference.vocabulary_)
+        np.testing.assert_allclose(ours.idf_, reference.idf_)
+        np.testing.assert_allclose(ours.transform(_NAMES).toarray(), reference.transform(_NAMES).toarray())
+        return ours
+
+    def test_primary_settings(self):
+        self.assertMatchesRepeatedFit(retrain.PRIMARY_VEC_KWARGS)
+
+    def test_sub_model_settings(self):
+        self.assertMatchesRepeatedFit(retrain.SUB_VEC_KWARGS)
+
+    def test_max_features_cut_uses_weighted_counts(self):
+        kwargs = {**retrain.PRIMARY_VEC_KWARGS, 'max_features': 6}
+        ours = self.assertMatchesRepeatedFit(kwargs)
+        self.assertEqual(len(ours.vocabulary_), 6)
+        unweighted = TfidfVectorizer(**kwargs).fit(_NAMES)
+        self.assertNotEqual(set(ours.vocabulary_), set(unweighted.vocabulary_))
+
+    def test_unit_weights_match_a_plain_fit(self):
+        ours = retrain._fit_vectorizer(_NAMES, pd.Series(1, index=_NAMES.index), retrain.SUB_VEC_KWARGS)
+        reference = TfidfVectorizer(**retrain.SUB_VEC_KWARGS).fit(_NAMES)
+        self.assertEqual(ours.vocabulary_, reference.vocabulary_)
+        np.testing.assert_allclose(ours.idf_, reference.idf_)
+
+
+class TestArtifactCache(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = retrain.ArtifactCache(tmp.name)
+
+    def assertRoundTrips(self, df):
+        self.cache.save_frame('cleaned', 'key', df)
+        loaded = self.cache.load_frame('cleaned', 'key')
+        self.assertEqual(dict(loaded.dtypes), dict(df.dtypes))
+        pd.testing.assert_frame_equal(loaded, df)
+
+    def test_frame_keeps_its_dtypes(self):
+        self.assertRoundTrips(pd.DataFrame({
+            'generic_product_name': pd.Series(['whole milk', 'eggs'], dtype=object),
+            'newCat': pd.Series(['Dairy', 'Dairy'], dtype='string'),
+            'weight': np.array([5, 1], dtype=np.int32),
+            'score': [0.5, 1.0],
+        }))
+
+    def test_empty_frame_keeps_its_dtypes(self):
+        df = pd.DataFrame({'generic_product_name': pd.Series([], dtype=object),
+                           'weight': np.array([], dtype=np.int64)})
+        self.assertRoundTrips(df)
+
+    def test_miss_returns_none(self):
+        self.assertIsNone(self.cache.load_frame('cleaned', 'missing'))
+
+
+class TestFeedbackTimestamps(unittest.TestCase):
+    """recorded_at as .NET's DateTimeOffset exports it, which fromisoformat rejects before Python 3.11."""
+
+    def _write_feedback(self, *recorded_at):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'feedback.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i, value in enumerate(recorded_at):
+                f.write(json.dumps({'item_name': f'item {i}', 'category': 'Dairy', 'sub_category': 'Milk',
+                                    'recorded_at': value}) + '\n')
+        return path
+
+    def test_parses_dotnet_timestamps(self):
+        cases = {
+            '2026-01-02T10:00:00.1234567+00:00': datetime(2026, 1, 2, 10, 0, 0, 123456, tzinfo=timezone.utc),
+            '2026-01-02T10:00:00.12345+00:00': datetime(2026, 1, 2, 10, 0, 0, 123450, tzinfo=timezone.utc),
+            '2026-01-02T10:00:00Z': datetime(2026, 1, 2, 10, 0, tzinfo=timezone.utc),
+            '2026-01-02T10:00:00.1234567Z': datetime(2026, 1, 2, 10, 0, 0, 123456, tzinfo=timezone.utc),
+            '2026-01-02T11:00:00+01:00': datetime(2026, 1, 2, 10, 0, tzinfo=timezone.utc),
+            '2026-01-02T10:00:00': datetime(2026, 1, 2, 10, 0, tzinfo=timezone.utc),
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(retrain._parse_time(value), expected)
+
+    def test_rejects_other_text(self):
+        with self.assertRaises(ValueError):
+            retrain._parse_time('last tuesday')
+
+    def test_watermark_is_the_latest_readable_timestamp_as_written(self):
+        path = self._write_feedback('2026-01-02T10:00:00.1234567+00:00', '2026-01-03T09:00:00Z', 'not a time',
+                                    '2026-01-01T10:00:00.12345+00:00')
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(retrain.feedback_watermark(path), '2026-01-03T09:00:00Z')
+
+    def test_since_filter_reads_dotnet_timestamps_and_skips_unreadable_ones(self):
+        path = self._write_feedback('2026-01-02T10:00:00.1234567+00:00', '2026-01-03T09:00:00Z', 'not a time')
+        with contextlib.redirect_stdout(io.StringIO()):
+            everything = retrain.load_feedback(path)
+            newer = retrain.load_feedback(path, since='2026-01-02T10:00:00.1234567Z')
+        self.assertEqual(len(everything), 3)
+        self.assertEqual(newer['generic_product_name'].tolist(), ['item 1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
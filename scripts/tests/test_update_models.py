@@ -0,0 +1,185 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import retrain
+import update_models
+
+_PRODUCTS = {
+    ('Dairy', 'Milk'): ['whole milk', 'semi skimmed milk', 'skimmed milk', 'oat milk drink', 'goat milk'],
+    ('Dairy', 'Cheese'): ['mature cheddar', 'mild cheddar', 'red leicester', 'brie wedge', 'goat cheese log'],
+    ('Bakery', 'Bread'): ['white loaf', 'wholemeal loaf', 'seeded batch loaf', 'sourdough loaf', 'rye bread'],
+    ('Bakery', 'Cakes'): ['victoria sponge', 'carrot cake', 'lemon drizzle cake', 'chocolate cake', 'fruit cake'],
+}
+
+
+def _feedback_line(name, category, sub_category, recorded_at):
+    return json.dumps({'item_name': name, 'category': category, 'sub_category': sub_category,
+                       'recorded_at': recorded_at}) + '\n'
+
+
+class TestModelVersions(unittest.TestCase):
+    """retrain.py --publish, then update_models.py on the feedback recorded since."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.model_dir = os.path.join(tmp.name, 'models')
+        self.training_data = os.path.join(tmp.name, 'training.csv')
+        self.feedback = os.path.join(tmp.name, 'feedback.jsonl')
+        rows = [(f'{prefix} {name}', cat, sub) for (cat, sub), names in _PRODUCTS.items()
+                for name in names for prefix in ('tesco', 'asda', 'finest')]
+        pd.DataFrame(rows, columns=['generic_product_name', 'newCat', 'newSubCat']).to_csv(
+            self.training_data, index=False)
+        with open(self.feedback, 'w', encoding='utf-8') as f:
+            f.write(_feedback_line('oat milk', 'Dairy', 'Milk', '2026-01-01T10:00:00+00:00'))
+            f.write(_feedback_line('farmhouse loaf', 'Bakery', 'Bread', '2026-01-02T10:00:00+00:00'))
+
+    def _quietly(self, main, argv):
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(argv)
+
+    def _publish(self):
+        self._quietly(retrain.main, ['--training-data', self.training_data, '--feedback', self.feedback,
+                                     '--model', 'sgd', '--publish', '--output-dir', self.model_dir,
+                                     '--no-cache', '--n-jobs', '1'])
+        return retrain.current_version(self.model_dir)
+
+    def _update(self, *extra):
+        self._quietly(update_models.main, ['--feedback', self.feedback, '--model-dir', self.model_dir,
+                                           '--n-jobs', '1', *extra])
+        return retrain.current_version(self.model_dir)
+
+    def _manifest(self, version):
+        return retrain.load_models(retrain.version_dir(self.model_dir, version))[4]
+
+    def test_publish_makes_a_loadable_current_version(self):
+        self.assertIsNone(retrain.current_version(self.model_dir))
+        version = self._publish()
+        self.assertTrue(version.endswith('-full'))
+        primary, vectorizer, sub_models, sub_vectorizers, manifest = retrain.load_models(
+            retrain.version_dir(self.model_dir, version))
+        self.assertEqual(sorted(primary.classes_), ['Bakery', 'Dairy'])
+        self.assertEqual(sorted(sub_models), ['Bakery', 'Dairy'])
+        self.assertEqual(sorted(sub_vectorizers), ['Bakery', 'Dairy'])
+        self.assertEqual(primary.predict(vectorizer.transform(['white loaf']))[0], 'Bakery')
+        self.assertEqual(manifest['version'], version)
+        self.assertEqual(manifest['kind'], 'full')
+        self.assertEqual(manifest['feedback_until'], '2026-01-02T10:00:00+00:00')
+
+    def test_update_publishes_a_child_version_and_moves_the_watermark(self):
+        parent = self._publish()
+        before = retrain.load_models(retrain.version_dir(self.model_dir, parent))[0].coef_.copy()
+        with open(self.feedback, 'a', encoding='utf-8') as f:
+            f.write(_feedback_line('brioche loaf', 'Bakery', 'Bread', '2026-01-03T10:00:00+00:00'))
+            f.write(_feedback_line('oat milk barista', 'Dairy', 'Milk', '2026-01-04T10:00:00+00:00'))
+
+        version = self._update()
+        self.assertNotEqual(version, parent)
+        self.assertTrue(version.endswith('-online'))
+        manifest = self._manifest(version)
+        self.assertEqual((manifest['kind'], manifest['parent'], manifest['online_updates']), ('online', parent, 1))
+        self.assertEqual(manifest['feedback_until'], '2026-01-04T10:00:00+00:00')
+        self.assertEqual(manifest['full_trained_at'], self._manifest(parent)['full_trained_at'])
+        after = retrain.load_models(retrain.version_dir(self.model_dir, version))[0].coef_
+        self.assertFalse(np.allclose(before, after))
+
+    def test_dotnet_timestamps_set_and_move_the_watermark(self):
+        with open(self.feedback, 'w', encoding='utf-8') as f:
+            f.write(_feedback_line('oat milk', 'Dairy', 'Milk', '2026-01-01T10:00:00.1234567+00:00'))
+            f.write(_feedback_line('farmhouse loaf', 'Bakery', 'Bread', '2026-01-02T10:00:00Z'))
+        parent = self._publish()
+        self.assertEqual(self._manifest(parent)['feedback_until'], '2026-01-02T10:00:00Z')
+        with open(self.feedback, 'a', encoding='utf-8') as f:
+            f.write(_feedback_line('brioche loaf', 'Bakery', 'Bread', '2026-01-03T10:00:00.12345+00:00'))
+
+        version = self._update()
+        self.assertNotEqual(version, parent)
+        self.assertEqual(self._manifest(version)['feedback_until'], '2026-01-03T10:00:00.12345+00:00')
+
+    def test_update_without_new_feedback_publishes_nothing(self):
+        version = self._publish()
+        self.assertEqual(self._update(), version)
+        self.assertEqual(os.listdir(os.path.join(self.model_dir, retrain.VERSIONS_SUBDIR)), [version])
+
+    def test_full_runs_a_full_retrain(self):
+        parent = self._publish()
+        version = self._update('--full', '--training-data', self.training_data)
+        self.assertNotEqual(version, parent)
+        manifest = self._manifest(version)
+        self.assertEqual((manifest['kind'], manifest['parent']), ('full', None))
+
+
+class TestPublishVersion(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.model_dir = tmp.name
+
+    def _publish(self, name, keep=5):
+        return retrain.publish_version(self.model_dir, {'primary': name}, {'vectorizer': name}, {}, {},
+                                       {'version': name}, keep=keep)
+
+    def test_taken_name_gets_a_suffix(self):
+        self._publish('20260101T000000Z-online')
+        directory = self._publish('20260101T000000Z-online')
+        self.assertEqual(os.path.basename(directory), '20260101T000000Z-online.2')
+        self.assertEqual(retrain.current_version(self.model_dir), '20260101T000000Z-online.2')
+
+    def test_only_the_newest_versions_are_kept(self):
+        for day in range(1, 5):
+            self._publish(f'2026010{day}T000000Z-full', keep=2)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.model_dir, retrain.VERSIONS_SUBDIR))),
+                         ['20260103T000000Z-full', '20260104T000000Z-full'])
+        self.assertEqual(retrain.current_version(self.model_dir), '20260104T000000Z-full')
+        self.assertEqual(retrain.load_models(retrain.version_dir(self.model_dir, '20260104T000000Z-full'))[4],
+                         {'version': '20260104T000000Z-full'})
+
+
+class TestUpdate(unittest.TestCase):
+    """update_models._update learns only from rows with known labels and known words."""
+
+    def setUp(self):
+        X = pd.Series(['whole milk', 'skimmed milk', 'white loaf', 'rye loaf'])
+        y = pd.Series(['Dairy', 'Dairy', 'Bakery', 'Bakery'])
+        self.vectorizer = retrain._fit_vectorizer(X, pd.Series([1] * 4), retrain.SUB_VEC_KWARGS)
+        self.model = retrain._make_model('sgd').fit(self.vectorizer.transform(X), y)
+
+    def test_reports_skipped_rows(self):
+        X = pd.Series(['oat milk', 'quinoa', 'milk chocolate'])
+        y = pd.Series(['Dairy', 'Dairy', 'Confectionery'])
+        line = update_models._update(self.model, self.vectorizer, X, y, pd.Series([1, 1, 1]), 1, 0.1, 'primary')
+        self.assertEqual(line, "  primary: 1 rows x 1 epochs, 1 with no known words, unknown labels ['Confectionery']")
+
+    def test_nothing_to_learn_leaves_the_model_alone(self):
+        before = self.model.coef_.copy()
+        line = update_models._update(self.model, self.vectorizer, pd.Series(['quinoa']), pd.Series(['Dairy']),
+                                     pd.Series([1]), 1, 0.1, 'primary')
+        self.assertEqual(line, '  primary: nothing to learn, 1 with no known words')
+        np.testing.assert_array_equal(self.model.coef_, before)
+
+    def test_weights_rows_as_a_full_sgd_fit_does(self):
+        X = pd.Series(['oat milk', 'goat milk', 'quinoa', 'seeded loaf'])
+        y = pd.Series(['Dairy', 'Dairy', 'Dairy', 'Bakery'])
+        w = pd.Series([6, 2, 1, 40])
+        with patch.object(self.model, 'partial_fit') as partial_fit:
+            update_models._update(self.model, self.vectorizer, X, y, w, 2, 0.1, 'primary')
+        kept = [0, 1, 3]
+        expected = retrain._sample_weights(y[kept], w[kept], 'sgd')
+        self.assertEqual(partial_fit.call_count, 2)
+        np.testing.assert_allclose(partial_fit.call_args.kwargs['sample_weight'], expected)
+        np.testing.assert_allclose(expected, [1.125, 0.375, 1.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
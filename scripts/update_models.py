@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Apply new classification feedback to the live models in seconds, without a
+full retrain, and publish the result as a new model version.
+
+Usage:
+    python scripts/retrain.py --feedback feedback.jsonl --model sgd --publish --output-dir /srv/nimblist/models
+    python scripts/fetch_feedback.py --api-url https://nimblist.tmnrtn.com --cookie <value>
+    python scripts/update_models.py --feedback feedback.jsonl --model-dir /srv/nimblist/models
+    python scripts/update_models.py --feedback feedback.jsonl --model-dir /srv/nimblist/models --full
+
+The live version must come from retrain.py --model sgd --publish: its SGD
+classifiers are updated with partial_fit on the feedback recorded since that
+version was built. The TF-IDF vocabularies stay frozen until the next full
+retrain, so an update can only use words the models already know; names made
+only of new words are reported and left for the full retrain, as are labels
+the models have never seen.
+
+Online updates drift from what a full fit on the same data would give. Once
+the live version's last full retrain is older than --full-retrain-after-days
+(or with --full) this runs retrain.py instead, on all of the feedback,
+warm-started from the live version.
+
+Classification workers started with MODEL_DIR pointing at --model-dir load the
+new version within MODEL_RELOAD_SECONDS; no restart is needed.
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+
+import retrain
+
+
+def _update(mdl, vec, X, y, w, epochs: int, learning_rate: float, label: str) -> str:
+    """
+    partial_fit mdl on the rows it can learn from: known labels and at least
+    one word in vec's vocabulary, weighted as retrain.py weights a full SGD
+    fit. Returns the log line.
+    """
+    known = y.isin(set(mdl.classes_))
+    unknown = sorted(y[~known].unique())
+    X, y, w = X[known], y[known], w[known]
+    matrix = vec.transform(X)
+    has_words = matrix.getnnz(axis=1) > 0
+    matrix, y, w = matrix[has_words], y[has_words], w[has_words]
+    skipped = f', {int((~has_words).sum())} with no known words' if (~has_words).any() else ''
+    skipped += f', unknown labels {unknown}' if unknown else ''
+
+    if matrix.shape[0] == 0:
+        return f'  {label}: nothing to learn{skipped}'
+    sample_weight = retrain._sample_weights(y, w, 'sgd')
+    mdl.set_params(learning_rate='constant', eta0=learning_rate)
+    for _ in range(epochs):
+        mdl.partial_fit(matrix, y, sample_weight=sample_weight)
+    return f'  {label}: {matrix.shape[0]:,} rows x {epochs} epochs{skipped}'
+
+
+def full_retrain(args) -> None:
+    argv = ['--model', 'sgd', '--publish', '--output-dir', args.model_dir, '--feedback', args.feedback,
+            '--feedback-repeat', str(args.feedback_repeat), '--augmentation-drop', str(args.augmentation_drop),
+            '--n-jobs', str(args.n_jobs), '--keep-versions', str(args.keep_versions),
+            '--warm-start-from', args.model_dir]
+    if args.training_data:
+        argv += ['--training-data', args.training_data]
+    if args.no_augmentation:
+        argv.append('--no-augmentation')
+    retrain.main(argv)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Update the Nimblist classification models from new feedback')
+    parser.add_argument('--feedback', required=True,
+                        help='Path to JSONL feedback file from GET /api/classificationfeedback/export')
+    parser.add_argument('--model-dir', default=retrain.DEFAULT_OUTPUT_DIR,
+                        help=f'Directory holding the published model versions (default: {retrain.DEFAULT_OUTPUT_DIR})')
+    parser.add_argument('--feedback-repeat', type=int, default=5,
+                        help='Weight of each feedback row, as if repeated this many times (default: 5)')
+    parser.add_argument('--no-augmentation', action='store_true',
+                        help='Disable left-truncation data augmentation')
+    parser.add_argument('--augmentation-drop', type=int, default=2,
+                        help='Max words to drop from the left per name (default: 2)')
+    parser.add_argument('--epochs', type=int, default=5,
+                        help='Passes of partial_fit over the new feedback (default: 5)')
+    parser.add_argument('--learning-rate', type=float, default=0.1,
+                        help='Constant SGD step size for the update (default: 0.1)')
+    parser.add_argument('--full-retrain-after-days', type=float, default=7,
+                        help='Run a full retrain instead once the last one is this old (default: 7)')
+    parser.add_argument('--full', action='store_true',
+                        help='Run a full retrain now')
+    parser.add_argument('--training-data', default=None,
+                        help='Base training data for full retrains (default: retrain.py\'s)')
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help='Worker processes for preprocessing and full retrains; -1 = all cores (default: -1)')
+    parser.add_argument('--keep-versions', type=int, default=5,
+                        help='How many model versions to keep (default: 5)')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.feedback):
+        print(f'ERROR: Feedback file not found at {args.feedback}')
+        sys.exit(1)
+
+    version = retrain.current_version(args.model_dir)
+    if version is None:
+        print(f'ERROR: No published model version in {args.model_dir}. Publish one first:')
+        print(f'  python scripts/retrain.py --feedback {args.feedback} --model sgd --publish --output-dir {args.model_dir}')
+        sys.exit(1)
+
+    primary_model, primary_vectorizer, sub_models, sub_vectorizers, manifest = retrain.load_models(
+        retrain.version_dir(args.model_dir, version))
+    full_trained_at = manifest.get('full_trained_at')
+    age = datetime.now(timezone.utc) - retrain._parse_time(full_trained_at) if full_trained_at else None
+    if args.full or age is None or age > timedelta(days=args.full_retrain_after_days):
+        reason = 'requested' if args.full else f'last full retrain of {version} is too old ({age})'
+        print(f'Full retrain: {reason}')
+        full_retrain(args)
+        return
+    if not hasattr(primary_model, 'partial_fit'):
+        print(f"ERROR: {version} was trained with --model {manifest.get('model', 'logreg')}, which cannot be "
+              'updated incrementally. Publish an SGD version with retrain.py --model sgd --publish, or pass --full.')
+        sys.exit(1)
+
+    start = time.perf_counter()
+    since = manifest.get('feedback_until')
+    print(f'Live version {version}; loading feedback recorded after {since or "the beginning"}')
+
+    def load_new_feedback(path):
+        return retrain.load_feedback(path, since=since)
+
+    max_drop = 0 if args.no_augmentation else args.augmentation_drop
+    cleaned, augmented = retrain.prepare_source(args.feedback, load_new_feedback, args.feedback_repeat, max_drop,
+                                                n_jobs=args.n_jobs)
+    if len(cleaned) == 0:
+        print('No new feedback; nothing to publish.')
+        return
+    df = retrain.collapse_duplicates(pd.concat([cleaned, augmented], ignore_index=True))
+    print(f'  {len(cleaned):,} new feedback rows, {len(df):,} distinct training rows')
+
+    print('\n=== Updating models ===')
+    print(_update(primary_model, primary_vectorizer, df['generic_product_name'], df['newCat'], df['weight'],
+                  args.epochs, args.learning_rate, 'primary'))
+    df_sub = df[df['newSubCat'].str.strip() != '']
+    for cat in sorted(df_sub['newCat'].unique()):
+        key = retrain.sanitize_filename(cat)
+        if key not in sub_models:
+            print(f"  '{cat}': no sub-model; left for the next full retrain")
+            continue
+        rows = df_sub[df_sub['newCat'] == cat]
+        print(_update(sub_models[key], sub_vectorizers[key], rows['generic_product_name'], rows['newSubCat'],
+                      rows['weight'], args.epochs, args.learning_rate, f"'{cat}'"))
+
+    manifest.update(
+        version=retrain.new_version_name('online'),
+        kind='online',
+        created_at=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        parent=version,
+        online_updates=manifest.get('online_updates', 0) + 1,
+        feedback_until=retrain.feedback_watermark(args.feedback) or since,
+    )
+    directory = retrain.publish_version(args.model_dir, primary_model, primary_vectorizer, sub_models,
+                                        sub_vectorizers, manifest, keep=args.keep_versions)
+    print(f"\nPublished model version {manifest['version']} -> {directory} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
+import json
 import os
 import re
+import threading
+import time
 import joblib
 from flask import Flask, request, jsonify
 import numpy as np # Import numpy
@@ -15,54 +18,133 @@ SUB_MODELS_DIR = 'sub_category_models'
 PRIMARY_CONFIDENCE_THRESHOLD = float(os.environ.get('PRIMARY_CONFIDENCE_THRESHOLD', '0.35'))
 SUB_CONFIDENCE_THRESHOLD = float(os.environ.get('SUB_CONFIDENCE_THRESHOLD', '0.35'))
 
-# --- Load Models and Vectorizers ---
-print("Loading primary model and vectorizer...")
-try:
-    primary_model = joblib.load(PRIMARY_MODEL_PATH)
-    primary_vectorizer = joblib.load(PRIMARY_VECTORIZER_PATH)
-    print("Primary model and vectorizer loaded successfully.")
-except FileNotFoundError:
-    print(f"Error: Primary model or vectorizer not found at expected paths.")
-    primary_model = None
-    primary_vectorizer = None
-except Exception as e:
-    print(f"Error loading primary model/vectorizer: {e}")
-    primary_model = None
-    primary_vectorizer = None
-
-
-print("Loading sub-category models and vectorizers...")
-sub_models = {}
-sub_vectorizers = {}
-if os.path.exists(SUB_MODELS_DIR):
-    for filename in os.listdir(SUB_MODELS_DIR):
+# Upper bound on names per /predict-batch request (a recipe has tens of ingredients).
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '500'))
+
+# Directory that scripts/retrain.py --publish and scripts/update_models.py
+# publish model versions to: versions/<version>/ holds each one and CURRENT
+# names the live one. When there is a CURRENT version it is served instead of
+# the models above, and a newly published one is loaded within
+# MODEL_RELOAD_SECONDS (0 disables reloading) without a restart.
+MODEL_DIR = os.environ.get('MODEL_DIR', '.')
+MODEL_RELOAD_SECONDS = float(os.environ.get('MODEL_RELOAD_SECONDS', '30'))
+VERSION_MANIFEST = 'model_version.json'
+
+
+def current_model_version():
+    """The name of the live published version in MODEL_DIR, or None."""
+    try:
+        with open(os.path.join(MODEL_DIR, 'CURRENT'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def model_root(version):
+    """Directory to load the models for version from ('.' for the baked-in models)."""
+    return os.path.join(MODEL_DIR, 'versions', version) if version else '.'
+
+
+def load_models(root):
+    """(primary_model, primary_vectorizer, sub_models, sub_vectorizers, manifest) from root.
+
+    Raises if the primary model or vectorizer cannot be loaded; a sub-model
+    file that fails to load is reported and skipped.
+    """
+    primary_model = joblib.load(os.path.join(root, PRIMARY_MODEL_PATH))
+    primary_vectorizer = joblib.load(os.path.join(root, PRIMARY_VECTORIZER_PATH))
+
+    sub_models = {}
+    sub_vectorizers = {}
+    sub_models_dir = os.path.join(root, SUB_MODELS_DIR)
+    if os.path.exists(sub_models_dir):
+        for filename in os.listdir(sub_models_dir):
+            try:
+                # Files are model_sub_<category>.joblib and vectorizer_sub_<category>.joblib,
+                # keyed by the sanitized category name used when saving.
+                parts = filename.replace('.joblib', '').split('_sub_')
+                if len(parts) == 2:
+                    type_prefix, category_name_sanitized = parts
+                    full_path = os.path.join(sub_models_dir, filename)
+                    if type_prefix == 'model':
+                        sub_models[category_name_sanitized] = joblib.load(full_path)
+                    elif type_prefix == 'vectorizer':
+                        sub_vectorizers[category_name_sanitized] = joblib.load(full_path)
+            except Exception as e:
+                print(f"Error loading file {filename}: {e}")
+        print(f"Loaded {len(sub_models)} sub-models and {len(sub_vectorizers)} sub-vectorizers.")
+    else:
+        print(f"Warning: Sub-models directory '{sub_models_dir}' not found.")
+
+    manifest = None
+    manifest_path = os.path.join(root, VERSION_MANIFEST)
+    if os.path.exists(manifest_path):
         try:
-            # Extract category name and type (model/vectorizer) from filename
-            parts = filename.replace('.joblib', '').split('_sub_')
-            if len(parts) == 2:
-                type_prefix = parts[0] # Should be 'model' or 'vectorizer'
-                category_name_sanitized = parts[1] # This is the sanitized name used during saving
-
-                # Need a way to map sanitized name back to original if needed,
-                # or rely on the prediction output of primary model matching sanitized names.
-                # For simplicity, assume primary model predicts original names
-                # which we might need to sanitize OR load based on sanitized names.
-                # Let's load using the sanitized name as the key for now.
-
-                full_path = os.path.join(SUB_MODELS_DIR, filename)
-
-                if type_prefix == 'model':
-                    sub_models[category_name_sanitized] = joblib.load(full_path)
-                    # print(f"Loaded sub-model for: {category_name_sanitized}")
-                elif type_prefix == 'vectorizer':
-                    sub_vectorizers[category_name_sanitized] = joblib.load(full_path)
-                    # print(f"Loaded sub-vectorizer for: {category_name_sanitized}")
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading {manifest_path}: {e}")
+    return primary_model, primary_vectorizer, sub_models, sub_vectorizers, manifest
+
 
+def load_startup_models():
+    """(version, (primary_model, primary_vectorizer, sub_models, sub_vectorizers, manifest)) to start serving.
+
+    The CURRENT version if it loads, else the baked-in models with version
+    None, so a broken publish does not leave the worker without models and
+    reload_if_published keeps retrying it. The models are None when neither loads.
+    """
+    version = current_model_version()
+    for candidate in ([version] if version else []) + [None]:
+        print(f"Loading models ({'version ' + candidate if candidate else 'baked-in'})...")
+        try:
+            loaded = load_models(model_root(candidate))
+        except FileNotFoundError:
+            print("Error: Primary model or vectorizer not found at expected paths.")
+            continue
+        except Exception as e:
+            print(f"Error loading primary model/vectorizer: {e}")
+            continue
+        print("Primary model and vectorizer loaded successfully.")
+        return candidate, loaded
+    return None, (None, None, {}, {}, None)
+
+
+# --- Load Models and Vectorizers ---
+model_version, (primary_model, primary_vectorizer, sub_models, sub_vectorizers, model_manifest) = \
+    load_startup_models()
+
+_reload_lock = threading.Lock()
+_last_reload_check = time.monotonic()
+
+
+def reload_if_published():
+    """Switch to a newly published model version, at most every MODEL_RELOAD_SECONDS.
+
+    The models in use are replaced only once the new version has loaded, so a
+    broken or half-copied version leaves the current one serving.
+    """
+    global primary_model, primary_vectorizer, sub_models, sub_vectorizers, model_manifest
+    global model_version, _last_reload_check
+    if MODEL_RELOAD_SECONDS <= 0 or time.monotonic() - _last_reload_check < MODEL_RELOAD_SECONDS:
+        return
+    if not _reload_lock.acquire(blocking=False):
+        return
+    try:
+        _last_reload_check = time.monotonic()
+        version = current_model_version()
+        if version is None or version == model_version:
+            return
+        try:
+            loaded = load_models(model_root(version))
         except Exception as e:
-            print(f"Error loading file {filename}: {e}")
-    print(f"Loaded {len(sub_models)} sub-models and {len(sub_vectorizers)} sub-vectorizers.")
-else:
-    print(f"Warning: Sub-models directory '{SUB_MODELS_DIR}' not found.")
+            print(f"Error loading model version {version}, keeping {model_version or 'baked-in models'}: {e}")
+            return
+        primary_model, primary_vectorizer, sub_models, sub_vectorizers, model_manifest = loaded
+        print(f"Switched from model version {model_version or 'baked-in'} to {version}.")
+        model_version = version
+    finally:
+        _reload_lock.release()
 
 
 # --- Text cleaning (MUST stay identical to retrain.py) ---
@@ -119,25 +201,76 @@ def sanitize_filename(name):
 # --- Flask App ---
 app = Flask(__name__)
 
+@app.before_request
+def _reload_models():
+    reload_if_published()
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok"})
 
-def _predict_sub_category(primary_cat, input_vector):
+@app.route('/model-version', methods=['GET'])
+def get_model_version():
+    """The published version being served (null for the baked-in models) and its manifest."""
+    return jsonify({"version": model_version, "manifest": model_manifest})
+
+def _predict_primary(cleaned_names):
+    """Primary category per cleaned name (None below PRIMARY_CONFIDENCE_THRESHOLD), in one model call."""
+    primary_features = primary_vectorizer.transform(cleaned_names)
+    proba = primary_model.predict_proba(primary_features)
+    best = np.argmax(proba, axis=1)
+    confidence = proba[np.arange(len(best)), best]
+    return [
+        primary_model.classes_[int(i)] if c >= PRIMARY_CONFIDENCE_THRESHOLD else None
+        for i, c in zip(best, confidence)
+    ]
+
+
+def _predict_sub_categories(primary_cat, cleaned_names):
+    """Sub-category per cleaned name under primary_cat (None when unsure or unavailable), in one model call."""
     sanitized = sanitize_filename(primary_cat)
     if sanitized not in sub_models or sanitized not in sub_vectorizers:
         print(f"Warning: No sub-model found for '{primary_cat}' (Sanitized: '{sanitized}').")
-        return None
+        return [None] * len(cleaned_names)
     try:
-        sub_features = sub_vectorizers[sanitized].transform(input_vector)
-        proba = sub_models[sanitized].predict_proba(sub_features)[0]
-        max_confidence = float(np.max(proba))
-        if max_confidence < SUB_CONFIDENCE_THRESHOLD:
-            return None
-        return sub_models[sanitized].classes_[int(np.argmax(proba))]
+        sub_features = sub_vectorizers[sanitized].transform(cleaned_names)
+        proba = sub_models[sanitized].predict_proba(sub_features)
+        best = np.argmax(proba, axis=1)
+        confidence = proba[np.arange(len(best)), best]
+        return [
+            sub_models[sanitized].classes_[int(i)] if c >= SUB_CONFIDENCE_THRESHOLD else None
+            for i, c in zip(best, confidence)
+        ]
     except Exception as e:
         print(f"Error during sub-category prediction for '{primary_cat}': {e}")
-        return None
+        return [None] * len(cleaned_names)
+
+
+def _classify(product_names):
+    """Prediction dicts for product_names, in order.
+
+    The primary model runs once over all names and each sub-model once over
+    the names assigned to its category. Raises if the primary prediction fails.
+    """
+    cleaned = [clean_text(name) for name in product_names]
+    primary = _predict_primary(cleaned) if cleaned else []
+    sub = [None] * len(cleaned)
+    by_category = {}
+    for index, category in enumerate(primary):
+        if category is not None:
+            by_category.setdefault(category, []).append(index)
+    for category, indices in by_category.items():
+        for index, sub_cat in zip(indices, _predict_sub_categories(category, [cleaned[i] for i in indices])):
+            sub[index] = sub_cat
+    return [
+        {
+            "input_product_name": name,
+            "cleaned_product_name": cleaned_name,
+            "predicted_primary_category": primary_cat,
+            "predicted_sub_category": sub_cat,
+        }
+        for name, cleaned_name, primary_cat, sub_cat in zip(product_names, cleaned, primary, sub)
+    ]
 
 
 @app.route('/predict', methods=['POST'])
@@ -154,32 +287,46 @@ def predict():
     except Exception:
         return jsonify({"error": "Invalid JSON format"}), 400
 
-    product_name = data['product_name']
-    cleaned_name = clean_text(product_name)
-    input_vector = [cleaned_name]
-
     try:
-        primary_features = primary_vectorizer.transform(input_vector)
-        proba = primary_model.predict_proba(primary_features)[0]
-        max_confidence = float(np.max(proba))
-        if max_confidence < PRIMARY_CONFIDENCE_THRESHOLD:
-            predicted_primary_cat = None
-        else:
-            predicted_primary_cat = primary_model.classes_[int(np.argmax(proba))]
+        prediction = _classify([data['product_name']])[0]
     except Exception as e:
         print(f"Error during primary prediction: {e}")
         return jsonify({"error": "Failed to predict primary category"}), 500
 
-    predicted_sub_cat = None
-    if predicted_primary_cat is not None:
-        predicted_sub_cat = _predict_sub_category(predicted_primary_cat, input_vector)
+    return jsonify(prediction)
+
+
+@app.route('/predict-batch', methods=['POST'])
+def predict_batch():
+    """Classify many names in one call: {"product_names": [...]} -> {"predictions": [...]}, in input order.
+
+    Each prediction has the same fields as a /predict response.
+    """
+    if not primary_model or not primary_vectorizer:
+        return jsonify({"error": "Models not loaded properly"}), 500
+
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Request must contain valid JSON"}), 400
+        if 'product_names' not in data:
+            return jsonify({"error": "Missing 'product_names' in JSON payload"}), 400
+    except Exception:
+        return jsonify({"error": "Invalid JSON format"}), 400
+
+    product_names = data['product_names']
+    if not isinstance(product_names, list) or not all(isinstance(n, str) for n in product_names):
+        return jsonify({"error": "'product_names' must be a list of strings"}), 400
+    if len(product_names) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} product names per request"}), 400
+
+    try:
+        predictions = _classify(product_names)
+    except Exception as e:
+        print(f"Error during batch prediction: {e}")
+        return jsonify({"error": "Failed to predict primary category"}), 500
 
-    return jsonify({
-        "input_product_name": product_name,
-        "cleaned_product_name": cleaned_name,
-        "predicted_primary_category": predicted_primary_cat,
-        "predicted_sub_category": predicted_sub_cat
-    })
+    return jsonify({"predictions": predictions})
 
 # Run directly for development (python app.py)
 # Use Gunicorn for production (see Dockerfile CMD)
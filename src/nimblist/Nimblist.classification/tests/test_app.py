@@ -1,6 +1,9 @@
 import unittest
 import sys
 import os
+import tempfile
+import time
+import joblib
 import numpy as np
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app import app
@@ -206,6 +209,190 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response.status_code, 500)
         self.assertIn('error', response.json)
 
+    # ------------------------------------------------------------------
+    # Batch prediction
+    # ------------------------------------------------------------------
+    def test_predict_batch_missing_product_names(self):
+        response = self.app.post('/predict-batch', json={'product_name': 'milk'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json)
+
+    def test_predict_batch_rejects_non_list(self):
+        response = self.app.post('/predict-batch', json={'product_names': 'milk'})
+        self.assertEqual(response.status_code, 400)
+        response = self.app.post('/predict-batch', json={'product_names': ['milk', 3]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_predict_batch_rejects_oversized_batch(self):
+        with patch.object(app_module, 'MAX_BATCH_SIZE', 2):
+            response = self.app.post('/predict-batch', json={'product_names': ['a', 'b', 'c']})
+        self.assertEqual(response.status_code, 400)
+
+    def test_predict_batch_models_not_loaded(self):
+        with patch.object(app_module, 'primary_model', None), \
+             patch.object(app_module, 'primary_vectorizer', None):
+            response = self.app.post('/predict-batch', json={'product_names': ['milk']})
+        self.assertEqual(response.status_code, 500)
+
+    @patch.object(app_module, 'primary_model')
+    @patch.object(app_module, 'primary_vectorizer')
+    def test_predict_batch_empty_list(self, mock_vec, mock_model):
+        response = self.app.post('/predict-batch', json={'product_names': []})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'predictions': []})
+        mock_model.predict_proba.assert_not_called()
+
+    @patch.object(app_module, 'primary_model')
+    @patch.object(app_module, 'primary_vectorizer')
+    def test_predict_batch_keeps_order_and_thresholds(self, mock_vec, mock_model):
+        mock_vec.transform.return_value = [[0], [1], [2]]
+        mock_model.classes_ = np.array(['Bakery', 'Dairy', 'Frozen'])
+        mock_model.predict_proba.return_value = np.array([
+            [0.90, 0.05, 0.05],
+            [0.10, 0.80, 0.10],
+            [0.34, 0.33, 0.33],   # below threshold
+        ])
+        sub_mock = _make_sub_mock(['Bread', 'Cakes'], [0.80, 0.20])
+        sub_vec_mock = MagicMock()
+
+        with patch.object(app_module, 'PRIMARY_CONFIDENCE_THRESHOLD', 0.35), \
+             patch.object(app_module, 'SUB_CONFIDENCE_THRESHOLD', 0.35), \
+             patch.dict(app_module.sub_models, {'Bakery': sub_mock}, clear=True), \
+             patch.dict(app_module.sub_vectorizers, {'Bakery': sub_vec_mock}, clear=True):
+            response = self.app.post('/predict-batch', json={'product_names': ['Loaves', 'milk', 'thing']})
+
+        self.assertEqual(response.status_code, 200)
+        predictions = response.json['predictions']
+        self.assertEqual([p['input_product_name'] for p in predictions], ['Loaves', 'milk', 'thing'])
+        self.assertEqual(predictions[0]['cleaned_product_name'], 'loaf')
+        self.assertEqual([p['predicted_primary_category'] for p in predictions], ['Bakery', 'Dairy', None])
+        self.assertEqual([p['predicted_sub_category'] for p in predictions], ['Bread', None, None])
+        mock_model.predict_proba.assert_called_once()
+
+    @patch.object(app_module, 'primary_model')
+    @patch.object(app_module, 'primary_vectorizer')
+    def test_predict_batch_runs_each_sub_model_once(self, mock_vec, mock_model):
+        mock_vec.transform.return_value = [[0], [1], [2]]
+        mock_model.classes_ = np.array(['Bakery', 'Dairy'])
+        mock_model.predict_proba.return_value = np.array([[0.9, 0.1], [0.2, 0.8], [0.7, 0.3]])
+        sub_mock = MagicMock()
+        sub_mock.classes_ = np.array(['Bread', 'Rolls'])
+        sub_mock.predict_proba.return_value = np.array([[0.9, 0.1], [0.1, 0.9]])
+        sub_vec_mock = MagicMock()
+
+        with patch.object(app_module, 'PRIMARY_CONFIDENCE_THRESHOLD', 0.35), \
+             patch.object(app_module, 'SUB_CONFIDENCE_THRESHOLD', 0.35), \
+             patch.dict(app_module.sub_models, {'Bakery': sub_mock}, clear=True), \
+             patch.dict(app_module.sub_vectorizers, {'Bakery': sub_vec_mock}, clear=True):
+            response = self.app.post('/predict-batch', json={'product_names': ['bread', 'milk', 'rolls']})
+
+        self.assertEqual(response.status_code, 200)
+        sub_vec_mock.transform.assert_called_once_with(['bread', 'roll'])
+        self.assertEqual([p['predicted_sub_category'] for p in response.json['predictions']],
+                         ['Bread', None, 'Rolls'])
+
+    @patch.object(app_module, 'primary_model')
+    @patch.object(app_module, 'primary_vectorizer')
+    def test_predict_batch_primary_exception(self, mock_vec, mock_model):
+        mock_vec.transform.side_effect = Exception('primary error')
+        response = self.app.post('/predict-batch', json={'product_names': ['milk']})
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('error', response.json)
+
+    # ------------------------------------------------------------------
+    # Published model versions
+    # ------------------------------------------------------------------
+    def _write_models(self, root):
+        """Write a tiny real model set to root."""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import SGDClassifier
+        os.makedirs(os.path.join(root, 'sub_category_models'), exist_ok=True)
+        vec = TfidfVectorizer().fit(['milk', 'bread'])
+        mdl = SGDClassifier(loss='log_loss', random_state=42).fit(vec.transform(['milk', 'bread']), ['Dairy', 'Bakery'])
+        joblib.dump(vec, os.path.join(root, app_module.PRIMARY_VECTORIZER_PATH))
+        joblib.dump(mdl, os.path.join(root, app_module.PRIMARY_MODEL_PATH))
+
+    def _publish(self, model_dir, version):
+        """Write a tiny real model set as version and make it CURRENT."""
+        root = os.path.join(model_dir, 'versions', version)
+        self._write_models(root)
+        with open(os.path.join(root, 'model_version.json'), 'w') as f:
+            json.dump({'version': version, 'kind': 'online'}, f)
+        with open(os.path.join(model_dir, 'CURRENT'), 'w') as f:
+            f.write(version + '\n')
+
+    def _serving(self, model_dir, **overrides):
+        """Patch the app to serve from model_dir, due a reload check, restoring everything afterwards."""
+        values = dict(MODEL_DIR=model_dir, MODEL_RELOAD_SECONDS=30, _last_reload_check=float('-inf'),
+                      model_version=None, model_manifest=None, primary_model=MagicMock(),
+                      primary_vectorizer=MagicMock(), sub_models={}, sub_vectorizers={})
+        values.update(overrides)
+        return patch.multiple(app_module, **values)
+
+    def test_model_version_baked_in(self):
+        with patch.object(app_module, 'model_version', None), \
+             patch.object(app_module, 'model_manifest', None), \
+             patch.object(app_module, 'MODEL_RELOAD_SECONDS', 0):
+            response = self.app.get('/model-version')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'version': None, 'manifest': None})
+
+    def test_published_version_is_loaded_without_restart(self):
+        with tempfile.TemporaryDirectory() as model_dir, self._serving(model_dir):
+            self._publish(model_dir, 'v2')
+            predicted = self.app.post('/predict', json={'product_name': 'Milk'}).json
+            version = self.app.get('/model-version').json
+
+        self.assertEqual(predicted['predicted_primary_category'], 'Dairy')
+        self.assertEqual(version, {'version': 'v2', 'manifest': {'version': 'v2', 'kind': 'online'}})
+
+    def test_reload_waits_for_the_interval(self):
+        with tempfile.TemporaryDirectory() as model_dir, \
+             self._serving(model_dir, _last_reload_check=time.monotonic()):
+            self._publish(model_dir, 'v2')
+            version = self.app.get('/model-version').json['version']
+        self.assertIsNone(version)
+
+    def test_broken_version_keeps_current_models(self):
+        with tempfile.TemporaryDirectory() as model_dir, self._serving(model_dir, model_version='v1'):
+            current = app_module.primary_model
+            os.makedirs(os.path.join(model_dir, 'versions', 'v2'))
+            with open(os.path.join(model_dir, 'CURRENT'), 'w') as f:
+                f.write('v2\n')
+            version = self.app.get('/model-version').json['version']
+            self.assertIs(app_module.primary_model, current)
+        self.assertEqual(version, 'v1')
+
+    def test_broken_current_version_at_startup_falls_back_to_baked_in_models(self):
+        with tempfile.TemporaryDirectory() as model_dir, tempfile.TemporaryDirectory() as baked_in:
+            self._write_models(baked_in)
+            root = os.path.join(model_dir, 'versions', 'v2')
+            os.makedirs(root)
+            with open(os.path.join(root, app_module.PRIMARY_MODEL_PATH), 'wb') as f:
+                f.write(b'not a model')
+            with open(os.path.join(model_dir, 'CURRENT'), 'w') as f:
+                f.write('v2\n')
+            model_root = app_module.model_root
+            with patch.object(app_module, 'MODEL_DIR', model_dir), \
+                 patch.object(app_module, 'model_root', side_effect=lambda v: model_root(v) if v else baked_in):
+                version, (primary, vectorizer, _, _, manifest) = app_module.load_startup_models()
+
+                self.assertIsNone(version)
+                self.assertIsNone(manifest)
+                self.assertEqual(primary.predict(vectorizer.transform(['milk']))[0], 'Dairy')
+
+                # Serving the fallback, the fixed republish of the same version is picked up.
+                with self._serving(model_dir, model_version=version, primary_model=primary,
+                                   primary_vectorizer=vectorizer):
+                    self._write_models(root)
+                    self.assertEqual(self.app.get('/model-version').json['version'], 'v2')
+
+    def test_startup_without_any_models(self):
+        with tempfile.TemporaryDirectory() as model_dir, \
+             patch.object(app_module, 'MODEL_DIR', model_dir), \
+             patch.object(app_module, 'model_root', return_value=model_dir):
+            self.assertEqual(app_module.load_startup_models(), (None, (None, None, {}, {}, None)))
+
     # ------------------------------------------------------------------
     # clean_text — basic
     # ------------------------------------------------------------------
@@ -1,12 +1,46 @@
 import base64
+import functools
+import hashlib
 import json
+import multiprocessing
 import os
+import re
 import requests
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import lxml.html
+import tempfile
 import trafilatura
-from flask import Flask, request, jsonify
-from recipe_scrapers import scrape_html, WebsiteNotImplementedError
+from flask import Flask, Response, request, jsonify
+from recipe_scrapers import SCRAPERS, scrape_html
+from recipe_scrapers._abstract import AbstractScraper
+from recipe_scrapers._schemaorg import SchemaOrg
+from recipe_scrapers._utils import get_host_name
+from recipe_scrapers.plugins.html_tags_stripper import stripper
 from ingredient_parser import parse_ingredient
 
+from circuit_breaker import CircuitBreaker
+from deadline import Deadline
+from image_prep import prepare_image
+from ingredient_text import init_parse_worker, parse_ingredient_text, parse_shard
+from json_stream import FIELD, ITEM, JsonFieldStream
+from recipe_text import recipe_excerpt
+from single_flight import LEADER, FlightTimeout, LeaseStore, SingleFlight
+from stage_metrics import StageHistograms
+from strategy_memory import StrategyMemory
+from warmup import Warmup
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # orjson is a speed-up only; the stdlib decoder gives identical results
+    _json_loads = json.loads
+
 app = Flask(__name__)
 
 # Env-var defaults — used when no per-request llm_config is supplied
@@ -15,6 +49,122 @@ _LLM_MODEL = os.environ.get('LLM_MODEL', '').strip()
 _LLM_VISION_MODEL = os.environ.get('LLM_VISION_MODEL', '').strip()
 _OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY', '').strip()
 _OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434').rstrip('/')
+# Hosted provider API roots. Only overridden to point a provider at a stand-in,
+# such as the benchmark's fake LLM server (bench/fake_llm.py).
+_OPENROUTER_BASE_URL = os.environ.get('OPENROUTER_BASE_URL', 'https://openrouter.ai/api').rstrip('/')
+_OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com').rstrip('/')
+_ANTHROPIC_BASE_URL = os.environ.get('ANTHROPIC_BASE_URL', 'https://api.anthropic.com').rstrip('/')
+_GEMINI_BASE_URL = os.environ.get('GEMINI_BASE_URL', 'https://generativelanguage.googleapis.com').rstrip('/')
+
+# Failover chain tried in order when LLM_PROVIDER fails or its circuit is open,
+# as provider:model pairs, e.g. LLM_FALLBACKS=gemini:gemini-2.0-flash,anthropic:claude-haiku-4-5.
+# Each provider's key comes from <PROVIDER>_API_KEY (OPENROUTER_API_KEY, GEMINI_API_KEY, ...).
+_LLM_FALLBACKS = os.environ.get('LLM_FALLBACKS', '').strip()
+# Per-provider circuit breakers: open when, over the last LLM_BREAKER_WINDOW
+# calls (at least LLM_BREAKER_MIN_CALLS), the failure share or the share slower
+# than LLM_BREAKER_SLOW_SECONDS reaches its rate; probed after LLM_BREAKER_COOLDOWN.
+_BREAKER_SETTINGS = {
+    'window': int(os.environ.get('LLM_BREAKER_WINDOW', '20')),
+    'min_calls': int(os.environ.get('LLM_BREAKER_MIN_CALLS', '5')),
+    'failure_rate': float(os.environ.get('LLM_BREAKER_FAILURE_RATE', '0.5')),
+    'slow_call_seconds': float(os.environ.get('LLM_BREAKER_SLOW_SECONDS', '20')),
+    'slow_call_rate': float(os.environ.get('LLM_BREAKER_SLOW_RATE', '0.8')),
+    'cooldown': float(os.environ.get('LLM_BREAKER_COOLDOWN', '30')),
+}
+_LLM_PROBE_TIMEOUT = 10
+# Seconds a text and a vision (photo) extraction call may take. Vision calls
+# have their own breakers, whose slow-call threshold is scaled by the ratio.
+_LLM_TIMEOUT = 30
+_LLM_VISION_TIMEOUT = 60
+# Page text sent for LLM recipe extraction is cut down to the recipe-dense
+# regions that fit this many (estimated) tokens.
+_LLM_PROMPT_TOKENS = int(os.environ.get('LLM_PROMPT_TOKEN_BUDGET', '1500'))
+
+# Hedged LLM calls: when the provider hasn't answered a recipe extraction within
+# its recent p90 latency (LLM_HEDGE_AFTER seconds until LLM_HEDGE_MIN_SAMPLES
+# calls have been timed), the same prompt also goes to the hedge provider and
+# whichever answers first wins. Leave LLM_HEDGE_PROVIDER empty to disable.
+_LLM_HEDGE_PROVIDER = os.environ.get('LLM_HEDGE_PROVIDER', '').lower().strip()
+_LLM_HEDGE_MODEL = os.environ.get('LLM_HEDGE_MODEL', '').strip()
+_LLM_HEDGE_API_KEY = os.environ.get('LLM_HEDGE_API_KEY', '').strip() or _OPENROUTER_API_KEY
+_LLM_HEDGE_AFTER = float(os.environ.get('LLM_HEDGE_AFTER', '20'))
+_LLM_HEDGE_MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', '20'))
+_LLM_LATENCY_WINDOW = 200
+# Speculative LLM fallback: when a page carries no schema.org Recipe markup the
+# scrapers will almost certainly come up empty, so the LLM call is started
+# alongside them rather than after them, and dropped if a scraper succeeds.
+_SPECULATIVE_LLM = os.environ.get('SPECULATIVE_LLM', '').lower() in ('1', 'true', 'yes')
+
+# Ingredient lists with at least PARSE_POOL_THRESHOLD lines are sharded across
+# a persistent pool of PARSE_POOL_WORKERS processes; smaller lists (a typical
+# single recipe) are parsed inline. PARSE_POOL_WORKERS=0 disables the pool.
+# Every gunicorn worker has its own pool, so the default splits the cores
+# between the WEB_CONCURRENCY workers rather than giving each all of them.
+_PARSE_POOL_WORKERS = int(os.environ.get(
+    'PARSE_POOL_WORKERS', str((os.cpu_count() or 1) // max(1, int(os.environ.get('WEB_CONCURRENCY', '1'))))))
+_PARSE_POOL_THRESHOLD = int(os.environ.get('PARSE_POOL_THRESHOLD', '64'))
+
+# /scrape-batch limits: at most BATCH_CONCURRENCY URLs in flight per batch, and
+# at most BATCH_PER_HOST of those against any one site.
+_BATCH_MAX_URLS = int(os.environ.get('BATCH_MAX_URLS', '100'))
+_BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', '8'))
+_BATCH_PER_HOST = int(os.environ.get('BATCH_PER_HOST', '2'))
+# A sync worker must finish the whole /scrape-batch stream inside gunicorn's
+# --timeout 60, so in sync mode a batch gets BATCH_BUDGET_SECONDS in all: no URL
+# starts once it is spent, each URL's own budget is capped by what is left, and
+# the URLs still unfinished at the end are reported as timed out. The async
+# mode has no worker timeout and runs every URL to completion.
+_BATCH_BUDGET = float(os.environ.get('BATCH_BUDGET_SECONDS', '50'))
+
+# End-to-end budget per /scrape or /scrape-image request (less if the caller's
+# X-Deadline-Ms header asks for less). Keep it under gunicorn's --timeout 60 so
+# a slow upstream ends in a 422, not a killed worker. Optional stages (the LLM
+# fallback, og:image lookup) are skipped rather than started with too little left.
+_REQUEST_BUDGET = float(os.environ.get('REQUEST_BUDGET_SECONDS', '55'))
+_LLM_MIN_BUDGET = float(os.environ.get('LLM_MIN_BUDGET_SECONDS', '5'))
+_OG_IMAGE_MIN_BUDGET = 0.5
+
+# Vision inputs (uploaded photos, and remote images inlined for Gemini) are
+# downscaled to IMAGE_MAX_DIMENSION px on the long edge and re-encoded as
+# IMAGE_FORMAT (jpeg or webp) at the best quality under IMAGE_TARGET_BYTES.
+# IMAGE_MAX_DIMENSION=0 sends images untouched.
+_IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '1568'))
+_IMAGE_TARGET_BYTES = int(os.environ.get('IMAGE_TARGET_BYTES', str(500 * 1024)))
+_IMAGE_FORMAT = os.environ.get('IMAGE_FORMAT', 'jpeg').lower().strip()
+
+# Shared on-disk state (per-domain strategy memory) for all workers.
+_STATE_DIR = os.environ.get('SCRAPER_STATE_DIR', os.path.join(tempfile.gettempdir(), 'nimblist-recipescraper'))
+_strategy_memory = StrategyMemory(
+    os.path.join(_STATE_DIR, 'strategies.sqlite3'),
+    skip_after=int(os.environ.get('STRATEGY_SKIP_AFTER', '3')),
+    explore_rate=float(os.environ.get('STRATEGY_EXPLORE_RATE', '0.05')),
+)
+
+# Identical /scrape requests (same URL after dropping tracking parameters, same
+# LLM config) that arrive while one is in flight wait for its result instead of
+# scraping again, across all workers. SINGLE_FLIGHT=0 turns this off. A lease
+# outlives the request budget so only a dead worker's lease ever expires.
+_SINGLE_FLIGHT = os.environ.get('SINGLE_FLIGHT', '1').lower() in ('1', 'true', 'yes')
+_SINGLE_FLIGHT_POLL = float(os.environ.get('SINGLE_FLIGHT_POLL_MS', '100')) / 1000
+_flights = SingleFlight(
+    LeaseStore(os.path.join(_STATE_DIR, 'flights.sqlite3'), lease_seconds=_REQUEST_BUDGET + 5),
+    poll_interval=_SINGLE_FLIGHT_POLL,
+)
+
+# Stage timings of every /scrape (and batch item) and /scrape-image go into the
+# histograms on /metrics. domain_group is the site itself for the domains listed
+# in METRICS_DOMAINS, else 'supported' (recipe_scrapers has a site scraper) or
+# 'other', so the label set stays small; photos are 'image'.
+_METRICS_DOMAINS = frozenset(d.strip().lower().removeprefix('www.')
+                             for d in os.environ.get('METRICS_DOMAINS', '').split(',') if d.strip())
+_stage_metrics = StageHistograms(os.path.join(_STATE_DIR, 'metrics.sqlite3'))
+
+# /scrape and /parse-ingredients add a category and sub_category to every
+# ingredient when the body has "classify": true. The parsed names of one request
+# go to the classification service's /predict-batch in a single call; with
+# CLASSIFIER_URL unset the fields are null.
+_CLASSIFIER_URL = os.environ.get('CLASSIFIER_URL', '').rstrip('/')
+_CLASSIFIER_TIMEOUT = float(os.environ.get('CLASSIFIER_TIMEOUT', '5'))
 
 _LLM_RECIPE_PROMPT = """\
 Extract the recipe and return ONLY a JSON object with these exact fields (no markdown, no explanation):
@@ -29,15 +179,40 @@ Extract the recipe and return ONLY a JSON object with these exact fields (no mar
 """
 
 
+def _env_fallbacks():
+    fallbacks = []
+    for entry in filter(None, (e.strip() for e in _LLM_FALLBACKS.split(','))):
+        provider, _, model = entry.partition(':')
+        provider = provider.lower().strip()
+        fallbacks.append({
+            'provider': provider,
+            'model': model.strip(),
+            'vision_model': '',
+            'api_key': os.environ.get(f'{provider.upper()}_API_KEY', '').strip(),
+            'base_url': _OLLAMA_BASE_URL,
+        })
+    return fallbacks
+
+
 def _resolve_cfg(request_cfg=None):
-    """Return an llm config dict from request body override or env var defaults."""
+    """Return an llm config dict from request body override or env var defaults.
+
+    'fallbacks' is the failover chain (config dicts of the same shape) and
+    'hedge' the alternate provider for hedged recipe extraction, or None. A
+    request override brings its own llm_config.fallbacks / llm_config.hedge;
+    otherwise they come from LLM_FALLBACKS and LLM_HEDGE_*.
+    """
     if request_cfg and request_cfg.get('provider'):
+        hedge = request_cfg.get('hedge')
+        fallbacks = request_cfg.get('fallbacks') or []
         return {
             'provider': request_cfg.get('provider', '').lower().strip(),
             'model': (request_cfg.get('model') or '').strip(),
             'vision_model': (request_cfg.get('vision_model') or '').strip(),
             'api_key': (request_cfg.get('api_key') or '').strip(),
             'base_url': (request_cfg.get('base_url') or _OLLAMA_BASE_URL).rstrip('/'),
+            'fallbacks': [_resolve_cfg(f) for f in fallbacks if isinstance(f, dict) and f.get('provider')],
+            'hedge': _resolve_cfg(hedge) if isinstance(hedge, dict) and hedge.get('provider') else None,
         }
     return {
         'provider': _LLM_PROVIDER,
@@ -45,6 +220,15 @@ def _resolve_cfg(request_cfg=None):
         'vision_model': _LLM_VISION_MODEL,
         'api_key': _OPENROUTER_API_KEY,
         'base_url': _OLLAMA_BASE_URL,
+        'fallbacks': _env_fallbacks(),
+        'hedge': {
+            'provider': _LLM_HEDGE_PROVIDER,
+            'model': _LLM_HEDGE_MODEL,
+            'vision_model': '',
+            'api_key': _LLM_HEDGE_API_KEY,
+            'base_url': _OLLAMA_BASE_URL,
+            'hedge': None,
+        } if _LLM_HEDGE_PROVIDER else None,
     }
 
 
@@ -56,47 +240,246 @@ def safe_call(fn):
         return None
 
 
-def _format_quantity(qty) -> str:
-    """Format a parsed quantity value as a human-readable string.
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def _parse_pool_context():
+    """forkserver where available, else spawn: forking a threaded gunicorn worker can copy held locks."""
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    context = multiprocessing.get_context(method)
+    if method == 'forkserver':
+        # The fork server loads the parser once; every pool process forks from it warm.
+        context.set_forkserver_preload(['ingredient_text'])
+    return context
+
+
+def _get_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=_PARSE_POOL_WORKERS, mp_context=_parse_pool_context(),
+                                              initializer=init_parse_worker)
+        return _parse_pool
+
 
-    ingredient-parser-nlp returns quantity values as Python Fraction objects
-    (e.g. Fraction(3, 2) for 1½).  str() on an improper Fraction gives "3/2",
-    which is hard to read and breaks the frontend scaling parser.  Convert to
-    mixed-number notation instead: Fraction(3, 2) → "1 1/2".
+def _discard_parse_pool(pool):
+    """Shut down a broken pool, unless another thread has already replaced it."""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is pool:
+            _parse_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_ingredient_texts(texts):
+    """Parse a list of ingredient lines, preserving input order.
+
+    Large lists are split into one contiguous shard per pool process so each
+    process pays a single IPC round trip; results are concatenated in shard
+    order, so the output is identical to parsing inline.
     """
-    from fractions import Fraction
+    texts = [str(t) for t in texts]
+    if _PARSE_POOL_WORKERS < 2 or len(texts) < _PARSE_POOL_THRESHOLD:
+        return parse_shard(texts)
+    size = -(-len(texts) // _PARSE_POOL_WORKERS)
+    shards = [texts[i:i + size] for i in range(0, len(texts), size)]
+    pool = _get_parse_pool()
     try:
-        f = Fraction(qty).limit_denominator(16)
-    except (TypeError, ValueError):
-        return str(qty)
-    if f.denominator == 1:
-        return str(f.numerator)
-    whole = f.numerator // f.denominator
-    remainder = f - whole
-    if whole > 0:
-        return f"{whole} {remainder.numerator}/{remainder.denominator}"
-    return f"{remainder.numerator}/{remainder.denominator}"
-
-
-def parse_ingredient_text(text):
+        return [parsed for shard in pool.map(parse_shard, shards) for parsed in shard]
+    except BrokenProcessPool:
+        app.logger.warning("Ingredient parse pool died; parsing inline and recreating the pool")
+        _discard_parse_pool(pool)
+        return parse_shard(texts)
+
+
+# ---------------------------------------------------------------------------
+# Pipeline steps
+# ---------------------------------------------------------------------------
+#
+# Each request pipeline is written once, as a generator of "steps" (the
+# functions named *_steps) that yields the I/O it needs instead of doing it:
+#   (FETCH, url, deadline)                     -> (page, error), as _fetch_page returns
+#   (CPU, fn, *args)                           -> fn(*args)
+#   (IMAGES, urls, timeout)                    -> {url: Gemini part} for the images that could be fetched
+#   (POST, url, headers, body, timeout)        -> the decoded JSON reply
+#   (OPEN_LINES, url, headers, body, timeout)  -> a streamed POST reply, read with READ_LINE
+#   (READ_LINE, lines)                         -> the next line, or None at the end
+#   (CLOSE_LINES, lines)                       -> None
+#   (START, steps)                             -> a handle on steps running alongside (with result()/cancel())
+#   (WAIT, handles, timeout, return_when)      -> (done, pending), as concurrent.futures.wait
+#   (FLIGHT, key, steps, timeout)              -> (value, role), as SingleFlight.run
+# A failed operation raises its exception inside the steps. Streaming steps
+# also yield SSE event strings, which go out to the client.
+#
+# _run_steps and _stream_steps below do the I/O with requests and threads
+# (SCRAPER_MODE=sync); asgi.py drives the same steps with awaits on one event
+# loop. Only the drivers differ between the two serving modes.
+
+FETCH, CPU, IMAGES, POST = 'fetch', 'cpu', 'images', 'post'
+OPEN_LINES, READ_LINE, CLOSE_LINES = 'open_lines', 'read_line', 'close_lines'
+START, WAIT, FLIGHT = 'start', 'wait', 'flight'
+
+
+def _post_lines(url, headers, body, timeout):
+    with requests.post(url, headers=headers, json=body, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        yield from resp.iter_lines(decode_unicode=True)
+
+
+class _BlockingIO:
+    """The operations of pipeline steps, done with blocking calls; see asgi._AsyncIO."""
+
+    def __init__(self):
+        self._streams = []
+
+    def fetch(self, url, deadline):
+        return _fetch_page(url, deadline)
+
+    def cpu(self, fn, *args):
+        return fn(*args)
+
+    def images(self, urls, timeout):
+        return _fetch_inline_images(urls, timeout)
+
+    def post(self, url, headers, body, timeout):
+        resp = requests.post(url, headers=headers, json=body, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def open_lines(self, url, headers, body, timeout):
+        lines = _post_lines(url, headers, body, timeout)
+        self._streams.append(lines)
+        return lines
+
+    def read_line(self, lines):
+        return next(lines, None)
+
+    def close_lines(self, lines):
+        lines.close()
+
+    def start(self, steps):
+        return _llm_executor.submit(_run_steps, steps)
+
+    def wait(self, handles, timeout, return_when):
+        return wait(handles, timeout=timeout, return_when=return_when)
+
+    def flight(self, key, steps, timeout):
+        return _flights.run(key, lambda: _run_steps(steps), timeout)
+
+    def release(self):
+        """Close any streamed reply the steps left open."""
+        for lines in self._streams:
+            lines.close()
+
+
+def _stream_steps(steps):
+    """Run pipeline steps with blocking I/O, yielding the SSE events they produce; returns their return value."""
+    io = _BlockingIO()
+    send, value = steps.send, None
     try:
-        result = parse_ingredient(text)
-        name = None
-        if result.name:
-            name_parts = [n.text for n in result.name if n.text]
-            name = ' '.join(name_parts) if name_parts else None
-        quantity = None
-        if result.amount:
-            amount = result.amount[0]
-            parts = []
-            if amount.quantity:
-                parts.append(_format_quantity(amount.quantity))
-            if amount.unit:
-                parts.append(str(amount.unit))
-            quantity = ' '.join(parts) if parts else None
-        return {"text": text, "parsed_name": name, "parsed_quantity": quantity}
-    except Exception:
-        return {"text": text, "parsed_name": None, "parsed_quantity": None}
+        while True:
+            try:
+                item = send(value)
+            except StopIteration as stop:
+                return stop.value
+            if isinstance(item, str):
+                yield item
+                send, value = steps.send, None
+                continue
+            try:
+                send, value = steps.send, getattr(io, item[0])(*item[1:])
+            except Exception as e:
+                send, value = steps.throw, e
+    finally:
+        steps.close()
+        io.release()
+
+
+def _run_steps(steps):
+    """Run pipeline steps that produce no events with blocking I/O; returns their return value."""
+    try:
+        next(_stream_steps(steps))
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("pipeline steps produced events outside a stream")
+
+
+# ---------------------------------------------------------------------------
+# Ingredient classification
+# ---------------------------------------------------------------------------
+
+def _wants_classification(data):
+    """Whether a /scrape or /parse-ingredients body asked for ingredient categories."""
+    return bool(data) and data.get('classify') is True
+
+
+def _classifier_names(ingredients):
+    """The distinct non-empty parsed_name values of parsed ingredients, in first-seen order."""
+    return list(dict.fromkeys(i['parsed_name'] for i in ingredients if i.get('parsed_name')))
+
+
+def _classifier_timeout(names, deadline=None):
+    """Seconds the classifier call may take, or None when it should not be made."""
+    if not names:
+        return None
+    if not _CLASSIFIER_URL:
+        app.logger.warning("Ingredient classification requested but CLASSIFIER_URL is not set")
+        return None
+    timeout = deadline.timeout(_CLASSIFIER_TIMEOUT) if deadline else _CLASSIFIER_TIMEOUT
+    if timeout <= 0:
+        if deadline:
+            deadline.skip('classify')
+        return None
+    return timeout
+
+
+def _classifier_predictions(payload, names):
+    """The predictions of a /predict-batch reply, one per name; raises ValueError if malformed."""
+    predictions = payload.get('predictions') if isinstance(payload, dict) else None
+    if not isinstance(predictions, list) or len(predictions) != len(names):
+        raise ValueError("Malformed /predict-batch reply")
+    return predictions
+
+
+def _with_categories(ingredients, names, predictions):
+    """New ingredient dicts with category and sub_category (None where there is no prediction)."""
+    by_name = dict(zip(names, predictions or []))
+    out = []
+    for ingredient in ingredients:
+        prediction = by_name.get(ingredient.get('parsed_name')) or {}
+        out.append({
+            **ingredient,
+            'category': prediction.get('predicted_primary_category'),
+            'sub_category': prediction.get('predicted_sub_category'),
+        })
+    return out
+
+
+def _classify_ingredients_steps(ingredients, deadline=None):
+    """Steps: parsed ingredients with their categories, from one /predict-batch call timed as 'classify'."""
+    names = _classifier_names(ingredients)
+    predictions = None
+    timeout = _classifier_timeout(names, deadline)
+    if timeout:
+        with _timed(deadline, 'classify'):
+            try:
+                reply = yield POST, f'{_CLASSIFIER_URL}/predict-batch', {}, {'product_names': names}, timeout
+                predictions = _classifier_predictions(reply, names)
+            except Exception as e:
+                app.logger.warning(f"Ingredient classification failed: {e}")
+    return _with_categories(ingredients, names, predictions)
+
+
+def _classify_result_steps(body, status, deadline=None):
+    """Steps: a /scrape body with classified ingredients.
+
+    Builds a new body rather than updating it in place: a coalesced result is
+    shared with the other requests for the same URL, which may not want it.
+    """
+    if status != 200 or not body.get('ingredients'):
+        return body
+    return {**body, 'ingredients': (yield from _classify_ingredients_steps(body['ingredients'], deadline))}
 
 
 # ---------------------------------------------------------------------------
@@ -106,12 +489,36 @@ def parse_ingredient_text(text):
 CONTENT_TYPE_JSON = 'application/json'
 DATA_URI_PREFIX = 'data:'
 
+
+def _timed(deadline, stage):
+    """deadline.stage(stage), or a no-op for callers without a deadline."""
+    return deadline.stage(stage) if deadline else nullcontext()
+
+
+def _parse_ingredients(texts, deadline=None, parsed=None):
+    """parse_ingredient_texts, timed as the request's parse_ingredients stage.
+
+    parsed maps lines already parsed (as they streamed in) to their result;
+    only the other lines are parsed here.
+    """
+    texts = [str(t) for t in texts]
+    parsed = parsed or {}
+    missing = [t for t in texts if t not in parsed]
+    if missing:
+        with _timed(deadline, 'parse_ingredients'):
+            parsed = {**parsed, **dict(zip(missing, parse_ingredient_texts(missing)))}
+    return [parsed[t] for t in texts]
+
+
 def _parse_llm_json(content):
     """Strip markdown fences and parse JSON; normalise total_time to int."""
     if content.startswith('```'):
         lines = content.splitlines()
         content = '\n'.join(lines[1:-1] if lines[-1].strip() == '```' else lines[1:])
-    data = json.loads(content)
+    return _normalise_llm_fields(json.loads(content))
+
+
+def _normalise_llm_fields(data):
     tt = data.get('total_time')
     if isinstance(tt, str):
         try:
@@ -121,30 +528,23 @@ def _parse_llm_json(content):
     return data
 
 
-def _chat_openai_compat(messages, model, provider, api_key, base_url, timeout):
+def _openai_compat_request(messages, model, provider, api_key, base_url):
     """OpenAI-compatible chat completions (openrouter, openai, ollama)."""
     if provider == 'openrouter':
-        url = 'https://openrouter.ai/api/v1/chat/completions'
+        url = f'{_OPENROUTER_BASE_URL}/v1/chat/completions'
     elif provider == 'openai':
-        url = 'https://api.openai.com/v1/chat/completions'
+        url = f'{_OPENAI_BASE_URL}/v1/chat/completions'
     elif provider == 'ollama':
         url = f'{base_url}/v1/chat/completions'
         api_key = 'ollama'
     else:
         return None
-    try:
-        resp = requests.post(
-            url,
-            headers={'Authorization': f'Bearer {api_key}', 'Content-Type': CONTENT_TYPE_JSON},
-            json={'model': model, 'messages': messages, 'temperature': 0.1},
-            timeout=timeout,
-        )
-        resp.raise_for_status()
-        content = resp.json()['choices'][0]['message']['content'].strip()
-        return _parse_llm_json(content)
-    except Exception as e:
-        app.logger.warning(f"OpenAI-compat LLM call failed ({provider}/{model}): {e}")
-        return None
+    return (
+        url,
+        {'Authorization': f'Bearer {api_key}', 'Content-Type': CONTENT_TYPE_JSON},
+        {'model': model, 'messages': messages, 'temperature': 0.1},
+        lambda body: body['choices'][0]['message']['content'],
+    )
 
 
 def _to_anthropic_content(content):
@@ -166,33 +566,72 @@ def _to_anthropic_content(content):
     return blocks
 
 
-def _chat_anthropic(messages, model, api_key, timeout):
+def _anthropic_request(messages, model, api_key):
     """Anthropic Messages API."""
     anthropic_messages = [
         {'role': m['role'], 'content': _to_anthropic_content(m['content'])}
         for m in messages
     ]
-    try:
-        resp = requests.post(
-            'https://api.anthropic.com/v1/messages',
-            headers={
-                'x-api-key': api_key,
-                'anthropic-version': '2023-06-01',
-                'content-type': CONTENT_TYPE_JSON,
-            },
-            json={'model': model, 'max_tokens': 2048, 'messages': anthropic_messages},
-            timeout=timeout,
+    return (
+        f'{_ANTHROPIC_BASE_URL}/v1/messages',
+        {
+            'x-api-key': api_key,
+            'anthropic-version': '2023-06-01',
+            'content-type': CONTENT_TYPE_JSON,
+        },
+        {'model': model, 'max_tokens': 2048, 'messages': anthropic_messages},
+        lambda body: body['content'][0]['text'],
+    )
+
+
+def _prepare_image(data, media_type):
+    """prepare_image() with the configured limits; returns (bytes, media_type, report)."""
+    if not _IMAGE_MAX_DIMENSION:
+        return data, media_type, None
+    data, media_type, report = prepare_image(
+        data, media_type, max_dimension=_IMAGE_MAX_DIMENSION, target_bytes=_IMAGE_TARGET_BYTES, fmt=_IMAGE_FORMAT,
+    )
+    if report:
+        app.logger.info(
+            f"Image {report['original_bytes']} -> {report['bytes']} bytes "
+            f"({report['width']}x{report['height']}{', grayscale' if report['grayscale'] else ''})"
         )
-        resp.raise_for_status()
-        content = resp.json()['content'][0]['text'].strip()
-        return _parse_llm_json(content)
-    except Exception as e:
-        app.logger.warning(f"Anthropic call failed ({model}): {e}")
-        return None
+    return data, media_type, report
+
+
+def _prepare_image_source(image_source):
+    """Preprocess a data: URI image; returns (image_source, report).
+
+    Remote URLs are returned as they are: the provider fetches those itself,
+    except Gemini, whose images are preprocessed when they are inlined.
+    """
+    if not image_source.startswith(DATA_URI_PREFIX):
+        return image_source, None
+    header, _, encoded = image_source.partition(',')
+    media_type = header[len(DATA_URI_PREFIX):].split(';')[0] or 'image/jpeg'
+    try:
+        data = base64.b64decode(encoded)
+    except ValueError:
+        return image_source, None
+    data, media_type, report = _prepare_image(data, media_type)
+    if not report or not report['reencoded']:
+        return image_source, report
+    return f"data:{media_type};base64,{base64.b64encode(data).decode()}", report
+
+
+def _inline_image_part(content, content_type):
+    """Gemini inlineData part for raw image bytes fetched from a URL."""
+    content, media_type, _ = _prepare_image(content, (content_type or 'image/jpeg').split(';')[0])
+    return {'inlineData': {'mimeType': media_type, 'data': base64.b64encode(content).decode()}}
 
 
-def _to_gemini_parts(content):
-    """Convert an OpenAI-style content value to Gemini parts."""
+def _to_gemini_parts(content, inlined_images):
+    """Convert an OpenAI-style content value to Gemini parts.
+
+    Gemini doesn't accept arbitrary URLs, so remote images must already have
+    been fetched into ``inlined_images`` (url -> part); any that failed to
+    fetch are dropped.
+    """
     if isinstance(content, str):
         return [{'text': content}]
     parts = []
@@ -205,66 +644,293 @@ def _to_gemini_parts(content):
                 header, data = url.split(',', 1)
                 media_type = header.split(':')[1].split(';')[0]
                 parts.append({'inlineData': {'mimeType': media_type, 'data': data}})
-            else:
-                # Gemini doesn't accept arbitrary URLs — fetch and inline
-                try:
-                    img_resp = requests.get(url, timeout=15)
-                    img_resp.raise_for_status()
-                    b64 = base64.b64encode(img_resp.content).decode()
-                    media_type = img_resp.headers.get('content-type', 'image/jpeg').split(';')[0]
-                    parts.append({'inlineData': {'mimeType': media_type, 'data': b64}})
-                except Exception as e:
-                    app.logger.warning(f"Failed to fetch image for Gemini: {e}")
+            elif url in inlined_images:
+                parts.append(inlined_images[url])
     return parts
 
 
-def _chat_gemini(messages, model, api_key, timeout):
+def _gemini_request(messages, model, api_key, inlined_images):
     """Google Gemini generateContent API."""
     contents = [
         {'role': 'user' if m['role'] == 'user' else 'model',
-         'parts': _to_gemini_parts(m['content'])}
+         'parts': _to_gemini_parts(m['content'], inlined_images)}
         for m in messages
     ]
-    url = f'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}'
-    try:
-        resp = requests.post(
-            url,
-            headers={'Content-Type': CONTENT_TYPE_JSON},
-            json={'contents': contents},
-            timeout=timeout,
-        )
-        resp.raise_for_status()
-        text = resp.json()['candidates'][0]['content']['parts'][0]['text'].strip()
-        return _parse_llm_json(text)
-    except Exception as e:
-        app.logger.warning(f"Gemini call failed ({model}): {e}")
-        return None
+    return (
+        f'{_GEMINI_BASE_URL}/v1beta/models/{model}:generateContent?key={api_key}',
+        {'Content-Type': CONTENT_TYPE_JSON},
+        {'contents': contents},
+        lambda body: body['candidates'][0]['content']['parts'][0]['text'],
+    )
+
+
+def _images_to_inline(messages, cfg):
+    """Remote image URLs that must be fetched and inlined before the provider call."""
+    if cfg['provider'] != 'gemini':
+        return []
+    return [
+        part['image_url']['url']
+        for m in messages if not isinstance(m['content'], str)
+        for part in m['content']
+        if part['type'] == 'image_url' and not part['image_url']['url'].startswith(DATA_URI_PREFIX)
+    ]
+
 
+def _llm_request(messages, cfg, inlined_images=None):
+    """Build the provider HTTP call as (url, headers, json_body, extract_text), or None.
 
-def _llm_chat(messages, cfg, timeout=30):
-    """Dispatch to the right provider."""
+    Transport is left to the caller so the sync (requests) and async (httpx)
+    serving modes share one definition of each provider's wire format.
+    """
     provider = cfg['provider']
     model = cfg['model']
     if not provider or not model:
         return None
     if provider == 'anthropic':
-        return _chat_anthropic(messages, model, cfg['api_key'], timeout)
+        return _anthropic_request(messages, model, cfg['api_key'])
     if provider == 'gemini':
-        return _chat_gemini(messages, model, cfg['api_key'], timeout)
-    return _chat_openai_compat(messages, model, provider, cfg['api_key'], cfg['base_url'], timeout)
+        return _gemini_request(messages, model, cfg['api_key'], inlined_images or {})
+    return _openai_compat_request(messages, model, provider, cfg['api_key'], cfg['base_url'])
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_PROBE_MESSAGES = [{'role': 'user', 'content': 'Reply with {}'}]
+
+
+def _provider_breaker(cfg):
+    """cfg's breaker. Vision calls (marked by _vision_request) get one of their
+    own, so normal slow photo imports cannot open the circuit for text extraction
+    on the same provider/model."""
+    name = f"{cfg['provider']}/{cfg['model']}"
+    settings = _BREAKER_SETTINGS
+    if cfg.get('vision'):
+        name += '#vision'
+        settings = {**settings,
+                    'slow_call_seconds': settings['slow_call_seconds'] * _LLM_VISION_TIMEOUT / _LLM_TIMEOUT}
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, **settings)
+        return _breakers[name]
+
+
+def _is_upstream_failure(exc):
+    """Whether a provider call error counts against its breaker. Client errors
+    (a bad per-request API key, an unknown model) say nothing about the upstream."""
+    status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    return status is None or status >= 500 or status in (408, 429)
+
+
+def _record_llm_outcome(cfg, exc, started):
+    if exc is None or _is_upstream_failure(exc):
+        _provider_breaker(cfg).record(exc is None, time.monotonic() - started)
+    if exc is not None:
+        app.logger.warning(f"LLM call failed ({cfg['provider']}/{cfg['model']}): {exc}")
+
+
+def _probe_provider(cfg):
+    """Health probe for a provider whose breaker is half-open: a one-line prompt, short timeout."""
+    try:
+        url, headers, body, _ = _llm_request(_PROBE_MESSAGES, cfg)
+        requests.post(url, headers=headers, json=body, timeout=_LLM_PROBE_TIMEOUT).raise_for_status()
+        ok = True
+    except Exception as e:
+        app.logger.warning(f"LLM health probe failed ({cfg['provider']}/{cfg['model']}): {e}")
+        ok = False
+    _provider_breaker(cfg).record_probe(ok)
+    app.logger.info(f"LLM health probe {cfg['provider']}/{cfg['model']}: {'ok' if ok else 'failed'}")
+
+
+def _llm_chain(cfg):
+    """cfg then its fallbacks, minus providers whose circuit is open.
+
+    An open provider whose cooldown has passed gets a background health probe
+    instead of live traffic, so no import waits on a provider that is down.
+    """
+    chain = []
+    for link in [cfg] + (cfg.get('fallbacks') or []):
+        if not link['provider'] or not link['model']:
+            continue
+        breaker = _provider_breaker(link)
+        if breaker.allow():
+            chain.append(link)
+        elif breaker.start_probe():
+            _llm_executor.submit(_probe_provider, link)
+    if not chain and cfg['provider']:
+        app.logger.warning(f"Every LLM provider for {cfg['provider']}/{cfg['model']} has an open circuit; failing fast")
+    return chain
+
+
+def _parse_llm_reply(text, cfg):
+    try:
+        return _parse_llm_json(text.strip())
+    except Exception as e:
+        app.logger.warning(f"Unparseable LLM reply ({cfg['provider']}/{cfg['model']}): {e}")
+        return None
+
+
+def _fetch_inline_images(urls, timeout=15):
+    inlined_images = {}
+    for url in urls:
+        try:
+            img_resp = requests.get(url, timeout=timeout)
+            img_resp.raise_for_status()
+            inlined_images[url] = _inline_image_part(img_resp.content, img_resp.headers.get('content-type'))
+        except Exception as e:
+            app.logger.warning(f"Failed to fetch image for Gemini: {e}")
+    return inlined_images
+
+
+def _inline_images_steps(messages, cfg, deadline):
+    """Steps: fetch the remote images cfg's provider needs inlined; returns url -> part."""
+    urls = _images_to_inline(messages, cfg)
+    if not urls:
+        return {}
+    return (yield IMAGES, urls, deadline.timeout(15) if deadline else 15)
+
+
+def _llm_chat_steps(messages, cfg, timeout=_LLM_TIMEOUT, deadline=None):
+    """Steps: send messages to cfg's provider, failing over down its fallback chain.
+
+    With a deadline, each call's timeout is trimmed to the remaining budget and
+    the chain stops once too little is left to be worth another provider.
+    """
+    for link in _llm_chain(cfg):
+        if deadline and not deadline.allows(1):
+            deadline.skip(PATH_LLM)
+            break
+        inlined_images = yield from _inline_images_steps(messages, link, deadline)
+        llm_request = _llm_request(messages, link, inlined_images)
+        if llm_request is None:
+            continue
+        url, headers, body, extract_text = llm_request
+        call_timeout = deadline.timeout(timeout) if deadline else timeout
+        started = time.monotonic()
+        try:
+            text = extract_text((yield POST, url, headers, body, call_timeout))
+        except Exception as e:
+            _record_llm_outcome(link, e, started)
+            continue
+        _record_llm_outcome(link, None, started)
+        result = _parse_llm_reply(text, link)
+        if result:
+            return result
+    return None
+
+
+# Recent successful LLM call durations per (provider, model), for the hedge delay.
+_llm_latencies = defaultdict(lambda: deque(maxlen=_LLM_LATENCY_WINDOW))
+_llm_latencies_lock = threading.Lock()
+# Provider calls for speculative and hedged extraction run here; a sync worker
+# can't interrupt a request in flight, so a losing call finishes in the
+# background and its answer is dropped.
+_llm_executor = ThreadPoolExecutor(max_workers=4 * _BATCH_CONCURRENCY, thread_name_prefix='llm')
+
+
+def _record_llm_latency(cfg, seconds):
+    with _llm_latencies_lock:
+        _llm_latencies[(cfg['provider'], cfg['model'])].append(seconds)
 
 
-def _llm_extract_recipe(page_html, cfg):
-    page_text = trafilatura.extract(page_html, include_comments=False, include_tables=True)
+def _hedge_delay(cfg):
+    """Seconds to wait on cfg's provider before hedging: its p90 latency once enough calls are timed."""
+    with _llm_latencies_lock:
+        samples = sorted(_llm_latencies[(cfg['provider'], cfg['model'])])
+    if len(samples) < _LLM_HEDGE_MIN_SAMPLES:
+        return _LLM_HEDGE_AFTER
+    return samples[int(0.9 * (len(samples) - 1))]
+
+
+def _llm_chat(messages, cfg, timeout=_LLM_TIMEOUT, deadline=None):
+    return _run_steps(_llm_chat_steps(messages, cfg, timeout, deadline))
+
+
+def _llm_chat_timed_steps(messages, cfg, deadline=None):
+    started = time.monotonic()
+    result = yield from _llm_chat_steps(messages, cfg, deadline=deadline)
+    if result:
+        _record_llm_latency(cfg, time.monotonic() - started)
+    return result
+
+
+class _LLMCall:
+    """A recipe extraction running alongside the request, hedged to cfg['hedge'] when slow.
+
+    Starting the call (start()) and collecting its result (result()) are
+    separate steps so /scrape can start it speculatively, before the scrapers
+    have had their turn. result() never waits past the deadline. In sync mode
+    the calls run on _llm_executor and a sync worker can't interrupt one in
+    flight, so a losing call finishes in the background; in async mode it is
+    cancelled.
+    """
+
+    def __init__(self, messages, cfg, deadline):
+        self.messages = messages
+        self.cfg = cfg
+        self.deadline = deadline
+        self.started = time.monotonic()
+        self.calls = []
+
+    def start(self):
+        """Steps: start the call to cfg's provider."""
+        self.calls.append((yield START, _llm_chat_timed_steps(self.messages, self.cfg, self.deadline)))
+
+    def result(self):
+        """Steps: the first non-empty answer from the provider or its hedge, else None."""
+        hedge = self.cfg.get('hedge')
+        if hedge:
+            # A primary that fails fast is hedged straight away.
+            hedge_in = max(0, _hedge_delay(self.cfg) - (time.monotonic() - self.started))
+            done, _ = yield WAIT, self.calls, self.deadline.timeout(hedge_in), ALL_COMPLETED
+            if (not done or not self.calls[0].result()) and self.deadline.allows(_LLM_MIN_BUDGET):
+                app.logger.info(f"Hedging LLM call to {hedge['provider']}/{hedge['model']}")
+                self.calls.append((yield START, _llm_chat_timed_steps(self.messages, hedge, self.deadline)))
+        pending = set(self.calls)
+        try:
+            while pending:
+                done, pending = yield WAIT, pending, self.deadline.remaining(), FIRST_COMPLETED
+                if not done:
+                    app.logger.warning("LLM extraction ran out of request budget")
+                    return None
+                for call in done:
+                    if call.result():
+                        return call.result()
+            return None
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        for call in self.calls:
+            call.cancel()
+
+
+def _llm_recipe_messages(page):
+    """Prompt for extracting the recipe from page text; returns (messages, prompt_stats) or (None, None)."""
+    # trafilatura copies a tree it is given, so the shared parse stays untouched.
+    tree = _as_page(page).tree
+    page_text = trafilatura.extract(tree if tree is not None else page, include_comments=False, include_tables=True)
     if not page_text:
+        return None, None
+    excerpt, stats = recipe_excerpt(page_text, _LLM_PROMPT_TOKENS)
+    return [{'role': 'user', 'content': _LLM_RECIPE_PROMPT + '\nText:\n' + excerpt}], stats
+
+
+def _llm_extract_recipe(page, cfg):
+    messages, _ = _llm_recipe_messages(page)
+    if not messages:
         return None
-    messages = [{'role': 'user', 'content': _LLM_RECIPE_PROMPT + '\nText:\n' + page_text[:6000]}]
     return _llm_chat(messages, cfg)
 
 
-def _llm_extract_from_image(image_source, cfg):
-    model = cfg['vision_model'] or cfg['model']
-    vision_cfg = {**cfg, 'model': model}
+def _vision_request(image_source, cfg):
+    """Messages and config for a vision-model recipe extraction."""
+    vision_cfg = {
+        **cfg,
+        'model': cfg['vision_model'] or cfg['model'],
+        'vision': True,
+        'fallbacks': [{**f, 'model': f['vision_model'] or f['model'], 'vision': True}
+                      for f in cfg.get('fallbacks') or []],
+    }
     messages = [{
         'role': 'user',
         'content': [
@@ -272,7 +938,12 @@ def _llm_extract_from_image(image_source, cfg):
             {'type': 'text', 'text': _LLM_RECIPE_PROMPT},
         ],
     }]
-    return _llm_chat(messages, vision_cfg, timeout=60)
+    return messages, vision_cfg
+
+
+def _llm_extract_from_image_steps(image_source, cfg, deadline=None):
+    messages, vision_cfg = _vision_request(image_source, cfg)
+    return (yield from _llm_chat_steps(messages, vision_cfg, timeout=_LLM_VISION_TIMEOUT, deadline=deadline))
 
 
 # ---------------------------------------------------------------------------
@@ -281,25 +952,90 @@ def _llm_extract_from_image(image_source, cfg):
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({"status": "ok"})
+    """200 once the parsing libraries are warm, else 503; both carry the per-component startup report."""
+    body, status = _health()
+    return jsonify(body), status
 
 
-@app.route('/parse-ingredients', methods=['POST'])
-def parse_ingredients_endpoint():
-    data = request.get_json(silent=True)
+def _health():
+    if not _WARMUP:
+        return {"status": "ok", "warmup": None}, 200
+    if _warmup.ran and not _warmup.ready:
+        _warmup.retry_failed()
+    report = _warmup.report()
+    return {"status": "ok" if report['ready'] else "warming", "warmup": report}, 200 if report['ready'] else 503
+
+
+def _ingredients_request_args(data):
+    """Validate a /parse-ingredients body; returns (texts, None) or (None, (error, status))."""
     if not data or 'ingredients' not in data:
-        return jsonify({"error": "Missing 'ingredients' in request body"}), 400
+        return None, ("Missing 'ingredients' in request body", 400)
     texts = data['ingredients']
     if not isinstance(texts, list):
-        return jsonify({"error": "'ingredients' must be a list"}), 400
-    return jsonify([parse_ingredient_text(str(t)) for t in texts])
+        return None, ("'ingredients' must be a list", 400)
+    return texts, None
+
+
+@app.route('/strategies', methods=['GET'])
+def strategies():
+    """Per-domain extraction strategy stats; ?domain=example.com for one site."""
+    domain = request.args.get('domain')
+    return jsonify(_strategy_memory.stats(_host_key(f'//{domain}') if domain else None))
+
+
+@app.route('/llm-providers', methods=['GET'])
+def llm_providers():
+    """The configured LLM failover chain and every provider's circuit breaker state."""
+    return jsonify(_llm_providers_status())
+
+
+def _llm_providers_status():
+    cfg = _resolve_cfg()
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {
+        'chain': [f"{c['provider']}/{c['model']}" for c in [cfg] + cfg['fallbacks'] if c['provider']],
+        'breakers': [b.snapshot() for b in breakers],
+    }
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency histograms (Prometheus text format), across all workers."""
+    return Response(_stage_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/coalescing', methods=['GET'])
+def coalescing():
+    """How many /scrape requests shared an identical in-flight import, across all workers."""
+    return jsonify(_flights.store.stats())
+
+
+@app.route('/parse-ingredients', methods=['POST'])
+def parse_ingredients_endpoint():
+    data = request.get_json(silent=True)
+    texts, err = _ingredients_request_args(data)
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    return jsonify(_run_steps(_parse_ingredients_steps(texts, _wants_classification(data))))
+
+
+def _parse_ingredients_steps(texts, classify):
+    parsed = yield CPU, parse_ingredient_texts, texts
+    if classify:
+        parsed = yield from _classify_ingredients_steps(parsed)
+    return parsed
+
+
+def _scraper_path(url):
+    """PATH_SCRAPER when recipe_scrapers has a site-specific scraper for url, else PATH_GENERIC."""
+    return PATH_SCRAPER if get_host_name(url) in SCRAPERS else PATH_GENERIC
 
 
 def _create_scraper(html, url):
-    try:
-        return scrape_html(html, org_url=url)
-    except WebsiteNotImplementedError:
-        return scrape_html(html, org_url=url, supported_only=False)
+    # Decide supported vs generic up front rather than catching WebsiteNotImplementedError.
+    path = _scraper_path(url)
+    return scrape_html(html, org_url=url, supported_only=path == PATH_SCRAPER), path
 
 
 def _extract_instructions(scraper):
@@ -310,30 +1046,251 @@ def _extract_instructions(scraper):
     return safe_call(scraper.instructions)
 
 
-def _fetch_page(url):
+_FETCH_TIMEOUT = 15
+_FETCH_HEADERS = {'User-Agent': 'Mozilla/5.0 (compatible; Nimblist/1.0 recipe importer)'}
+_FETCH_CHUNK_BYTES = 64 * 1024
+# Pages are streamed and abandoned once they exceed FETCH_MAX_BYTES, so a
+# mis-typed URL (a video, a huge archive) can't pin a worker's memory.
+_FETCH_MAX_BYTES = int(os.environ.get('FETCH_MAX_BYTES', str(5 * 1024 * 1024)))
+# Stop reading at </head> when a JSON-LD Recipe block has already been seen
+# there — the schema.org data is all the scrapers need in that case.
+_FETCH_STOP_AFTER_HEAD = os.environ.get('FETCH_STOP_AFTER_HEAD', '').lower() in ('1', 'true', 'yes')
+_HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain')
+
+_HEAD_END_RE = re.compile(rb'</head\s*>', re.IGNORECASE)
+_JSONLD_RECIPE_RE = re.compile(
+    rb'<script[^>]+application/ld\+json[^>]*>.*?"@type"\s*:\s*(?:\[[^\]]*)?"Recipe"',
+    re.IGNORECASE | re.DOTALL,
+)
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+class _PageTooLarge(Exception):
+    pass
+
+
+class _Page(str):
+    """Fetched page HTML that parses itself into an lxml tree once, on first use.
+
+    recipe_scrapers' schema.org extraction, og:image lookup and trafilatura all
+    read ``tree`` rather than each re-parsing the HTML string.
+    """
+
+    @functools.cached_property
+    def tree(self):
+        try:
+            return lxml.html.fromstring(self)
+        except ValueError:
+            # lxml refuses str input that carries an XML encoding declaration
+            return lxml.html.fromstring(self.encode('utf-8'), parser=lxml.html.HTMLParser(encoding='utf-8'))
+        except lxml.etree.ParserError:
+            return None
+
+
+def _as_page(html):
+    return html if isinstance(html, _Page) else _Page(html)
+
+
+class _SharedTreeSchemaOrg(SchemaOrg):
+    """SchemaOrg that hands extruct the page's shared tree instead of the raw HTML."""
+
+    def __init__(self, page_data):
+        tree = page_data.tree if isinstance(page_data, _Page) else None
+        super().__init__(tree if tree is not None else page_data)
+
+
+# Scrapers with their own SchemaOrg subclass keep it (and parse the string as before).
+# _schema_cls is a private hook of recipe_scrapers, so requirements.txt pins the
+# versions it has been checked against; fail at start-up rather than silently
+# re-parsing every page if an upgrade drops it.
+if getattr(AbstractScraper, '_schema_cls', None) is not SchemaOrg:
+    raise RuntimeError("recipe_scrapers.AbstractScraper._schema_cls is gone or no longer SchemaOrg; "
+                       "check _SharedTreeSchemaOrg against this recipe-scrapers version")
+AbstractScraper._schema_cls = _SharedTreeSchemaOrg
+
+
+# ---------------------------------------------------------------------------
+# JSON-LD fast path
+# ---------------------------------------------------------------------------
+
+# Which stage produced a /scrape result; returned in the X-Extraction-Path header.
+PATH_JSONLD = 'jsonld'        # schema.org Recipe read straight from JSON-LD
+PATH_SCRAPER = 'scraper'      # recipe_scrapers site-specific scraper
+PATH_GENERIC = 'generic'      # recipe_scrapers generic schema.org scraper
+PATH_LLM = 'llm'              # LLM extraction from page text
+
+_JSONLD_SCRIPT_RE = re.compile(
+    r'<script[^>]+type\s*=\s*["\']?application/ld\+json["\']?[^>]*>(.*?)</script\s*>',
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+class _JsonLdSchemaOrg(SchemaOrg):
+    """recipe_scrapers' schema.org accessors over an already-decoded Recipe node.
+
+    Skips SchemaOrg.__init__ (extruct over a full DOM) so field formatting —
+    yields, durations, HowToSection flattening — matches the generic scraper.
+    """
+
+    def __init__(self, recipe):
+        self.format = 'json-ld'
+        self.data = recipe
+        self.people = {}
+        self.ratingsdata = {}
+        self.website_name = None
+
+    @classmethod
+    def from_html(cls, html):
+        """Find the first schema.org Recipe in the page's JSON-LD blocks, or None."""
+        for match in _JSONLD_SCRIPT_RE.finditer(html):
+            raw = match.group(1).strip()
+            if raw.startswith('<!--'):
+                raw = raw[4:].rsplit('-->', 1)[0]
+            try:
+                decoded = _json_loads(raw)
+            except ValueError:
+                continue
+            for item in decoded if isinstance(decoded, list) else [decoded]:
+                if not isinstance(item, dict):
+                    continue
+                recipe = cls._find_entity(cls, item, 'Recipe')
+                if not recipe and cls._contains_schematype(item, 'WebPage'):
+                    recipe = item.get('mainEntity')
+                if isinstance(recipe, dict) and cls._contains_schematype(recipe, 'Recipe'):
+                    return cls(recipe)
+        return None
+
+
+_JSONLD_RECIPE_TEXT_RE = re.compile(_JSONLD_RECIPE_RE.pattern.decode(), re.IGNORECASE | re.DOTALL)
+
+
+def _has_recipe_markup(page):
+    """Cheap guess at whether any scraper can succeed: a JSON-LD, microdata or RDFa Recipe."""
+    if _JSONLD_RECIPE_TEXT_RE.search(page):
+        return True
+    tree = _as_page(page).tree
+    return tree is not None and bool(tree.xpath(
+        '//*[contains(@itemtype, "schema.org/Recipe") or contains(@typeof, "Recipe")]'
+    ))
+
+
+def _jsonld_result(page, deadline=None):
+    """Fast path ahead of recipe_scrapers: returns (raw_ingredients, result) like
+    _scraper_result, or None when the page has no usable JSON-LD Recipe."""
+    schema = _JsonLdSchemaOrg.from_html(page)
+    if schema is None:
+        return None
+    raw = [stripper(i) for i in safe_call(schema.ingredients) or []]
+    title = safe_call(schema.title)
+    if not raw or not title:
+        return None
+    instructions = safe_call(schema.instructions)
+    image = safe_call(schema.image)
+    if not image:
+        with _timed(deadline, 'og_image'):
+            image = _extract_og_image(page)
+    return raw, {
+        "title": stripper(title),
+        "description": safe_call(schema.description),
+        "image": image,
+        "yields": safe_call(schema.yields),
+        "total_time": safe_call(schema.total_time),
+        "ingredients": _parse_ingredients(raw, deadline),
+        "instructions": stripper(instructions) if instructions else None,
+    }
+
+
+def _check_page_headers(headers):
+    """Reject non-HTML or oversized responses before reading the body; returns an error or None."""
+    content_type = (headers.get('content-type') or '').split(';')[0].strip().lower()
+    if content_type and content_type not in _HTML_CONTENT_TYPES:
+        return f"URL does not point to a web page (content type {content_type})"
+    length = headers.get('content-length')
+    if length and length.isdigit() and int(length) > _FETCH_MAX_BYTES:
+        return f"Page is too large to import ({int(length) // 1024} KB)"
+    return None
+
+
+def _page_status_error(status, reason):
+    """The fetch error for a page answered with an HTTP error status, worded the same in both serving modes."""
+    return f"Failed to fetch URL: HTTP {status} {reason}".rstrip(), 422
+
+
+class _PageReader:
+    """Accumulates a streamed page body for both the sync and async fetchers."""
+
+    def __init__(self, timeout=_FETCH_TIMEOUT):
+        self._body = bytearray()
+        self._head_checked = False
+        self._started = time.monotonic()
+        self._timeout = timeout
+
+    def feed(self, chunk):
+        """Append a chunk; returns True once there is no need to read further."""
+        self._body += chunk
+        if len(self._body) > _FETCH_MAX_BYTES:
+            raise _PageTooLarge(f"Page is too large to import (over {_FETCH_MAX_BYTES // 1024} KB)")
+        # requests/httpx timeouts are per read, so enforce the total here too.
+        if time.monotonic() - self._started > self._timeout:
+            raise TimeoutError
+        if _FETCH_STOP_AFTER_HEAD and not self._head_checked:
+            head_end = _HEAD_END_RE.search(self._body)
+            if head_end:
+                self._head_checked = True
+                return bool(_JSONLD_RECIPE_RE.search(self._body, 0, head_end.end()))
+        return False
+
+    def text(self, content_type):
+        """Decode using the header charset, then a <meta charset>, then UTF-8."""
+        charset = None
+        for param in (content_type or '').split(';')[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'charset':
+                charset = value.strip().strip('"\'')
+        if not charset:
+            meta = _META_CHARSET_RE.search(self._body, 0, 4096)
+            charset = meta.group(1).decode('ascii') if meta else 'utf-8'
+        try:
+            return self._body.decode(charset, errors='replace')
+        except LookupError:
+            return self._body.decode('utf-8', errors='replace')
+
+
+def _fetch_page(url, deadline=None):
+    timeout = deadline.timeout(_FETCH_TIMEOUT) if deadline else _FETCH_TIMEOUT
     try:
-        resp = requests.get(
-            url,
-            timeout=15,
-            headers={'User-Agent': 'Mozilla/5.0 (compatible; Nimblist/1.0 recipe importer)'},
-            allow_redirects=True,
-        )
-        resp.raise_for_status()
-        return resp, None
-    except requests.Timeout:
+        if timeout <= 0:
+            raise TimeoutError
+        with requests.get(url, timeout=timeout, headers=_FETCH_HEADERS,
+                          allow_redirects=True, stream=True) as resp:
+            resp.raise_for_status()
+            header_err = _check_page_headers(resp.headers)
+            if header_err:
+                return None, (header_err, 422)
+            reader = _PageReader(timeout)
+            for chunk in resp.iter_content(_FETCH_CHUNK_BYTES):
+                if reader.feed(chunk):
+                    break
+            return _Page(reader.text(resp.headers.get('content-type'))), None
+    except _PageTooLarge as e:
+        return None, (str(e), 422)
+    except (requests.Timeout, TimeoutError):
         return None, ("Request timed out fetching the URL", 422)
+    except requests.HTTPError as e:
+        return None, _page_status_error(e.response.status_code, e.response.reason)
     except requests.RequestException as e:
         return None, (f"Failed to fetch URL: {str(e)}", 422)
 
 
 def _try_scraper(html, url):
+    """Returns (scraper, extraction_path, None) or (None, None, error)."""
     try:
-        return _create_scraper(html, url), None
+        return *_create_scraper(html, url), None
     except Exception as e:
-        return None, e
+        return None, None, e
 
 
-def _scraper_result(scraper):
+def _scraper_result(scraper, deadline=None):
     raw = safe_call(scraper.ingredients) or []
     return raw, {
         "title": safe_call(scraper.title) or "Untitled Recipe",
@@ -341,22 +1298,23 @@ def _scraper_result(scraper):
         "image": safe_call(scraper.image),
         "yields": safe_call(scraper.yields),
         "total_time": safe_call(scraper.total_time),
-        "ingredients": [parse_ingredient_text(ing) for ing in raw],
+        "ingredients": _parse_ingredients(raw, deadline),
         "instructions": _extract_instructions(scraper),
     }
 
 
-def _extract_og_image(html):
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(html, 'html.parser')
-    for selector in [{'property': 'og:image'}, {'name': 'twitter:image'}, {'name': 'twitter:image:src'}]:
-        tag = soup.find('meta', attrs=selector)
-        if tag and tag.get('content'):
-            return tag['content']
+def _extract_og_image(page):
+    tree = _as_page(page).tree
+    if tree is None:
+        return None
+    for attr, value in [('property', 'og:image'), ('name', 'twitter:image'), ('name', 'twitter:image:src')]:
+        for content in tree.xpath(f'//meta[@{attr}="{value}"]/@content'):
+            if content:
+                return content
     return None
 
 
-def _llm_result(llm, scraper, og_image=None):
+def _llm_result(llm, scraper, og_image=None, deadline=None, parsed=None):
     sc = scraper
     return {
         "title": llm.get('title') or (safe_call(sc.title) if sc else None) or "Untitled Recipe",
@@ -364,59 +1322,388 @@ def _llm_result(llm, scraper, og_image=None):
         "image": (safe_call(sc.image) if sc else None) or og_image,
         "yields": llm.get('yields') or (safe_call(sc.yields) if sc else None),
         "total_time": llm.get('total_time') or (safe_call(sc.total_time) if sc else None),
-        "ingredients": [parse_ingredient_text(str(i)) for i in (llm.get('ingredients') or [])],
+        "ingredients": _parse_ingredients(llm.get('ingredients') or [], deadline, parsed),
         "instructions": llm.get('instructions') or (_extract_instructions(sc) if sc else None),
     }
 
 
-@app.route('/scrape', methods=['POST'])
-def scrape():
-    data = request.get_json(silent=True)
+def _scrape_request_args(data):
+    """Validate a /scrape body; returns (url, cfg, None) or (None, None, (error, status))."""
     if not data or 'url' not in data:
-        return jsonify({"error": "Missing 'url' in request body"}), 400
-
+        return None, None, ("Missing 'url' in request body", 400)
     url = data['url'].strip()
     if not url.startswith(('http://', 'https://')):
-        return jsonify({"error": "Invalid URL — must start with http:// or https://"}), 400
+        return None, None, ("Invalid URL — must start with http:// or https://", 400)
+    return url, _resolve_cfg(data.get('llm_config')), None
 
-    cfg = _resolve_cfg(data.get('llm_config'))
 
-    resp, fetch_err = _fetch_page(url)
+class _ScrapeAttempt:
+    """State shared by the extraction strategies tried for one fetched page.
+
+    Each strategy method returns a result dict, or None to let the next
+    strategy run. The recipe_scrapers strategy keeps its scraper (even one
+    that found no ingredients) so the LLM result can be merged with its
+    metadata, and so there is a partial result to return if nothing succeeds.
+    """
+
+    def __init__(self, page, url, cfg, deadline):
+        self.page = page
+        self.url = url
+        self.cfg = cfg
+        self.deadline = deadline
+        self.domain = _host_key(url)
+        self.scraper = None
+        self.scraper_err = None
+        self.partial = None
+        self._messages = None
+
+    def strategies(self):
+        """Strategies to try, best first according to this domain's history."""
+        default = [PATH_JSONLD, _scraper_path(self.url)]
+        if self.cfg['provider']:
+            default.append(PATH_LLM)
+        return _strategy_memory.plan(self.domain, default, fallback=PATH_LLM)
+
+    def should_speculate(self, plan):
+        """Start the LLM before the scrapers when it is planned later and the page has no Recipe markup."""
+        return (_SPECULATIVE_LLM and PATH_LLM in plan[1:] and self.llm_affordable()
+                and not _has_recipe_markup(self.page))
+
+    def llm_affordable(self):
+        """Whether enough budget is left to start the LLM fallback."""
+        if self.deadline.allows(_LLM_MIN_BUDGET):
+            return True
+        self.deadline.skip(PATH_LLM)
+        return False
+
+    def run_local(self, strategy):
+        """Run a strategy that needs no network I/O (anything but PATH_LLM)."""
+        with self.deadline.stage(strategy):
+            return self._run_local(strategy)
+
+    def _run_local(self, strategy):
+        if strategy == PATH_JSONLD:
+            fast = _jsonld_result(self.page, self.deadline)
+            return fast[1] if fast else None
+        with self.deadline.stage('scrape_html'):
+            self.scraper, _, self.scraper_err = _try_scraper(self.page, self.url)
+        if not self.scraper:
+            return None
+        raw_ingredients, result = _scraper_result(self.scraper, self.deadline)
+        if raw_ingredients:
+            return result
+        self.partial = result
+        return None
+
+    def llm_messages(self):
+        if self._messages is None:
+            app.logger.info(f"Falling back to LLM extraction for {self.url}")
+            with self.deadline.stage('trafilatura'):
+                messages, stats = _llm_recipe_messages(self.page)
+            if stats:
+                self.deadline.note('prompt', stats)
+                app.logger.info(
+                    f"LLM prompt for {self.url}: ~{stats['tokens']} tokens "
+                    f"({stats['chars']} of {stats['source_chars']} chars, {stats['regions']} recipe regions)"
+                )
+            self._messages = messages or []
+        return self._messages
+
+    def llm_call(self):
+        """Steps: start the LLM extraction; returns the _LLMCall, or None when there is no page text to send."""
+        messages = yield CPU, self.llm_messages
+        if not messages:
+            return None
+        call = _LLMCall(messages, self.cfg, self.deadline)
+        yield from call.start()
+        return call
+
+    def from_llm(self, llm, parsed=None):
+        og_image = None
+        if self.deadline.allows(_OG_IMAGE_MIN_BUDGET):
+            with self.deadline.stage('og_image'):
+                og_image = _extract_og_image(self.page)
+        else:
+            self.deadline.skip('og_image')
+        return _llm_result(llm, self.scraper, og_image=og_image, deadline=self.deadline, parsed=parsed)
+
+    def record(self, strategy, ok, started):
+        _strategy_memory.record(self.domain, strategy, ok, (time.monotonic() - started) * 1000)
+
+    def failure(self):
+        """(body, status, path) once every strategy has come up empty."""
+        if self.partial:
+            return self.partial, 200, _scraper_path(self.url)
+        if self.scraper_err and not self.cfg['provider']:
+            return {"error": f"Could not find recipe data on this page: {self.scraper_err}"}, 422, None
+        return {"error": "Could not find recipe data on this page"}, 422, None
+
+
+def _request_deadline(headers):
+    """The request's Deadline: REQUEST_BUDGET_SECONDS, or the caller's X-Deadline-Ms if smaller."""
+    budget = _REQUEST_BUDGET
+    try:
+        budget = min(budget, max(0.0, float(headers.get('X-Deadline-Ms', '')) / 1000))
+    except ValueError:
+        pass
+    return Deadline(budget)
+
+
+def _deadline_headers(deadline):
+    """Response headers reporting where the request's budget went (milliseconds per stage).
+
+    Server-Timing carries the same figures for browser dev tools; a strategy's
+    stage (jsonld, scraper, generic, llm) includes the sub-stages it ran, such
+    as scrape_html and parse_ingredients.
+    """
+    report = deadline.report()
+    headers = {
+        'X-Deadline-Spent': ', '.join(f'{stage}={ms}' for stage, ms in report['spent_ms'].items()),
+        'X-Deadline-Remaining': str(report['remaining_ms']),
+        'Server-Timing': ', '.join([f'{stage};dur={ms}' for stage, ms in report['spent_ms'].items()]
+                                   + [f"total;dur={report['elapsed_ms']}"]),
+    }
+    if report['skipped']:
+        headers['X-Deadline-Skipped'] = ', '.join(report['skipped'])
+    prompt = report['notes'].get('prompt')
+    if prompt:
+        headers['X-LLM-Prompt-Tokens'] = str(prompt['tokens'])
+    if report['notes'].get('coalesced'):
+        headers['X-Coalesced'] = report['notes']['coalesced']
+    return headers
+
+
+def _scrape_url_steps(url, cfg, deadline):
+    """Steps: fetch and extract one recipe; returns (body, status, extraction_path)."""
+    with deadline.stage('fetch'):
+        page, fetch_err = yield FETCH, url, deadline
     if fetch_err:
-        return jsonify({"error": fetch_err[0]}), fetch_err[1]
+        return {"error": fetch_err[0]}, fetch_err[1], None
+
+    attempt = _ScrapeAttempt(page, url, cfg, deadline)
+    plan = yield CPU, attempt.strategies
+    llm_call = None
+    if (yield CPU, attempt.should_speculate, plan):
+        app.logger.info(f"No recipe markup on {url}; starting LLM extraction alongside the scrapers")
+        llm_call = yield from attempt.llm_call()
+    try:
+        for strategy in plan:
+            started = time.monotonic()
+            if strategy == PATH_LLM:
+                if llm_call is None and not attempt.llm_affordable():
+                    continue
+                with deadline.stage(PATH_LLM):
+                    llm_call = llm_call or (yield from attempt.llm_call())
+                    llm = (yield from llm_call.result()) if llm_call else None
+                started = llm_call.started if llm_call else started
+                result = (yield CPU, attempt.from_llm, llm) if llm else None
+            else:
+                result = yield CPU, attempt.run_local, strategy
+            yield CPU, attempt.record, strategy, result is not None, started
+            if result is not None:
+                return result, 200, strategy
+        return attempt.failure()
+    finally:
+        if llm_call:
+            llm_call.cancel()
 
-    scraper, scraper_err = _try_scraper(resp.text, url)
-    if scraper_err and not cfg['provider']:
-        return jsonify({"error": f"Could not find recipe data on this page: {scraper_err}"}), 422
 
-    raw_ingredients, result = _scraper_result(scraper) if scraper else ([], None)
+_TRACKING_PARAM_RE = re.compile(r'^(?:utm_\w+|fbclid|gclid|dclid|msclkid|igshid|mc_cid|mc_eid)$', re.IGNORECASE)
 
-    if not raw_ingredients and cfg['provider']:
-        app.logger.info(f"Falling back to LLM extraction for {url}")
-        llm = _llm_extract_recipe(resp.text, cfg)
-        if llm:
-            og_image = _extract_og_image(resp.text)
-            return jsonify(_llm_result(llm, scraper, og_image=og_image))
-        if not scraper:
-            return jsonify({"error": "Could not find recipe data on this page"}), 422
 
-    return jsonify(result)
+def _coalesce_key(url, cfg):
+    """Single-flight key: the URL without tracking parameters or fragment, plus a digest of the LLM config."""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if not _TRACKING_PARAM_RE.match(k))
+    port = parts.port if parts.port not in (None, {'http': 80, 'https': 443}.get(parts.scheme.lower())) else None
+    netloc = (parts.hostname or '').lower() + (f':{port}' if port else '')
+    normalised = urlunsplit((parts.scheme.lower(), netloc, parts.path or '/', urlencode(query), ''))
+    cfg_digest = hashlib.sha256(json.dumps(cfg, sort_keys=True).encode()).hexdigest()[:16]
+    return f'{normalised} {cfg_digest}'
 
 
-@app.route('/scrape-image', methods=['POST'])
-def scrape_image():
+def _domain_group(url):
+    """The domain_group metrics label for url (None for a photo)."""
+    if url is None:
+        return 'image'
+    host = _host_key(url)
+    if host in _METRICS_DOMAINS:
+        return host
+    return 'supported' if _scraper_path(url) == PATH_SCRAPER else 'other'
+
+
+def _observe_timings(deadline, url, path):
+    """Add a finished request's stage timings (and its total) to the /metrics histograms."""
+    _stage_metrics.observe(_domain_group(url), path or 'none', {**deadline.spent, 'total': deadline.elapsed()})
+
+
+def _scrape_url_shared_steps(url, cfg, deadline):
+    """Steps: _scrape_url_steps, sharing the result of an identical request already in flight.
+
+    A follower's wait is recorded as the 'coalesced' stage and noted (local or
+    remote) on its deadline; one that outwaits its own budget gets a 504.
+    """
+    if not _SINGLE_FLIGHT:
+        return (yield from _scrape_url_steps(url, cfg, deadline))
+    started = time.monotonic()
+    try:
+        (body, status, path), role = yield (
+            FLIGHT, _coalesce_key(url, cfg), _scrape_url_steps(url, cfg, deadline), deadline.remaining())
+    except FlightTimeout:
+        deadline.record('coalesced', time.monotonic() - started)
+        return {"error": "Timed out waiting for an identical import already in progress"}, 504, None
+    if role != LEADER:
+        deadline.record('coalesced', time.monotonic() - started)
+        deadline.note('coalesced', role)
+    return body, status, path
+
+
+@app.route('/scrape', methods=['POST'])
+def scrape():
     data = request.get_json(silent=True)
+    url, cfg, err = _scrape_request_args(data)
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    deadline = _request_deadline(request.headers)
+    body, status, headers = _run_steps(_scrape_steps(url, cfg, deadline, _wants_classification(data)))
+    return jsonify(body), status, headers
+
+
+def _scrape_steps(url, cfg, deadline, classify):
+    """Steps: a /scrape response as (body, status, headers)."""
+    body, status, path = yield from _scrape_url_shared_steps(url, cfg, deadline)
+    if classify:
+        body = yield from _classify_result_steps(body, status, deadline)
+    yield CPU, _observe_timings, deadline, url, path
+    headers = _deadline_headers(deadline)
+    if path:
+        app.logger.info(f"Scraped {url} via {path} ({headers['X-Deadline-Spent']})")
+        headers['X-Extraction-Path'] = path
+    return body, status, headers
+
+
+def _batch_request_args(data):
+    """Validate a /scrape-batch body; returns (urls, cfg, None) or (None, None, (error, status))."""
+    if not data or 'urls' not in data:
+        return None, None, ("Missing 'urls' in request body", 400)
+    urls = data['urls']
+    if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+        return None, None, ("'urls' must be a list of strings", 400)
+    if len(urls) > _BATCH_MAX_URLS:
+        return None, None, (f"At most {_BATCH_MAX_URLS} URLs per batch", 400)
+    return urls, _resolve_cfg(data.get('llm_config')), None
+
+
+def _host_key(url):
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def _batch_line(index, url, body, status, path=None):
+    """One NDJSON line of a /scrape-batch response."""
+    line = {"index": index, "url": url, "status": status}
+    if status == 200:
+        line["recipe"] = body
+        line["extraction_path"] = path
+    else:
+        line["error"] = body.get("error")
+    return json.dumps(line) + '\n'
+
+
+def _scrape_url_isolated_steps(url, cfg, budget=None):
+    """Steps: _scrape_url_shared_steps that never raises, so one bad site cannot fail a batch.
+
+    budget caps the URL's request budget (what is left of the batch's).
+    """
+    deadline = Deadline(_REQUEST_BUDGET if budget is None else min(_REQUEST_BUDGET, budget))
+    try:
+        body, status, path = yield from _scrape_url_shared_steps(url, cfg, deadline)
+    except Exception as e:
+        app.logger.exception(f"Unexpected error scraping {url}")
+        return {"error": f"Unexpected error scraping URL: {e}"}, 500, None
+    yield CPU, _observe_timings, deadline, url, path
+    return body, status, path
+
+
+def _scrape_batch(urls, cfg):
+    """Scrape urls concurrently, yielding NDJSON lines in completion order.
+
+    URLs are started in request order whenever a global slot is free and their
+    host is below its per-host cap, so a batch dominated by one site never
+    holds every slot while other sites wait. Once BATCH_BUDGET_SECONDS is
+    spent, the URLs not yet finished get a 504 line each, in request order.
+    """
+    batch = Deadline(_BATCH_BUDGET)
+    pending = []
+    for index, raw_url in enumerate(urls):
+        url, _, err = _scrape_request_args({'url': raw_url})
+        if err:
+            yield _batch_line(index, raw_url, {"error": err[0]}, err[1])
+        else:
+            pending.append((index, url))
+
+    per_host = Counter()
+    running = {}
+    pool = ThreadPoolExecutor(max_workers=_BATCH_CONCURRENCY)
+    try:
+        while pending or running:
+            waiting = []
+            for index, url in pending:
+                host = _host_key(url)
+                if len(running) < _BATCH_CONCURRENCY and per_host[host] < _BATCH_PER_HOST and batch.allows(1):
+                    per_host[host] += 1
+                    steps = _scrape_url_isolated_steps(url, cfg, batch.remaining())
+                    running[pool.submit(_run_steps, steps)] = (index, url, host)
+                else:
+                    waiting.append((index, url))
+            pending = waiting
+            if not running:
+                break
+
+            done, _ = wait(running, timeout=batch.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                index, url, host = running.pop(future)
+                per_host[host] -= 1
+                yield _batch_line(index, url, *future.result())
+    finally:
+        # Don't hold the response for imports that overran; their results are dropped.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    unfinished = sorted([(index, url) for index, url, _ in running.values()] + pending)
+    for index, url in unfinished:
+        yield _batch_line(index, url, {"error": "The batch ran out of time before this URL was imported"}, 504)
+
+
+@app.route('/scrape-batch', methods=['POST'])
+def scrape_batch():
+    """Import many recipe URLs; streams one NDJSON line per URL as each completes.
+
+    The whole batch must finish inside the sync worker timeout, so URLs still
+    unfinished after BATCH_BUDGET_SECONDS are answered with status 504; use
+    SCRAPER_MODE=async for batches that need longer.
+    """
+    urls, cfg, err = _batch_request_args(request.get_json(silent=True))
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    return Response(_scrape_batch(urls, cfg), mimetype='application/x-ndjson')
+
+
+def _image_request_args(data):
+    """Validate a /scrape-image body; returns (image_source, cfg, None) or (None, None, (error, status))."""
     if not data:
-        return jsonify({"error": "Missing request body"}), 400
+        return None, None, ("Missing request body", 400)
 
     cfg = _resolve_cfg(data.get('llm_config'))
     if not cfg['provider']:
-        return jsonify({"error": "LLM provider is not configured"}), 503
+        return None, None, ("LLM provider is not configured", 503)
 
     if 'image_url' in data:
         image_source = data['image_url'].strip()
         if not image_source.startswith(('http://', 'https://')):
-            return jsonify({"error": "image_url must start with http:// or https://"}), 400
+            return None, None, ("image_url must start with http:// or https://", 400)
     elif 'image' in data:
         image_b64 = data['image'].strip()
         if image_b64.startswith(DATA_URI_PREFIX):
@@ -425,13 +1712,337 @@ def scrape_image():
             media_type = data.get('media_type', 'image/jpeg')
             image_source = f"data:{media_type};base64,{image_b64}"
     else:
-        return jsonify({"error": "Provide either 'image_url' or 'image' in the request body"}), 400
+        return None, None, ("Provide either 'image_url' or 'image' in the request body", 400)
+    return image_source, cfg, None
+
+
+@app.route('/scrape-image', methods=['POST'])
+def scrape_image():
+    image_source, cfg, err = _image_request_args(request.get_json(silent=True))
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+
+    deadline = _request_deadline(request.headers)
+    body, status, headers = _run_steps(_scrape_image_steps(image_source, cfg, deadline))
+    return jsonify(body), status, headers
+
+
+def _scrape_image_steps(image_source, cfg, deadline):
+    """Steps: a /scrape-image response as (body, status, headers)."""
+    with deadline.stage('image'):
+        image_source, image_report = yield CPU, _prepare_image_source, image_source
+    with deadline.stage(PATH_LLM):
+        result = yield from _llm_extract_from_image_steps(image_source, cfg, deadline)
+    recipe = (yield CPU, functools.partial(_llm_result, result, None, deadline=deadline)) if result else None
+    yield CPU, _observe_timings, deadline, None, PATH_LLM if recipe else None
+    headers = _image_headers(deadline, image_report)
+    if not recipe:
+        return {"error": "Could not extract recipe from image"}, 422, headers
+    return recipe, 200, headers
+
+
+def _image_headers(deadline, image_report):
+    """/scrape-image response headers: the deadline report plus bytes saved by preprocessing."""
+    headers = _deadline_headers(deadline)
+    if image_report:
+        headers['X-Image-Bytes'] = f"{image_report['original_bytes']} -> {image_report['bytes']}"
+        headers['X-Image-Bytes-Saved'] = str(image_report['saved_bytes'])
+    return headers
+
+
+# ---------------------------------------------------------------------------
+# Streaming (server-sent events)
+# ---------------------------------------------------------------------------
+#
+# /scrape-stream and /scrape-image-stream take the same bodies as /scrape and
+# /scrape-image and answer with text/event-stream:
+#   event: field       {"name": "title", "value": ...}   a recipe field is complete
+#   event: ingredient  {"text", "parsed_name", "parsed_quantity"}   one more ingredient
+#   event: reset       {}   an LLM stream broke off; drop what it sent so far
+#   event: image       {"original_bytes", "bytes", ...}   image preprocessing report
+#   event: result      {"extraction_path", "recipe"}   the final recipe, as /scrape returns it
+#   event: error       {"error", "status"}
+# field and ingredient events are progressive; result is authoritative.
+
+_RECIPE_FIELDS = ('title', 'description', 'image', 'yields', 'total_time', 'instructions')
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_payload(line):
+    """Decoded JSON payload of one provider SSE line, or None for other lines and [DONE]."""
+    if not line or not line.startswith('data:'):
+        return None
+    data = line[5:].strip()
+    if not data or data == '[DONE]':
+        return None
+    try:
+        return _json_loads(data)
+    except ValueError:
+        return None
+
+
+def _openai_delta(event):
+    choices = event.get('choices') or [{}]
+    return (choices[0].get('delta') or {}).get('content')
+
+
+def _anthropic_delta(event):
+    if event.get('type') != 'content_block_delta':
+        return None
+    return event.get('delta', {}).get('text')
+
+
+def _gemini_delta(event):
+    candidates = event.get('candidates') or [{}]
+    parts = candidates[0].get('content', {}).get('parts') or []
+    return ''.join(part.get('text', '') for part in parts)
+
+
+def _llm_stream_request(messages, cfg, inlined_images=None):
+    """Streaming variant of _llm_request: (url, headers, json_body, extract_delta) or None.
+
+    extract_delta maps one decoded SSE payload to the text fragment it carries.
+    """
+    llm_request = _llm_request(messages, cfg, inlined_images)
+    if llm_request is None:
+        return None
+    url, headers, body, _ = llm_request
+    if cfg['provider'] == 'gemini':
+        return url.replace(':generateContent?', ':streamGenerateContent?alt=sse&'), headers, body, _gemini_delta
+    if cfg['provider'] == 'anthropic':
+        return url, headers, {**body, 'stream': True}, _anthropic_delta
+    return url, headers, {**body, 'stream': True}, _openai_delta
+
+
+def _llm_stream_steps(messages, cfg, events, timeout=_LLM_TIMEOUT, deadline=None):
+    """Steps: stream cfg's completion into events (a _RecipeEvents), yielding the SSE events it completes.
+
+    Fails over down the provider chain like _llm_chat_steps, but only until the
+    first fragment has arrived.
+    """
+    for link in _llm_chain(cfg):
+        if deadline and not deadline.allows(1):
+            deadline.skip(PATH_LLM)
+            return
+        inlined_images = yield from _inline_images_steps(messages, link, deadline)
+        llm_request = _llm_stream_request(messages, link, inlined_images)
+        if llm_request is None:
+            continue
+        url, headers, body, extract_delta = llm_request
+        call_timeout = deadline.timeout(timeout) if deadline else timeout
+        started = time.monotonic()
+        produced = False
+        lines = None
+        try:
+            lines = yield OPEN_LINES, url, headers, body, call_timeout
+            while (line := (yield READ_LINE, lines)) is not None:
+                payload = _sse_payload(line)
+                fragment = extract_delta(payload) if payload else None
+                if fragment:
+                    produced = True
+                    yield from (yield CPU, events.feed, fragment)
+                if deadline and not deadline.remaining():
+                    raise TimeoutError("request budget spent")
+        except Exception as e:
+            _record_llm_outcome(link, e, started)
+            if lines is not None:
+                yield CLOSE_LINES, lines
+            if produced:
+                return
+            continue
+        _record_llm_outcome(link, None, started)
+        return
+
+
+class _RecipeEvents:
+    """Turns a streamed LLM completion into field/ingredient events."""
+
+    def __init__(self):
+        self._parser = JsonFieldStream()
+        self._text = []
+        self.sent = False
+        self.parsed = {}   # ingredient line -> the parse already sent for it
+
+    def feed(self, fragment):
+        """SSE events completed by this fragment."""
+        self._text.append(fragment)
+        events = []
+        for kind, key, value in self._parser.feed(fragment):
+            if kind == ITEM and key == 'ingredients':
+                text = str(value)
+                if text not in self.parsed:
+                    self.parsed[text] = parse_ingredient_text(text)
+                events.append(_sse('ingredient', self.parsed[text]))
+            elif kind == FIELD and key in _RECIPE_FIELDS:
+                value = _normalise_llm_fields({key: value})[key]
+                events.append(_sse('field', {'name': key, 'value': value}))
+        self.sent = self.sent or bool(events)
+        return events
+
+    def result(self):
+        """The completed recipe object, or None if the stream broke off unparseable."""
+        if self._parser.complete:
+            return _normalise_llm_fields(dict(self._parser.fields))
+        try:
+            return _parse_llm_json(''.join(self._text).strip())
+        except (ValueError, AttributeError):
+            return None
+
+
+def _result_events(result, path):
+    """field/ingredient events for a finished result, then the result itself."""
+    for key in _RECIPE_FIELDS[:-1]:
+        yield _sse('field', {'name': key, 'value': result.get(key)})
+    for ingredient in result['ingredients']:
+        yield _sse('ingredient', ingredient)
+    yield _sse('field', {'name': 'instructions', 'value': result.get('instructions')})
+    yield _sse('result', {'extraction_path': path, 'recipe': result})
+
+
+def _scrape_stream_steps(url, cfg, deadline):
+    """Steps for /scrape-stream: _scrape_url_steps' strategy loop, with the LLM's answer streamed as it arrives."""
+    with deadline.stage('fetch'):
+        page, fetch_err = yield FETCH, url, deadline
+    if fetch_err:
+        yield CPU, _observe_timings, deadline, url, None
+        yield _sse('error', {'error': fetch_err[0], 'status': fetch_err[1]})
+        return
+
+    attempt = _ScrapeAttempt(page, url, cfg, deadline)
+    for strategy in (yield CPU, attempt.strategies):
+        started = time.monotonic()
+        if strategy == PATH_LLM:
+            if not attempt.llm_affordable() or not (yield CPU, attempt.llm_messages):
+                continue
+            events = _RecipeEvents()
+            with deadline.stage(PATH_LLM):
+                yield from _llm_stream_steps(attempt.llm_messages(), cfg, events, deadline=deadline)
+            llm = events.result()
+            result = (yield CPU, attempt.from_llm, llm, events.parsed) if llm else None
+            if result is None and events.sent:
+                yield _sse('reset', {})
+        else:
+            result = yield CPU, attempt.run_local, strategy
+        yield CPU, attempt.record, strategy, result is not None, started
+        if result is not None:
+            yield CPU, _observe_timings, deadline, url, strategy
+            if strategy == PATH_LLM:
+                # Fields and ingredients already went out as the model wrote them.
+                yield _sse('result', {'extraction_path': strategy, 'recipe': result})
+            else:
+                yield from _result_events(result, strategy)
+            return
+
+    body, status, path = attempt.failure()
+    yield CPU, _observe_timings, deadline, url, path
+    if status == 200:
+        yield from _result_events(body, path)
+    else:
+        yield _sse('error', {'error': body['error'], 'status': status})
+
+
+def _scrape_image_stream_steps(image_source, cfg, deadline):
+    """Steps for /scrape-image-stream: the vision model's answer streamed as it arrives."""
+    with deadline.stage('image'):
+        image_source, image_report = yield CPU, _prepare_image_source, image_source
+    if image_report:
+        yield _sse('image', image_report)
+    messages, vision_cfg = _vision_request(image_source, cfg)
+    events = _RecipeEvents()
+    with deadline.stage(PATH_LLM):
+        yield from _llm_stream_steps(messages, vision_cfg, events, timeout=_LLM_VISION_TIMEOUT, deadline=deadline)
+    llm = events.result()
+    result = functools.partial(_llm_result, llm, None, deadline=deadline, parsed=events.parsed)
+    recipe = (yield CPU, result) if llm else None
+    yield CPU, _observe_timings, deadline, None, PATH_LLM if recipe else None
+    if not recipe:
+        yield _sse('error', {'error': "Could not extract recipe from image", 'status': 422})
+        return
+    yield _sse('result', {'extraction_path': PATH_LLM, 'recipe': recipe})
+
+
+_SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+@app.route('/scrape-stream', methods=['POST'])
+def scrape_stream():
+    url, cfg, err = _scrape_request_args(request.get_json(silent=True))
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    deadline = _request_deadline(request.headers)
+    return Response(_stream_steps(_scrape_stream_steps(url, cfg, deadline)), mimetype='text/event-stream',
+                    headers=_SSE_HEADERS)
+
+
+@app.route('/scrape-image-stream', methods=['POST'])
+def scrape_image_stream():
+    image_source, cfg, err = _image_request_args(request.get_json(silent=True))
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    deadline = _request_deadline(request.headers)
+    return Response(_stream_steps(_scrape_image_stream_steps(image_source, cfg, deadline)),
+                    mimetype='text/event-stream', headers=_SSE_HEADERS)
+
+
+# ---------------------------------------------------------------------------
+# Warm-up
+# ---------------------------------------------------------------------------
+
+# A dummy recipe goes through recipe_scrapers, trafilatura and ingredient_parser
+# at import so no request pays their first-use cost (SCRAPER_WARMUP=0 skips
+# it). The Dockerfile starts gunicorn with --preload, so this runs once in the
+# master and the workers fork with the models already loaded.
+_WARMUP = os.environ.get('SCRAPER_WARMUP', '1').lower() in ('1', 'true', 'yes')
+_WARMUP_URL = 'https://example.com/recipes/buttered-toast'
+_WARMUP_HTML = """<!DOCTYPE html>
+<html><head><title>Buttered toast</title>
+<script type="application/ld+json">
+{"@context": "https://schema.org", "@type": "Recipe", "name": "Buttered toast",
+ "recipeYield": "1 serving", "totalTime": "PT5M",
+ "recipeIngredient": ["2 slices of white bread", "1 tbsp salted butter"],
+ "recipeInstructions": [{"@type": "HowToStep", "text": "Toast the bread until golden."},
+                        {"@type": "HowToStep", "text": "Spread with the butter while still warm."}]}
+</script></head>
+<body><article>
+<h1>Buttered toast</h1>
+<p>The simplest breakfast there is, and still one of the best when the bread is good and the butter is soft.</p>
+<h2>Ingredients</h2>
+<ul><li>2 slices of white bread</li><li>1 tbsp salted butter</li></ul>
+<h2>Method</h2>
+<ol><li>Toast the bread until golden on both sides.</li><li>Spread with the butter while still warm and serve.</li></ol>
+</article></body></html>
+"""
+
+
+def _warm_recipe_scrapers():
+    page = _as_page(_WARMUP_HTML)
+    if not _jsonld_result(page):
+        raise RuntimeError("JSON-LD Recipe not found in the warm-up page")
+    scraper, _ = _create_scraper(page, _WARMUP_URL)
+    _scraper_result(scraper)
+
+
+def _warm_trafilatura():
+    messages, _ = _llm_recipe_messages(_as_page(_WARMUP_HTML))
+    if not messages:
+        raise RuntimeError("no text extracted from the warm-up page")
+
+
+def _warm_ingredient_parser():
+    # parse_ingredient directly: parse_ingredient_text would swallow a failure to load the model.
+    parse_ingredient('2 slices of white bread')
 
-    result = _llm_extract_from_image(image_source, cfg)
-    if not result:
-        return jsonify({"error": "Could not extract recipe from image"}), 422
 
-    return jsonify(_llm_result(result, None))
+_warmup = Warmup()
+if _WARMUP:
+    _warmup.run([
+        ('recipe_scrapers', _warm_recipe_scrapers),
+        ('trafilatura', _warm_trafilatura),
+        ('ingredient_parser', _warm_ingredient_parser),
+    ])
 
 
 if __name__ == '__main__':
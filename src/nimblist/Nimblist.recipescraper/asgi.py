@@ -0,0 +1,372 @@
+"""
+Async (ASGI) serving mode for the recipe scraper.
+
+Serves the same endpoints as app.py, but page fetches, Gemini image fetches and
+LLM calls are awaited on one shared httpx.AsyncClient, and the CPU-bound steps
+(scrape_html, trafilatura, ingredient parsing) run in a thread pool executor so
+they never block the event loop. A single process can therefore hold hundreds
+of slow imports in flight instead of two.
+
+The request pipelines themselves are app.py's: its *_steps generators yield
+the I/O they need, and _AsyncIO performs it here with awaits where app.py's
+_BlockingIO blocks. Only the transport, single-flight and batch scheduling
+live in this module.
+
+Run with:
+    hypercorn --bind 0.0.0.0:5001 asgi:app
+"""
+
+import asyncio
+import functools
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from quart import Quart, request, jsonify
+
+import app as core
+from single_flight import COALESCED_LOCAL, COALESCED_REMOTE, DONE, GONE, LEADER, TAKEOVER, TIMEOUT, FlightTimeout
+
+# Thread pool for CPU-bound steps. Large ingredient batches still fan out to
+# the process pool configured in app.py (PARSE_POOL_WORKERS).
+_CPU_WORKERS = int(os.environ.get('ASYNC_CPU_WORKERS', str(min(32, (os.cpu_count() or 1) + 4))))
+# Upper bound on concurrent outbound connections (page fetches + LLM calls).
+_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', '200'))
+
+app = Quart(__name__)
+# Quart's default 60 s cap on sending a response would cut /scrape-batch streams short.
+app.config['RESPONSE_TIMEOUT'] = int(os.environ.get('ASYNC_RESPONSE_TIMEOUT', '900'))
+
+_cpu_executor = ThreadPoolExecutor(max_workers=_CPU_WORKERS, thread_name_prefix='scraper-cpu')
+_client: httpx.AsyncClient | None = None
+
+
+@app.before_serving
+async def _open_client():
+    global _client
+    _client = httpx.AsyncClient(
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=_MAX_CONNECTIONS, max_keepalive_connections=20),
+    )
+
+
+@app.after_serving
+async def _close_client():
+    await _client.aclose()
+
+
+async def _run_cpu(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_executor, functools.partial(fn, *args, **kwargs))
+
+
+# ---------------------------------------------------------------------------
+# Async transport
+# ---------------------------------------------------------------------------
+
+async def _fetch_page(url, deadline=None):
+    timeout = deadline.timeout(core._FETCH_TIMEOUT) if deadline else core._FETCH_TIMEOUT
+    try:
+        if timeout <= 0:
+            raise TimeoutError
+        async with _client.stream('GET', url, timeout=timeout, headers=core._FETCH_HEADERS) as resp:
+            resp.raise_for_status()
+            header_err = core._check_page_headers(resp.headers)
+            if header_err:
+                return None, (header_err, 422)
+            reader = core._PageReader(timeout)
+            async for chunk in resp.aiter_bytes(core._FETCH_CHUNK_BYTES):
+                if reader.feed(chunk):
+                    break
+            return core._Page(reader.text(resp.headers.get('content-type'))), None
+    except core._PageTooLarge as e:
+        return None, (str(e), 422)
+    except (httpx.TimeoutException, TimeoutError):
+        return None, ("Request timed out fetching the URL", 422)
+    except httpx.HTTPStatusError as e:
+        return None, core._page_status_error(e.response.status_code, e.response.reason_phrase)
+    except httpx.HTTPError as e:
+        return None, (f"Failed to fetch URL: {str(e)}", 422)
+
+
+async def _fetch_image_part(url, timeout=15):
+    try:
+        img_resp = await _client.get(url, timeout=timeout)
+        img_resp.raise_for_status()
+        return url, await _run_cpu(core._inline_image_part, img_resp.content, img_resp.headers.get('content-type'))
+    except Exception as e:
+        app.logger.warning(f"Failed to fetch image for Gemini: {e}")
+        return url, None
+
+
+async def _post_lines(url, headers, body, timeout):
+    async with _client.stream('POST', url, headers=headers, json=body, timeout=timeout) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            yield line
+
+
+class _AsyncIO:
+    """The operations of app.py's pipeline steps, awaited on the event loop; see app._BlockingIO."""
+
+    def __init__(self):
+        self._streams = []
+
+    async def fetch(self, url, deadline):
+        return await _fetch_page(url, deadline)
+
+    async def cpu(self, fn, *args):
+        return await _run_cpu(fn, *args)
+
+    async def images(self, urls, timeout):
+        fetched = await asyncio.gather(*(_fetch_image_part(url, timeout) for url in urls))
+        return {url: part for url, part in fetched if part}
+
+    async def post(self, url, headers, body, timeout):
+        resp = await _client.post(url, headers=headers, json=body, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def open_lines(self, url, headers, body, timeout):
+        lines = _post_lines(url, headers, body, timeout)
+        self._streams.append(lines)
+        return lines
+
+    async def read_line(self, lines):
+        return await anext(lines, None)
+
+    async def close_lines(self, lines):
+        await lines.aclose()
+
+    async def start(self, steps):
+        # A task of its own, so the losing call of a hedged extraction is cancelled, not left to finish.
+        return asyncio.create_task(_run_steps(steps))
+
+    async def wait(self, handles, timeout, return_when):
+        return await asyncio.wait(handles, timeout=timeout, return_when=return_when)
+
+    async def flight(self, key, steps, timeout):
+        return await _single_flight(key, lambda: _run_steps(steps), timeout)
+
+    async def release(self):
+        """Close any streamed reply the steps left open."""
+        for lines in self._streams:
+            await lines.aclose()
+
+
+async def _stream_steps(steps, outcome=None):
+    """Run app.py pipeline steps, awaiting their I/O; yields the SSE events they produce.
+
+    Their return value is appended to outcome.
+    """
+    io = _AsyncIO()
+    send, value = steps.send, None
+    try:
+        while True:
+            try:
+                item = send(value)
+            except StopIteration as stop:
+                if outcome is not None:
+                    outcome.append(stop.value)
+                return
+            if isinstance(item, str):
+                yield item
+                send, value = steps.send, None
+                continue
+            try:
+                send, value = steps.send, await getattr(io, item[0])(*item[1:])
+            except Exception as e:
+                send, value = steps.throw, e
+    finally:
+        steps.close()
+        await io.release()
+
+
+async def _run_steps(steps):
+    """Run app.py pipeline steps that produce no events; returns their return value."""
+    outcome = []
+    async for _ in _stream_steps(steps, outcome):
+        raise RuntimeError("pipeline steps produced events outside a stream")
+    return outcome[0]
+
+
+# ---------------------------------------------------------------------------
+# Single flight and batches
+# ---------------------------------------------------------------------------
+
+# In-flight computations in this process, by single-flight key. Each is a task
+# of its own, so a leader whose client disconnects doesn't cancel it for the
+# requests waiting on it.
+_flights = {}
+
+
+async def _run_shared_flight(key, fn, timeout):
+    """Async twin of SingleFlight._run_shared: lead via the lease store, or wait for another process."""
+    store = core._flights.store
+    give_up_at = time.monotonic() + timeout
+    while True:
+        token, leader = await _run_cpu(store.acquire, key)
+        if leader:
+            await _run_cpu(store.count, LEADER)
+            try:
+                value = await fn()
+            except BaseException:
+                await asyncio.shield(_run_cpu(store.release, key, token))
+                raise
+            await _run_cpu(store.publish, key, token, value)
+            return value, LEADER
+        while True:
+            state, value = await _run_cpu(store.poll, key, token)
+            if state == DONE:
+                await _run_cpu(store.count, COALESCED_REMOTE)
+                return value, COALESCED_REMOTE
+            if state == GONE:
+                await _run_cpu(store.count, TAKEOVER)
+                break
+            if time.monotonic() >= give_up_at:
+                await _run_cpu(store.count, TIMEOUT)
+                raise FlightTimeout
+            await asyncio.sleep(core._SINGLE_FLIGHT_POLL)
+
+
+async def _single_flight(key, fn, timeout):
+    """Async twin of SingleFlight.run; returns (value, role)."""
+    flight = _flights.get(key)
+    if flight is None:
+        flight = _flights[key] = asyncio.create_task(_run_shared_flight(key, fn, timeout))
+        flight.add_done_callback(lambda task: _flights.pop(key, None))
+        return await asyncio.shield(flight)
+    try:
+        value, _ = await asyncio.wait_for(asyncio.shield(flight), timeout)
+    except asyncio.TimeoutError:
+        await _run_cpu(core._flights.store.count, TIMEOUT)
+        raise FlightTimeout
+    await _run_cpu(core._flights.store.count, COALESCED_LOCAL)
+    return value, COALESCED_LOCAL
+
+
+async def _scrape_batch_item(index, raw_url, cfg, batch_slots, host_slots):
+    url, _, err = core._scrape_request_args({'url': raw_url})
+    if err:
+        return core._batch_line(index, raw_url, {"error": err[0]}, err[1])
+    # Take the host slot first so URLs queued behind a busy site don't hold global slots.
+    async with host_slots[core._host_key(url)], batch_slots:
+        body, status, path = await _run_steps(core._scrape_url_isolated_steps(url, cfg))
+    return core._batch_line(index, url, body, status, path)
+
+
+# ---------------------------------------------------------------------------
+# Routes
+# ---------------------------------------------------------------------------
+
+@app.route('/health', methods=['GET'])
+async def health():
+    body, status = await _run_cpu(core._health)
+    return jsonify(body), status
+
+
+@app.route('/strategies', methods=['GET'])
+async def strategies():
+    domain = request.args.get('domain')
+    return jsonify(await _run_cpu(core._strategy_memory.stats, core._host_key(f'//{domain}') if domain else None))
+
+
+@app.route('/llm-providers', methods=['GET'])
+async def llm_providers():
+    return jsonify(core._llm_providers_status())
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return await _run_cpu(core._stage_metrics.render), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+
+@app.route('/coalescing', methods=['GET'])
+async def coalescing():
+    return jsonify(await _run_cpu(core._flights.store.stats))
+
+
+@app.route('/parse-ingredients', methods=['POST'])
+async def parse_ingredients_endpoint():
+    data = await request.get_json(silent=True)
+    texts, err = core._ingredients_request_args(data)
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    return jsonify(await _run_steps(core._parse_ingredients_steps(texts, core._wants_classification(data))))
+
+
+@app.route('/scrape', methods=['POST'])
+async def scrape():
+    data = await request.get_json(silent=True)
+    url, cfg, err = core._scrape_request_args(data)
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    deadline = core._request_deadline(request.headers)
+    body, status, headers = await _run_steps(core._scrape_steps(url, cfg, deadline, core._wants_classification(data)))
+    return jsonify(body), status, headers
+
+
+@app.route('/scrape-batch', methods=['POST'])
+async def scrape_batch():
+    """Import many recipe URLs; streams one NDJSON line per URL as each completes."""
+    urls, cfg, err = core._batch_request_args(await request.get_json(silent=True))
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+
+    async def stream():
+        batch_slots = asyncio.Semaphore(core._BATCH_CONCURRENCY)
+        host_slots = defaultdict(lambda: asyncio.Semaphore(core._BATCH_PER_HOST))
+        tasks = [
+            asyncio.create_task(_scrape_batch_item(i, u, cfg, batch_slots, host_slots))
+            for i, u in enumerate(urls)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield (await next_done).encode()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return stream(), 200, {'Content-Type': 'application/x-ndjson'}
+
+
+@app.route('/scrape-image', methods=['POST'])
+async def scrape_image():
+    image_source, cfg, err = core._image_request_args(await request.get_json(silent=True))
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+
+    deadline = core._request_deadline(request.headers)
+    body, status, headers = await _run_steps(core._scrape_image_steps(image_source, cfg, deadline))
+    return jsonify(body), status, headers
+
+
+# ---------------------------------------------------------------------------
+# Streaming (server-sent events); see the matching section of app.py
+# ---------------------------------------------------------------------------
+
+_SSE_HEADERS = {**core._SSE_HEADERS, 'Content-Type': 'text/event-stream'}
+
+
+@app.route('/scrape-stream', methods=['POST'])
+async def scrape_stream():
+    url, cfg, err = core._scrape_request_args(await request.get_json(silent=True))
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    deadline = core._request_deadline(request.headers)
+    return _stream_steps(core._scrape_stream_steps(url, cfg, deadline)), 200, _SSE_HEADERS
+
+
+@app.route('/scrape-image-stream', methods=['POST'])
+async def scrape_image_stream():
+    image_source, cfg, err = core._image_request_args(await request.get_json(silent=True))
+    if err:
+        return jsonify({"error": err[0]}), err[1]
+    deadline = core._request_deadline(request.headers)
+    return _stream_steps(core._scrape_image_stream_steps(image_source, cfg, deadline)), 200, _SSE_HEADERS
+
+
+if __name__ == '__main__':
+    app.run(debug=True, host=os.environ.get('FLASK_HOST', '127.0.0.1'), port=5001)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the LLM providers, for benchmarking the recipe scraper.
+
+Speaks the three wire formats app.py uses, each with and without streaming:
+    POST /v1/chat/completions, /api/v1/chat/completions   OpenAI-compatible
+                                                           (openai, openrouter, ollama)
+    POST /v1/messages                                      Anthropic
+    POST /v1beta/models/<model>:generateContent            Gemini
+    POST /v1beta/models/<model>:streamGenerateContent      Gemini, SSE
+and answers every request with the same recipe JSON after a configurable
+delay. GET /stats returns how many calls each format received.
+
+Point the scraper at it with OPENROUTER_BASE_URL / OPENAI_BASE_URL /
+ANTHROPIC_BASE_URL / GEMINI_BASE_URL / OLLAMA_BASE_URL (run.py does this).
+
+Usage:
+    python bench/fake_llm.py --port 8090 --latency-ms 800 --jitter-ms 200
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = {
+    "title": "Benchmark beef and ale stew",
+    "description": "A slow-cooked stew used as the canned reply of the benchmark LLM.",
+    "yields": "6 servings",
+    "total_time": 180,
+    "ingredients": [
+        "1kg braising steak, cut into chunks",
+        "2 tbsp plain flour",
+        "3 tbsp olive oil",
+        "2 onions, chopped",
+        "3 carrots, cut into thick slices",
+        "2 celery sticks, sliced",
+        "3 garlic cloves, crushed",
+        "1 tbsp tomato purée",
+        "500ml ale",
+        "400ml beef stock",
+        "2 bay leaves",
+        "a few thyme sprigs",
+        "250g chestnut mushrooms, halved",
+        "salt and black pepper",
+    ],
+    "instructions": "Heat the oven to 160C.\nToss the beef in the flour and brown it in batches in the oil.\n"
+                    "Soften the onions, carrots and celery, then add the garlic and tomato purée.\n"
+                    "Return the beef, pour in the ale and stock, add the herbs and bring to a simmer.\n"
+                    "Cover and cook in the oven for 2 hours, adding the mushrooms for the last 30 minutes.\n"
+                    "Season and serve.",
+}
+
+# Characters per streamed fragment; roughly what providers send per SSE event.
+_STREAM_CHUNK = 12
+
+
+class FakeLLM:
+    """Reply text, timing and call counters shared by all request handlers."""
+
+    def __init__(self, latency_ms=800, jitter_ms=0, token_ms=0, error_rate=0.0, reply=None):
+        # latency_ms (+ up to jitter_ms) passes before the first byte of the
+        # answer; token_ms is the pause between streamed fragments.
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.error_rate = error_rate
+        self.reply = json.dumps(reply or REPLY)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def wait(self):
+        time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000)
+
+    def fails(self):
+        return self.error_rate and random.random() < self.error_rate
+
+
+def _chunks(text):
+    return [text[i:i + _STREAM_CHUNK] for i in range(0, len(text), _STREAM_CHUNK)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    llm: FakeLLM = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._json(200, self.llm.stats())
+        else:
+            self._json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._json(400, {'error': 'invalid JSON'})
+        path = self.path.split('?', 1)[0]
+        if path.endswith('/chat/completions'):
+            wire = 'openai'
+        elif path == '/v1/messages':
+            wire = 'anthropic'
+        elif path.startswith('/v1beta/models/') and ':' in path:
+            wire = 'gemini'
+        else:
+            return self._json(404, {'error': f'unknown endpoint {path}'})
+        stream = body.get('stream') or path.endswith(':streamGenerateContent')
+        self.llm.count(f"{wire}{'_stream' if stream else ''}")
+
+        self.llm.wait()
+        if self.llm.fails():
+            return self._json(503, {'error': 'simulated upstream failure'})
+        text = self.llm.reply
+        if not stream:
+            return self._json(200, _complete(wire, text))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        for i, chunk in enumerate(_chunks(text)):
+            if i and self.llm.token_ms:
+                time.sleep(self.llm.token_ms / 1000)
+            self.wfile.write(f"data: {json.dumps(_delta(wire, chunk))}\n\n".encode())
+            self.wfile.flush()
+        if wire == 'openai':
+            self.wfile.write(b"data: [DONE]\n\n")
+        elif wire == 'anthropic':
+            self.wfile.write(b'data: {"type": "message_stop"}\n\n')
+
+    def _json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _complete(wire, text):
+    if wire == 'anthropic':
+        return {'type': 'message', 'role': 'assistant', 'content': [{'type': 'text', 'text': text}]}
+    if wire == 'gemini':
+        return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}}]}
+    return {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}}]}
+
+
+def _delta(wire, chunk):
+    if wire == 'anthropic':
+        return {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': chunk}}
+    if wire == 'gemini':
+        return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': chunk}]}}]}
+    return {'choices': [{'index': 0, 'delta': {'content': chunk}}]}
+
+
+def serve(llm, host='127.0.0.1', port=0):
+    """Start the server on a daemon thread; returns the ThreadingHTTPServer (server_address has the port)."""
+    handler = type('FakeLLMHandler', (_Handler,), {'llm': llm})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='fake-llm').start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake LLM provider for recipe scraper benchmarks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=800,
+                        help="Delay before each answer starts (default: 800)")
+    parser.add_argument('--jitter-ms', type=float, default=0,
+                        help="Random extra delay, uniform in [0, jitter] (default: 0)")
+    parser.add_argument('--token-ms', type=float, default=0,
+                        help="Pause between streamed fragments (default: 0)")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Share of calls answered with a 503 (default: 0)")
+    args = parser.parse_args()
+
+    server = serve(FakeLLM(args.latency_ms, args.jitter_ms, args.token_ms, args.error_rate), args.host, args.port)
+    print(f"Fake LLM listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
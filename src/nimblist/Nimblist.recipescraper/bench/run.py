@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the recipe scraper.
+
+Serves the saved pages in bench/corpus over a local HTTP server, starts the
+fake LLM (fake_llm.py) in place of the real providers, starts the scraper
+(gunicorn in sync mode or hypercorn in async mode, as the Dockerfile does)
+pointed at both, and drives /scrape, /scrape-image and /parse-ingredients at
+the given concurrency. Nothing leaves the machine, so runs are repeatable.
+
+Reports, per workload: throughput, latency percentiles (overall and per
+extraction path) and per-stage latency percentiles from the Server-Timing
+header; plus the scraper's peak RSS and how many calls the fake LLM served.
+
+Usage (from src/nimblist/Nimblist.recipescraper):
+    python bench/run.py --mode sync --concurrency 8 --requests 100 --save-baseline bench/baseline.json
+    python bench/run.py --mode sync --concurrency 8 --requests 100 --compare bench/baseline.json
+
+--compare exits with status 1 when throughput, a latency percentile or peak
+RSS is worse than the baseline by more than --tolerance.
+"""
+
+import argparse
+import base64
+import functools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import requests
+except ImportError:
+    print("ERROR: 'requests' is not installed. Run: pip install requests")
+    sys.exit(1)
+
+import fake_llm
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPER_DIR = os.path.dirname(BENCH_DIR)
+CORPUS_DIR = os.path.join(BENCH_DIR, 'corpus')
+WORKLOADS = ('scrape', 'scrape-image', 'parse-ingredients')
+# Stage timings below this are noise; they are not compared against the baseline.
+_MIN_COMPARED_MS = 5
+
+
+# ---------------------------------------------------------------------------
+# Servers
+# ---------------------------------------------------------------------------
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def _serve_corpus():
+    handler = functools.partial(_QuietHandler, directory=os.path.join(CORPUS_DIR, 'pages'))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='corpus').start()
+    return server
+
+
+def _scraper_env(args, llm_url, state_dir):
+    env = dict(os.environ)
+    env.update({
+        'LLM_PROVIDER': args.provider,
+        'LLM_MODEL': 'bench-model',
+        'LLM_VISION_MODEL': 'bench-vision-model',
+        'OPENROUTER_API_KEY': 'bench',
+        'LLM_FALLBACKS': '',
+        'LLM_HEDGE_PROVIDER': '',
+        'OLLAMA_BASE_URL': llm_url,
+        'OPENROUTER_BASE_URL': f'{llm_url}/api',
+        'OPENAI_BASE_URL': llm_url,
+        'ANTHROPIC_BASE_URL': llm_url,
+        'GEMINI_BASE_URL': llm_url,
+        'SCRAPER_STATE_DIR': state_dir,
+        # Identical requests would otherwise share one result and flatter throughput.
+        'SINGLE_FLIGHT': '1' if args.coalesce else '0',
+        # Every corpus page is on the same host; without this the strategy
+        # memory would learn one winner for all of them and skip the others'
+        # natural path (e.g. send JSON-LD pages straight to the LLM).
+        'STRATEGY_EXPLORE_RATE': '1',
+    })
+    return env
+
+
+def _start_scraper(args, env):
+    bind = f'127.0.0.1:{args.port}'
+    if args.mode == 'async':
+        cmd = ['hypercorn', '--bind', bind, '--workers', str(args.workers), 'asgi:app']
+    else:
+        cmd = ['gunicorn', '--preload', '--bind', bind, '--workers', str(args.workers), '--timeout', '60', 'app:app']
+    return subprocess.Popen(cmd, cwd=SCRAPER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _wait_ready(base_url, timeout):
+    """Seconds until /health answered 200, or None if it never did (the last report is printed)."""
+    started = time.monotonic()
+    last = None
+    while time.monotonic() - started < timeout:
+        try:
+            resp = requests.get(f'{base_url}/health', timeout=2)
+            if resp.status_code == 200:
+                return time.monotonic() - started
+            last = resp.json()
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(0.2)
+    if last is None:
+        raise SystemExit(f"Scraper at {base_url} did not answer /health within {timeout:.0f}s")
+    print(f"WARNING: scraper is up but not warm; benchmarking anyway. /health: {json.dumps(last)}")
+    return None
+
+
+class _RssSampler:
+    """Peak resident set size of a process and its children, sampled from /proc (Linux only)."""
+
+    def __init__(self, pid, interval=0.1):
+        self._pid = pid
+        self._interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='rss')
+
+    def __enter__(self):
+        if os.path.isdir('/proc'):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self.peak_bytes = max(self.peak_bytes, sum(_rss(pid) for pid in _process_tree(self._pid)))
+
+
+def _process_tree(root):
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, todo = [], [root]
+    while todo:
+        pid = todo.pop()
+        tree.append(pid)
+        todo.extend(children.get(pid, []))
+    return tree
+
+
+def _rss(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Workloads
+# ---------------------------------------------------------------------------
+
+def _scrape_requests(corpus_url, n):
+    pages = sorted(os.listdir(os.path.join(CORPUS_DIR, 'pages')))
+    return [('/scrape', {'url': f'{corpus_url}/{pages[i % len(pages)]}'}) for i in range(n)]
+
+
+def _image_requests(n):
+    images_dir = os.path.join(CORPUS_DIR, 'images')
+    bodies = []
+    for name in sorted(os.listdir(images_dir)):
+        with open(os.path.join(images_dir, name), 'rb') as f:
+            media_type = 'image/png' if name.endswith('.png') else 'image/jpeg'
+            bodies.append({'image': base64.b64encode(f.read()).decode(), 'media_type': media_type})
+    return [('/scrape-image', bodies[i % len(bodies)]) for i in range(n)]
+
+
+def _ingredient_requests(n, batch):
+    with open(os.path.join(CORPUS_DIR, 'ingredients.txt')) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return [('/parse-ingredients', {'ingredients': [lines[(i * batch + j) % len(lines)] for j in range(batch)]})
+            for i in range(n)]
+
+
+def _server_timing(header):
+    """{stage: ms} from a Server-Timing header."""
+    stages = {}
+    for entry in filter(None, (e.strip() for e in (header or '').split(','))):
+        name, _, params = entry.partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'dur':
+                try:
+                    stages[name.strip()] = float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+def _one(session, base_url, path, body):
+    started = time.monotonic()
+    try:
+        resp = session.post(f'{base_url}{path}', json=body, timeout=120)
+        status = resp.status_code
+        headers = resp.headers
+    except requests.RequestException:
+        status, headers = 'error', {}
+    return {
+        'status': status,
+        'ms': (time.monotonic() - started) * 1000,
+        'path': headers.get('X-Extraction-Path'),
+        'stages': _server_timing(headers.get('Server-Timing')),
+    }
+
+
+def _run_workload(base_url, calls, concurrency):
+    local = threading.local()
+
+    def call(item):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return _one(local.session, base_url, *item)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, calls))
+    return results, time.monotonic() - started
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 1)
+
+    return {'p50': pct(50), 'p90': pct(90), 'p99': pct(99), 'max': round(ordered[-1], 1),
+            'mean': round(statistics.fmean(ordered), 1)}
+
+
+def _summarise(results, wall):
+    statuses = {}
+    by_path, by_stage = {}, {}
+    for r in results:
+        statuses[str(r['status'])] = statuses.get(str(r['status']), 0) + 1
+        if r['path']:
+            by_path.setdefault(r['path'], []).append(r['ms'])
+        for stage, ms in r['stages'].items():
+            by_stage.setdefault(stage, []).append(ms)
+    ok = [r['ms'] for r in results if r['status'] == 200]
+    return {
+        'requests': len(results),
+        'ok': len(ok),
+        'statuses': statuses,
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(results) / wall, 2) if wall else None,
+        'latency_ms': _percentiles([r['ms'] for r in results]),
+        'latency_by_path_ms': {path: _percentiles(ms) for path, ms in sorted(by_path.items())},
+        'stages_ms': {stage: _percentiles(ms) for stage, ms in sorted(by_stage.items())},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def _print_report(report):
+    meta = report['meta']
+    startup = f"{report['startup_s']}s" if report['startup_s'] is not None else 'not warm'
+    print(f"\nmode={meta['mode']} provider={meta['provider']} concurrency={meta['concurrency']} "
+          f"llm_latency={meta['llm_latency_ms']}ms startup={startup} "
+          f"peak_rss={report['peak_rss_mb']}MB llm_calls={report['llm_calls']}")
+    for name, w in report['workloads'].items():
+        lat = w['latency_ms'] or {}
+        print(f"\n{name}: {w['requests']} requests, {w['ok']} ok {w['statuses']}, "
+              f"{w['throughput_rps']} req/s, latency p50={lat.get('p50')} p90={lat.get('p90')} p99={lat.get('p99')} ms")
+        for path, p in w['latency_by_path_ms'].items():
+            print(f"  path {path:<18} p50={p['p50']:>8} p90={p['p90']:>8} p99={p['p99']:>8} ms")
+        for stage, p in w['stages_ms'].items():
+            print(f"  stage {stage:<17} p50={p['p50']:>8} p90={p['p90']:>8} p99={p['p99']:>8} ms")
+
+
+def _regressions(report, baseline, tolerance):
+    """Human-readable list of figures that got worse than the baseline by more than tolerance."""
+    found = []
+
+    def worse(label, current, base, higher_is_worse=True):
+        if current is None or not base:
+            return
+        change = (current - base) / base if higher_is_worse else (base - current) / base
+        if change > tolerance:
+            found.append(f"{label}: {base} -> {current} ({change:+.0%})")
+
+    for name, w in report['workloads'].items():
+        b = baseline.get('workloads', {}).get(name)
+        if not b:
+            continue
+        worse(f"{name} throughput_rps", w['throughput_rps'], b['throughput_rps'], higher_is_worse=False)
+        for p in ('p50', 'p90'):
+            worse(f"{name} latency {p}", (w['latency_ms'] or {}).get(p), (b['latency_ms'] or {}).get(p))
+        for stage, s in w['stages_ms'].items():
+            bs = b.get('stages_ms', {}).get(stage)
+            if bs and bs['p90'] >= _MIN_COMPARED_MS:
+                worse(f"{name} stage {stage} p90", s['p90'], bs['p90'])
+    worse('peak_rss_mb', report['peak_rss_mb'], baseline.get('peak_rss_mb'))
+    return found
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRAPER_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline recipe scraper benchmark")
+    parser.add_argument('--mode', choices=('sync', 'async'), default='sync',
+                        help="Serving mode to start: gunicorn (sync) or hypercorn (async) (default: sync)")
+    parser.add_argument('--workers', type=int, default=2, help="Server worker processes (default: 2)")
+    parser.add_argument('--port', type=int, default=5091, help="Port for the scraper under test (default: 5091)")
+    parser.add_argument('--target', help="Benchmark an already running scraper at this URL instead of starting one "
+                                         "(it must be configured to use the printed fake LLM URL)")
+    parser.add_argument('--provider', choices=('openai', 'openrouter', 'ollama', 'anthropic', 'gemini'),
+                        default='openai', help="Wire format the scraper uses to reach the fake LLM (default: openai)")
+    parser.add_argument('--workloads', default=','.join(WORKLOADS),
+                        help=f"Comma-separated subset of {', '.join(WORKLOADS)} (default: all)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight at once (default: 8)")
+    parser.add_argument('--requests', type=int, default=50, help="Requests per workload (default: 50)")
+    parser.add_argument('--ingredient-batch', type=int, default=20,
+                        help="Ingredient lines per /parse-ingredients request (default: 20)")
+    parser.add_argument('--llm-latency-ms', type=float, default=800, help="Fake LLM delay per call (default: 800)")
+    parser.add_argument('--llm-jitter-ms', type=float, default=200, help="Fake LLM random extra delay (default: 200)")
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help="Share of fake LLM calls that 503")
+    parser.add_argument('--coalesce', action='store_true',
+                        help="Leave single-flight coalescing of identical requests on")
+    parser.add_argument('--startup-timeout', type=float, default=120, help="Seconds to wait for /health")
+    parser.add_argument('--output', help="Write the full report as JSON to this file")
+    parser.add_argument('--save-baseline', help="Write the report to this file as the new baseline")
+    parser.add_argument('--compare', help="Baseline JSON to compare against; exit 1 on regression")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Allowed relative regression before --compare fails (default: 0.15)")
+    args = parser.parse_args()
+    workloads = [w.strip() for w in args.workloads.split(',') if w.strip()]
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+
+    llm = fake_llm.FakeLLM(args.llm_latency_ms, args.llm_jitter_ms, error_rate=args.llm_error_rate)
+    llm_server = fake_llm.serve(llm)
+    llm_url = f'http://127.0.0.1:{llm_server.server_address[1]}'
+    corpus_server = _serve_corpus()
+    corpus_url = f'http://127.0.0.1:{corpus_server.server_address[1]}'
+    print(f"Corpus on {corpus_url}, fake LLM on {llm_url}")
+
+    proc = None
+    state_dir = tempfile.mkdtemp(prefix='scraper-bench-')
+    if args.target:
+        base_url = args.target.rstrip('/')
+    else:
+        base_url = f'http://127.0.0.1:{args.port}'
+        proc = _start_scraper(args, _scraper_env(args, llm_url, state_dir))
+    try:
+        startup = _wait_ready(base_url, args.startup_timeout)
+        calls = {
+            'scrape': lambda: _scrape_requests(corpus_url, args.requests),
+            'scrape-image': lambda: _image_requests(args.requests),
+            'parse-ingredients': lambda: _ingredient_requests(args.requests, args.ingredient_batch),
+        }
+        results = {}
+        with _RssSampler(proc.pid if proc else os.getpid()) as rss:
+            for name in workloads:
+                print(f"Running {name} ({args.requests} requests, concurrency {args.concurrency}) ...")
+                results[name] = _summarise(*_run_workload(base_url, calls[name](), args.concurrency))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=30)
+        llm_server.shutdown()
+        corpus_server.shutdown()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'mode': 'external' if args.target else args.mode,
+            'workers': None if args.target else args.workers,
+            'provider': args.provider,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'llm_latency_ms': args.llm_latency_ms,
+            'llm_jitter_ms': args.llm_jitter_ms,
+            'coalesce': args.coalesce,
+        },
+        'startup_s': round(startup, 2) if startup is not None else None,
+        'peak_rss_mb': round(rss.peak_bytes / 2 ** 20, 1) if proc and rss.peak_bytes else None,
+        'llm_calls': llm.stats(),
+        'workloads': results,
+    }
+    _print_report(report)
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        differing = [key for key in ('mode', 'workers', 'provider', 'concurrency', 'requests', 'llm_latency_ms', 'cpus')
+                     if baseline.get('meta', {}).get(key) != report['meta'][key]]
+        if differing:
+            print(f"\nWARNING: baseline was recorded with different settings ({', '.join(differing)}); "
+                  "the comparison is not like for like")
+        regressions = _regressions(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\nREGRESSIONS against {args.compare} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
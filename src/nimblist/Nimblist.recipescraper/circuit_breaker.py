@@ -0,0 +1,103 @@
+"""
+Circuit breakers for the upstream LLM providers.
+
+Each (provider, model) gets a breaker that watches its recent calls. When too
+many of them fail, or crawl past the slow-call threshold, the breaker opens and
+the provider is skipped outright instead of every import waiting out its
+timeout. After a cooldown one health probe is let through (half-open); the
+breaker closes again on success and re-opens on failure. Only the probe's own
+outcome moves a half-open breaker; live calls still in flight from before it
+closed are ignored, so a straggler cannot pre-empt the probe.
+
+State is per process: each gunicorn worker learns about an outage from its own
+calls, which takes only min_calls requests.
+"""
+
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Error-rate and slow-call-rate breaker over a sliding window of calls."""
+
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5,
+                 slow_call_seconds=20.0, slow_call_rate=0.8, cooldown=30.0):
+        # The breaker trips once the window holds at least min_calls outcomes
+        # and either the failure share or the slow-call share reaches its rate.
+        self.name = name
+        self._calls = deque(maxlen=window)   # (ok, slow) per call
+        self._min_calls = min_calls
+        self._failure_rate = failure_rate
+        self._slow_call_seconds = slow_call_seconds
+        self._slow_call_rate = slow_call_rate
+        self._cooldown = cooldown
+        self._state = CLOSED
+        self._opened_at = None
+        self._closed_at = None
+        self._last_probe = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True when calls may go to this provider (only while closed)."""
+        with self._lock:
+            return self._state == CLOSED
+
+    def start_probe(self):
+        """Claim the single health probe for an open breaker whose cooldown has
+        passed; True means the caller must probe and report via record_probe()."""
+        with self._lock:
+            if self._state != OPEN or time.monotonic() - self._opened_at < self._cooldown:
+                return False
+            self._state = HALF_OPEN
+            self._last_probe = time.time()
+            return True
+
+    def record(self, ok, elapsed):
+        """Feed one live call outcome; elapsed is in seconds. Calls that finish
+        while the breaker is not closed, or that started before it last closed,
+        are dropped."""
+        with self._lock:
+            if self._state != CLOSED:
+                return
+            if self._closed_at is not None and time.monotonic() - elapsed < self._closed_at:
+                return
+            self._calls.append((ok, elapsed >= self._slow_call_seconds))
+            if len(self._calls) >= self._min_calls:
+                failures = sum(1 for ok_, _ in self._calls if not ok_) / len(self._calls)
+                slow = sum(1 for _, slow_ in self._calls if slow_) / len(self._calls)
+                if failures >= self._failure_rate or slow >= self._slow_call_rate:
+                    self._trip()
+
+    def record_probe(self, ok):
+        """Feed the health probe's outcome: close on success, re-open on failure."""
+        with self._lock:
+            if self._state != HALF_OPEN:
+                return
+            if ok:
+                self._state = CLOSED
+                self._closed_at = time.monotonic()
+                self._calls.clear()
+            else:
+                self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            calls = len(self._calls)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'calls': calls,
+                'failure_rate': round(sum(1 for ok, _ in self._calls if not ok) / calls, 3) if calls else None,
+                'slow_call_rate': round(sum(1 for _, slow in self._calls if slow) / calls, 3) if calls else None,
+                'open_for_seconds': round(time.monotonic() - self._opened_at, 1) if self._state != CLOSED else None,
+                'last_probe': self._last_probe,
+            }
@@ -0,0 +1,66 @@
+"""
+End-to-end time budget for one scrape request.
+
+A Deadline is created when a request arrives and handed down the pipeline.
+Every stage sizes its own timeout from what is left (timeout()), optional
+stages check allows() before starting, and stage() records how long each step
+took so the response can report where the budget went; note() keeps other
+per-stage figures (such as the LLM prompt size) for the same report.
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class Deadline:
+
+    def __init__(self, budget_seconds):
+        self.budget = budget_seconds
+        self._started = time.monotonic()
+        self._expires_at = self._started + budget_seconds
+        self.spent = {}      # stage -> seconds, in the order stages first ran
+        self.skipped = []    # optional stages dropped for lack of budget
+        self.notes = {}
+
+    def remaining(self):
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self._started
+
+    def timeout(self, cap):
+        """A stage's own timeout (cap) trimmed to the budget that is left."""
+        return min(cap, self.remaining())
+
+    def allows(self, seconds):
+        """Whether at least `seconds` of budget remain."""
+        return self.remaining() >= seconds
+
+    def note(self, name, value):
+        self.notes[name] = value
+
+    def skip(self, stage):
+        if stage not in self.skipped:
+            self.skipped.append(stage)
+
+    def record(self, name, seconds):
+        """Add seconds to a stage's time (for time not measured by stage())."""
+        self.spent[name] = self.spent.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started)
+
+    def report(self):
+        return {
+            'budget_ms': round(self.budget * 1000),
+            'remaining_ms': round(self.remaining() * 1000),
+            'elapsed_ms': round(self.elapsed() * 1000),
+            'spent_ms': {name: round(seconds * 1000) for name, seconds in self.spent.items()},
+            'skipped': list(self.skipped),
+            'notes': dict(self.notes),
+        }
@@ -0,0 +1,77 @@
+"""
+Shrink recipe photos before they are sent to a vision model.
+
+A 12 MP phone photo is several megabytes of base64 in the provider request,
+yet the models downscale anything past roughly 1.5k pixels on the long edge
+before reading it. prepare_image() decodes the photo, applies its EXIF
+rotation, downsizes it, drops colour when the picture is effectively
+monochrome (a printed recipe, a handwritten card) and re-encodes it at the
+highest quality that fits the target size. If that doesn't make the image
+smaller, or Pillow can't read it, the original bytes are kept.
+"""
+
+import io
+import logging
+
+try:
+    from PIL import Image, ImageChops, ImageOps, ImageStat
+except ImportError:  # preprocessing is an optimisation; without Pillow images pass through untouched
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+_QUALITY_STEPS = (85, 75, 65, 55, 45)
+# Mean per-pixel spread between the RGB channels below which a photo is treated as monochrome.
+_GRAYSCALE_MAX_CHROMA = 6.0
+_FORMATS = {'jpeg': ('JPEG', 'image/jpeg'), 'webp': ('WEBP', 'image/webp')}
+
+
+def _chroma(rgb_sample):
+    """Mean of max(r, g, b) - min(r, g, b) over the pixels of a small RGB sample."""
+    r, g, b = rgb_sample.split()
+    spread = ImageChops.difference(ImageChops.lighter(ImageChops.lighter(r, g), b),
+                                   ImageChops.darker(ImageChops.darker(r, g), b))
+    return ImageStat.Stat(spread).mean[0]
+
+
+def prepare_image(data, media_type, max_dimension=1568, target_bytes=500_000, fmt='jpeg'):
+    """Return (bytes, media_type, report) for a photo about to go to a vision model.
+
+    report is {'original_bytes', 'bytes', 'saved_bytes', 'reencoded', 'width',
+    'height', 'grayscale'}, or None when Pillow is missing or could not decode
+    the image (the original bytes are returned either way).
+    """
+    if Image is None:
+        return data, media_type, None
+    pil_format, out_media_type = _FORMATS.get(fmt, _FORMATS['jpeg'])
+    try:
+        img = Image.open(io.BytesIO(data))
+        # JPEG can decode straight at a reduced scale, far cheaper than a full decode then resize.
+        img.draft('RGB', (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        grayscale = _chroma(img.convert('RGB').resize((64, 64))) < _GRAYSCALE_MAX_CHROMA
+        img = img.convert('L' if grayscale else 'RGB')
+        for quality in _QUALITY_STEPS:
+            out = io.BytesIO()
+            img.save(out, pil_format, quality=quality, optimize=True)
+            if out.tell() <= target_bytes:
+                break
+        encoded = out.getvalue()
+    except Exception as e:
+        logger.warning(f"Could not preprocess image, sending it unchanged: {e}")
+        return data, media_type, None
+
+    reencoded = len(encoded) < len(data)
+    if not reencoded:
+        encoded, out_media_type = data, media_type
+    report = {
+        'original_bytes': len(data),
+        'bytes': len(encoded),
+        'saved_bytes': len(data) - len(encoded),
+        'reencoded': reencoded,
+        'width': img.width,
+        'height': img.height,
+        'grayscale': grayscale,
+    }
+    return encoded, out_media_type, report
@@ -0,0 +1,61 @@
+"""
+Ingredient line parsing, kept apart from the web app.
+
+The ingredient parse pool's processes are started with forkserver (or spawn),
+not forked from a gunicorn worker, so they import only this module and
+ingredient_parser rather than the whole Flask app with its threads and locks.
+"""
+
+from ingredient_parser import parse_ingredient
+
+
+def _format_quantity(qty) -> str:
+    """Format a parsed quantity value as a human-readable string.
+
+    ingredient-parser-nlp returns quantity values as Python Fraction objects
+    (e.g. Fraction(3, 2) for 1½).  str() on an improper Fraction gives "3/2",
+    which is hard to read and breaks the frontend scaling parser.  Convert to
+    mixed-number notation instead: Fraction(3, 2) → "1 1/2".
+    """
+    from fractions import Fraction
+    try:
+        f = Fraction(qty).limit_denominator(16)
+    except (TypeError, ValueError):
+        return str(qty)
+    if f.denominator == 1:
+        return str(f.numerator)
+    whole = f.numerator // f.denominator
+    remainder = f - whole
+    if whole > 0:
+        return f"{whole} {remainder.numerator}/{remainder.denominator}"
+    return f"{remainder.numerator}/{remainder.denominator}"
+
+
+def parse_ingredient_text(text):
+    try:
+        result = parse_ingredient(text)
+        name = None
+        if result.name:
+            name_parts = [n.text for n in result.name if n.text]
+            name = ' '.join(name_parts) if name_parts else None
+        quantity = None
+        if result.amount:
+            amount = result.amount[0]
+            parts = []
+            if amount.quantity:
+                parts.append(_format_quantity(amount.quantity))
+            if amount.unit:
+                parts.append(str(amount.unit))
+            quantity = ' '.join(parts) if parts else None
+        return {"text": text, "parsed_name": name, "parsed_quantity": quantity}
+    except Exception:
+        return {"text": text, "parsed_name": None, "parsed_quantity": None}
+
+
+def init_parse_worker():
+    """Pool initializer: load the CRF model once per process, not per shard."""
+    parse_ingredient_text('1 cup flour')
+
+
+def parse_shard(texts):
+    return [parse_ingredient_text(t) for t in texts]
@@ -0,0 +1,125 @@
+"""
+Incremental parser for the JSON object an LLM streams back.
+
+The recipe prompt asks for a single flat object. JsonFieldStream is fed the
+completion text as it arrives and reports each top-level field as soon as its
+value is complete, and each element of a top-level array as soon as that
+element is complete, so the ingredient list can be shown line by line while
+the model is still writing the instructions.
+
+Anything before the first '{' (a ```json fence, a stray sentence) is ignored.
+"""
+
+import json
+
+FIELD = 'field'      # (FIELD, key, value): a top-level field is complete
+ITEM = 'item'        # (ITEM, key, value): one element of a top-level array is complete
+
+
+class JsonFieldStream:
+
+    def __init__(self):
+        self._buf = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._done = False
+        self._key = None
+        self._key_start = None
+        self._expect_key = True
+        self._value_start = None
+        self._item_start = None
+        self._in_array = False
+        self.fields = {}
+
+    @property
+    def complete(self):
+        """True once the closing brace of the top-level object has arrived."""
+        return self._done
+
+    def feed(self, text):
+        """Consume more completion text; returns the list of newly completed events."""
+        events = []
+        self._buf += text
+        buf = self._buf
+        while self._pos < len(buf) and not self._done:
+            ch = buf[self._pos]
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._key = json.loads(buf[self._key_start:self._pos + 1])
+                self._pos += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = self._pos
+                else:
+                    self._mark_value_start()
+            elif ch == ':' and self._depth == 1 and self._expect_key:
+                self._expect_key = False
+            elif ch in '{[':
+                self._mark_value_start()
+                self._depth += 1
+                if ch == '[' and self._depth == 2:
+                    self._in_array = True
+                    self._item_start = None
+            elif ch in '}]':
+                if self._depth == 2 and self._in_array:
+                    self._end_item(self._pos, events)
+                    self._in_array = False
+                self._depth -= 1
+                if self._depth == 0:
+                    self._end_field(self._pos, events)
+                    self._done = True
+            elif ch == ',':
+                if self._depth == 1:
+                    self._end_field(self._pos, events)
+                elif self._depth == 2 and self._in_array:
+                    self._end_item(self._pos, events)
+            elif not ch.isspace():
+                self._mark_value_start()
+            self._pos += 1
+        return events
+
+    def _mark_value_start(self):
+        if self._depth == 1 and not self._expect_key and self._value_start is None:
+            self._value_start = self._pos
+        elif self._depth == 2 and self._in_array and self._item_start is None:
+            self._item_start = self._pos
+
+    def _end_item(self, end, events):
+        if self._item_start is None:
+            return
+        try:
+            events.append((ITEM, self._key, json.loads(self._buf[self._item_start:end])))
+        except ValueError:
+            pass
+        self._item_start = None
+
+    def _end_field(self, end, events):
+        if self._value_start is not None and self._key is not None:
+            try:
+                value = json.loads(self._buf[self._value_start:end])
+            except ValueError:
+                pass
+            else:
+                self.fields[self._key] = value
+                events.append((FIELD, self._key, value))
+        self._key = None
+        self._expect_key = True
+        self._value_start = None
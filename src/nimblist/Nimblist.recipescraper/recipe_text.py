@@ -0,0 +1,155 @@
+"""
+Pick the recipe out of a page's main text before it goes into an LLM prompt.
+
+trafilatura's output for a recipe blog is mostly the story before the recipe
+and the comments after it; a plain head cut-off often stops before the
+ingredient list. recipe_excerpt() scores each line (quantity + unit lines,
+numbered or imperative steps, "Ingredients"/"Method" headings, servings and
+timings), groups the scored lines into regions, and keeps the densest regions
+— in page order — that fit the token budget, after a short header with the
+page's opening lines so the model still sees the title.
+"""
+
+import re
+
+# Rough chars-per-token for English prose; close enough for budgeting without a tokenizer.
+CHARS_PER_TOKEN = 4
+
+_FRACTIONS = '½⅓⅔¼¾⅛⅜⅝⅞'
+_BULLET = r'^\s*(?:[-•*▢□▪◦·]\s*)?'
+_QUANTITY_RE = re.compile(
+    _BULLET + rf'(?:\d+(?:[.,/]\d+)?|[{_FRACTIONS}]|a |an |one |two |three |four |half |pinch |handful )',
+    re.IGNORECASE,
+)
+_UNIT_RE = re.compile(
+    r'(?:\d|\b)(?:cups?|tbsps?|tbs|tablespoons?|tsps?|teaspoons?|g|kg|grams?|ml|l|litres?|liters?|oz|ounces?'
+    r'|lbs?|pounds?|pinch|cloves?|handful|cans?|tins?|sticks?|slices?|bunch(?:es)?|sprigs?|pieces?'
+    r'|large|medium|small|knobs?|dash|heaped|level)\b',
+    re.IGNORECASE,
+)
+_STEP_RE = re.compile(
+    _BULLET + r'(?:step\s*\d+|\d+[.)]\s|(?:preheat|heat|mix|stir|add|combine|whisk|bake|cook|bring|place|pour'
+    r'|serve|season|chop|fry|simmer|boil|roast|cover|remove|transfer|spread|fold|beat|melt|drain|slice|cut|put'
+    r'|let|leave|line|grease|sift|knead|blend|toss|arrange|sprinkle|garnish)\b)',
+    re.IGNORECASE,
+)
+_HEADING_RE = re.compile(
+    r'^\s*(?:ingredients?|method|instructions?|directions?|preparation|steps?|for the [\w ]{1,30})\s*:?\s*$',
+    re.IGNORECASE,
+)
+_STEPS_HEADING_RE = re.compile(r'^\s*(?:method|instructions?|directions?|preparation|steps?)\b', re.IGNORECASE)
+_META_RE = re.compile(r'\b(?:serves|servings?|yields?|makes|prep|cook(?:ing)? time|total time)\b.*\d', re.IGNORECASE)
+
+_HEADER_CHARS = 300
+# Unscored lines allowed inside a region (sub-headings, notes between steps).
+_MAX_GAP = 2
+# Lines after a Method/Instructions heading count as steps however they start
+# ("In a large bowl, ..."), as long as they keep the first step's shape (list
+# item or paragraph), up to the next heading or this many lines.
+_STEPS_AFTER_HEADING = 30
+_LIST_ITEM_RE = re.compile(r'^\s*(?:[-•*▢□▪◦·]|\d+[.)])\s')
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _line_score(line):
+    if _HEADING_RE.match(line):
+        return 3
+    if len(line) <= 120 and _QUANTITY_RE.match(line) and (_UNIT_RE.search(line) or len(line.split()) <= 6):
+        return 2
+    if len(line) <= 600 and _STEP_RE.match(line):
+        return 2
+    if len(line) <= 120 and _META_RE.search(line):
+        return 1
+    return 0
+
+
+def _regions(lines):
+    """[(score, first, last)] for runs of scored lines with at most _MAX_GAP unscored lines between."""
+    regions = []
+    start = last = None
+    score = 0
+    steps_until = -1
+    steps_listed = None
+    for i, line in enumerate(lines):
+        line_score = _line_score(line)
+        if line_score == 3:
+            steps_until = i + _STEPS_AFTER_HEADING if _STEPS_HEADING_RE.match(line) else -1
+            steps_listed = None
+        elif i <= steps_until:
+            listed = bool(_LIST_ITEM_RE.match(line))
+            if steps_listed is None:
+                steps_listed = listed
+            if listed == steps_listed:
+                line_score = max(line_score, 1)
+            else:
+                steps_until = -1
+        if not line_score:
+            continue
+        if start is not None and i - last - 1 > _MAX_GAP:
+            regions.append((score, start, last))
+            start = None
+        if start is None:
+            start, score = i, 0
+        score += line_score
+        last = i
+    if start is not None:
+        regions.append((score, start, last))
+    return regions
+
+
+def recipe_excerpt(text, max_tokens):
+    """Return (excerpt, stats) with the excerpt under max_tokens (estimated).
+
+    Text that already fits is returned whole. stats is {'source_chars',
+    'chars', 'tokens', 'regions'}; regions is 0 when no recipe-like lines were
+    found, in which case the excerpt is a plain head cut.
+    """
+    budget = max_tokens * CHARS_PER_TOKEN
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    regions = _regions(lines)
+    if not regions or len(text) <= budget:
+        excerpt = text[:budget]
+        return excerpt, _stats(text, excerpt, len(regions))
+
+    header = []
+    header_len = 0
+    for line in lines[:regions[0][1]]:
+        if header_len + len(line) > min(_HEADER_CHARS, budget // 4):
+            break
+        header.append(line)
+        header_len += len(line) + 1
+    remaining = budget - header_len
+
+    # Best regions first (score per character, so a long story with one stray
+    # "2 eggs" in it doesn't outrank a tight ingredient list), trimmed to fit.
+    chosen = []
+    ranked = sorted(regions, key=lambda r: r[0] / sum(len(line) + 1 for line in lines[r[1]:r[2] + 1]), reverse=True)
+    for score, first, last in ranked:
+        kept = []
+        for line in lines[first:last + 1]:
+            if len(line) + 1 > remaining:
+                break
+            kept.append(line)
+            remaining -= len(line) + 1
+        if kept:
+            chosen.append((first, kept))
+            remaining -= len('\n...\n')
+        if remaining <= 0:
+            break
+
+    parts = ['\n'.join(header)] if header else []
+    parts += ['\n'.join(kept) for _, kept in sorted(chosen)]
+    excerpt = '\n...\n'.join(parts)
+    return excerpt, _stats(text, excerpt, len(chosen))
+
+
+def _stats(text, excerpt, regions):
+    return {
+        'source_chars': len(text),
+        'chars': len(excerpt),
+        'tokens': estimate_tokens(excerpt),
+        'regions': regions,
+    }
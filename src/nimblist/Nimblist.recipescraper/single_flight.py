@@ -0,0 +1,263 @@
+"""
+Single-flight coalescing of identical concurrent scrape requests.
+
+When a recipe link is shared in a group chat, several people import the same
+URL within seconds. Rather than each request fetching the page and paying for
+its own LLM call, the first becomes the leader and the rest wait for its
+result.
+
+Within one process the waiters block on the leader's flight. Across gunicorn
+workers (and the async server) the leader holds a lease row in a small SQLite
+file and publishes its result there; waiters in other processes poll for it.
+A lease expires after lease_seconds, so a worker that dies mid-request only
+holds up its followers until then, after which one of them takes over.
+
+Results must be JSON-serialisable to cross processes (tuples come back as
+lists).
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Roles a caller can end up in; also the names of the counters in stats().
+LEADER = 'leader'               # ran the computation itself
+COALESCED_LOCAL = 'local'       # shared an in-flight computation in the same process
+COALESCED_REMOTE = 'remote'     # shared a computation running in another process
+TAKEOVER = 'takeover'           # the other process's leader vanished; retried for the lease
+TIMEOUT = 'timeout'             # gave up waiting
+
+# Lease states reported by LeaseStore.poll().
+PENDING = 'pending'
+DONE = 'done'
+GONE = 'gone'
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS flight_lease (
+        key        TEXT PRIMARY KEY,
+        token      TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS flight_result (
+        token       TEXT PRIMARY KEY,
+        value       TEXT NOT NULL,
+        finished_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS flight_counter (
+        name  TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+)
+
+
+class FlightTimeout(Exception):
+    """Raised to a follower whose timeout passed before the leader finished."""
+
+
+class LeaseStore:
+    """SQLite leases, published results and counters shared by all workers.
+
+    Storage errors are logged and swallowed: acquire() then makes the caller a
+    leader, so a broken store only costs the coalescing, never the import.
+    """
+
+    def __init__(self, path, lease_seconds=60.0, result_ttl=60.0):
+        # result_ttl is how long a published result stays readable for
+        # followers that are between polls; it is not a cache for new requests.
+        self._path = path
+        self._lease_seconds = lease_seconds
+        self._result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=1, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def acquire(self, key):
+        """Return (token, is_leader): a new lease, or the token of the live lease someone else holds."""
+        token = uuid.uuid4().hex
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    row = conn.execute('SELECT token, expires_at FROM flight_lease WHERE key = ?', (key,)).fetchone()
+                    if row and row[1] > now:
+                        return row[0], False
+                    conn.execute('INSERT OR REPLACE INTO flight_lease (key, token, expires_at) VALUES (?, ?, ?)',
+                                 (key, token, now + self._lease_seconds))
+                finally:
+                    conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            logger.warning(f"Could not take single-flight lease: {e}")
+        return token, True
+
+    def publish(self, key, token, value):
+        """Store the leader's result for its followers and drop the lease."""
+        now = time.time()
+        try:
+            encoded = json.dumps(value)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Single-flight result is not JSON-serialisable; followers will take over: {e}")
+            self.release(key, token)
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.execute('INSERT OR REPLACE INTO flight_result (token, value, finished_at) VALUES (?, ?, ?)',
+                                 (token, encoded, now))
+                    conn.execute('DELETE FROM flight_lease WHERE key = ? AND token = ?', (key, token))
+                    conn.execute('DELETE FROM flight_result WHERE finished_at < ?', (now - self._result_ttl,))
+                finally:
+                    conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            logger.warning(f"Could not publish single-flight result: {e}")
+
+    def release(self, key, token):
+        """Drop a lease without a result (the leader failed); a follower takes over."""
+        try:
+            with self._lock:
+                self._connect().execute('DELETE FROM flight_lease WHERE key = ? AND token = ?', (key, token))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not release single-flight lease: {e}")
+
+    def poll(self, key, token):
+        """('done', value) once published, ('pending', None) while the lease is live, else ('gone', None)."""
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute('SELECT value FROM flight_result WHERE token = ?', (token,)).fetchone()
+                if row:
+                    return DONE, json.loads(row[0])
+                live = conn.execute('SELECT 1 FROM flight_lease WHERE key = ? AND token = ? AND expires_at > ?',
+                                    (key, token, time.time())).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not poll single-flight result: {e}")
+            return GONE, None
+        return (PENDING, None) if live else (GONE, None)
+
+    def count(self, name):
+        try:
+            with self._lock:
+                self._connect().execute(
+                    'INSERT INTO flight_counter (name, count) VALUES (?, 1) '
+                    'ON CONFLICT (name) DO UPDATE SET count = count + 1',
+                    (name,),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not update single-flight counter {name}: {e}")
+
+    def stats(self):
+        """Counters for every role across all workers, plus the leases live right now."""
+        out = {name: 0 for name in (LEADER, COALESCED_LOCAL, COALESCED_REMOTE, TAKEOVER, TIMEOUT)}
+        try:
+            with self._lock:
+                conn = self._connect()
+                out.update(conn.execute('SELECT name, count FROM flight_counter').fetchall())
+                in_flight = conn.execute('SELECT COUNT(*) FROM flight_lease WHERE expires_at > ?',
+                                         (time.time(),)).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read single-flight stats: {e}")
+            return out
+        out['coalesced'] = out[COALESCED_LOCAL] + out[COALESCED_REMOTE]
+        requests = out['coalesced'] + out[LEADER]
+        out['coalesced_rate'] = round(out['coalesced'] / requests, 3) if requests else None
+        out['in_flight'] = in_flight
+        return out
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-based coalescing on top of a LeaseStore."""
+
+    def __init__(self, store, poll_interval=0.1):
+        self.store = store
+        self._poll_interval = poll_interval
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn, timeout):
+        """Return (value, role): fn()'s result, computed here or shared with an identical call.
+
+        A follower waits at most timeout seconds, then raises FlightTimeout.
+        An exception in a leader in this process is re-raised to its local
+        followers; one in another process lets a follower here take over.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            if not flight.done.wait(timeout):
+                self.store.count(TIMEOUT)
+                raise FlightTimeout
+            self.store.count(COALESCED_LOCAL)
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, COALESCED_LOCAL
+        try:
+            flight.value, role = self._run_shared(key, fn, timeout)
+            return flight.value, role
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _run_shared(self, key, fn, timeout):
+        give_up_at = time.monotonic() + timeout
+        while True:
+            token, leader = self.store.acquire(key)
+            if leader:
+                self.store.count(LEADER)
+                try:
+                    value = fn()
+                except BaseException:
+                    self.store.release(key, token)
+                    raise
+                self.store.publish(key, token, value)
+                return value, LEADER
+            while True:
+                state, value = self.store.poll(key, token)
+                if state == DONE:
+                    self.store.count(COALESCED_REMOTE)
+                    return value, COALESCED_REMOTE
+                if state == GONE:
+                    self.store.count(TAKEOVER)
+                    break
+                if time.monotonic() >= give_up_at:
+                    self.store.count(TIMEOUT)
+                    raise FlightTimeout
+                time.sleep(self._poll_interval)
@@ -0,0 +1,123 @@
+"""
+Per-stage latency histograms for the /metrics endpoint.
+
+Every scrape request ends with the time each of its stages took (fetch,
+scrape_html, parse_ingredients, trafilatura, llm, ...; see Deadline.spent).
+StageHistograms adds those to one histogram per (stage, domain_group,
+extraction path) and renders them in the Prometheus text format.
+
+The buckets live in a small SQLite file, like the strategy memory, so the
+counts cover every gunicorn worker whichever one answers the scrape of
+/metrics.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+METRIC = 'recipescraper_stage_seconds'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_histogram (
+    stage        TEXT NOT NULL,
+    domain_group TEXT NOT NULL,
+    path         TEXT NOT NULL,
+    bucket       INTEGER NOT NULL,   -- index into the buckets, len(buckets) for +Inf
+    count        INTEGER NOT NULL DEFAULT 0,
+    sum          REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (stage, domain_group, path, bucket)
+)
+"""
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class StageHistograms:
+    """SQLite-backed histograms of stage durations.
+
+    Storage errors are logged and swallowed: losing a sample never fails the
+    request that produced it.
+    """
+
+    def __init__(self, path, buckets=DEFAULT_BUCKETS):
+        self._path = path
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=1, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _bucket(self, seconds):
+        for i, upper in enumerate(self._buckets):
+            if seconds <= upper:
+                return i
+        return len(self._buckets)
+
+    def observe(self, domain_group, path, timings):
+        """Add one request's {stage: seconds} to the histograms for domain_group and path."""
+        rows = [(stage, domain_group, path, self._bucket(seconds), seconds) for stage, seconds in timings.items()]
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.executemany(
+                        """
+                        INSERT INTO stage_histogram (stage, domain_group, path, bucket, count, sum)
+                        VALUES (?, ?, ?, ?, 1, ?)
+                        ON CONFLICT (stage, domain_group, path, bucket) DO UPDATE SET
+                            count = count + 1,
+                            sum   = sum + excluded.sum
+                        """,
+                        rows,
+                    )
+                finally:
+                    conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record stage timings: {e}")
+
+    def render(self):
+        """The histograms in Prometheus text exposition format."""
+        try:
+            with self._lock:
+                rows = self._connect().execute(
+                    'SELECT stage, domain_group, path, bucket, count, sum FROM stage_histogram '
+                    'ORDER BY stage, domain_group, path, bucket'
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read stage timings: {e}")
+            rows = []
+
+        series = {}
+        for stage, domain_group, path, bucket, count, total in rows:
+            counts, sums = series.setdefault((stage, domain_group, path), ([0] * (len(self._buckets) + 1), [0.0]))
+            if bucket < len(counts):
+                counts[bucket] += count
+                sums[0] += total
+
+        lines = [
+            f'# HELP {METRIC} Time spent in each scrape stage, by domain group and extraction path.',
+            f'# TYPE {METRIC} histogram',
+        ]
+        for (stage, domain_group, path), (counts, sums) in series.items():
+            labels = f'stage="{_label(stage)}",domain_group="{_label(domain_group)}",path="{_label(path)}"'
+            cumulative = 0
+            for upper, count in zip(self._buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{METRIC}_bucket{{{labels},le="{upper}"}} {cumulative}')
+            lines.append(f'{METRIC}_sum{{{labels}}} {sums[0]:.6f}')
+            lines.append(f'{METRIC}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,132 @@
+"""
+Per-domain memory of which recipe extraction strategy works.
+
+Every /scrape attempt records, per (domain, strategy), a success or failure
+and the time it took. The record lives in a small SQLite file so all gunicorn
+workers (and the async server) share it and it survives worker recycling.
+plan() then orders the strategies for the next request against that domain:
+the best-performing strategy goes first, and for domains that only ever work
+via the LLM the scraper attempts that are known to fail are skipped outright.
+"""
+
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS domain_strategy (
+    domain       TEXT NOT NULL,
+    strategy     TEXT NOT NULL,
+    successes    INTEGER NOT NULL DEFAULT 0,
+    failures     INTEGER NOT NULL DEFAULT 0,
+    latency_ms   REAL,
+    last_success REAL,
+    last_attempt REAL,
+    PRIMARY KEY (domain, strategy)
+)
+"""
+
+# Exponentially-weighted latency: new = old * (1 - alpha) + sample * alpha
+_LATENCY_ALPHA = 0.2
+
+
+class StrategyMemory:
+    """SQLite-backed per-domain strategy statistics.
+
+    Storage errors are logged and swallowed: losing the memory only costs the
+    optimisation, never the import itself.
+    """
+
+    def __init__(self, path, skip_after=3, explore_rate=0.05):
+        # A strategy that has failed skip_after times with no success is skipped
+        # once another strategy has proven itself for the domain; explore_rate
+        # is the share of requests that ignore the memory and try everything,
+        # so a site that adds JSON-LD later is noticed.
+        self._path = path
+        self._skip_after = skip_after
+        self._explore_rate = explore_rate
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=1, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def record(self, domain, strategy, ok, elapsed_ms):
+        now = time.time()
+        try:
+            with self._lock:
+                self._connect().execute(
+                    """
+                    INSERT INTO domain_strategy
+                        (domain, strategy, successes, failures, latency_ms, last_success, last_attempt)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (domain, strategy) DO UPDATE SET
+                        successes    = successes + excluded.successes,
+                        failures     = failures + excluded.failures,
+                        latency_ms   = COALESCE(latency_ms * ? + excluded.latency_ms * ?, excluded.latency_ms),
+                        last_success = COALESCE(excluded.last_success, last_success),
+                        last_attempt = excluded.last_attempt
+                    """,
+                    (domain, strategy, int(ok), int(not ok), elapsed_ms, now if ok else None, now,
+                     1 - _LATENCY_ALPHA, _LATENCY_ALPHA),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not record strategy outcome for {domain}: {e}")
+
+    def stats(self, domain=None):
+        """{domain: {strategy: {successes, failures, success_rate, latency_ms, last_success}}}"""
+        query = 'SELECT domain, strategy, successes, failures, latency_ms, last_success FROM domain_strategy'
+        try:
+            with self._lock:
+                if domain is None:
+                    rows = self._connect().execute(query).fetchall()
+                else:
+                    rows = self._connect().execute(query + ' WHERE domain = ?', (domain,)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read strategy memory: {e}")
+            return {}
+        out = {}
+        for dom, strategy, successes, failures, latency_ms, last_success in rows:
+            out.setdefault(dom, {})[strategy] = {
+                'successes': successes,
+                'failures': failures,
+                'success_rate': round(successes / (successes + failures), 3),
+                'latency_ms': round(latency_ms, 1) if latency_ms is not None else None,
+                'last_success': last_success,
+            }
+        return out
+
+    def plan(self, domain, strategies, fallback=None):
+        """Order strategies (given in default order) for the next request to domain.
+
+        The strategy with the best success rate (ties: lowest latency) moves to
+        the front. If that winner is the expensive fallback (the LLM), the
+        strategies that keep failing for this domain are dropped.
+        """
+        strategies = list(strategies)
+        stats = self.stats(domain).get(domain)
+        if not stats or random.random() < self._explore_rate:
+            return strategies
+        proven = [s for s in strategies if stats.get(s, {}).get('successes')]
+        if not proven:
+            return strategies
+        winner = max(proven, key=lambda s: (stats[s]['success_rate'], -(stats[s]['latency_ms'] or 0)))
+        order = [winner] + [s for s in strategies if s != winner]
+        if winner == fallback:
+            order = [
+                s for s in order
+                if s == winner or stats.get(s, {}).get('successes')
+                or stats.get(s, {}).get('failures', 0) < self._skip_after
+            ]
+        return order
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# Set before any test module imports app.py, which reads them at import.
+os.environ.setdefault('SCRAPER_WARMUP', '0')
+os.environ.setdefault('SCRAPER_STATE_DIR', tempfile.mkdtemp(prefix='nimblist-scraper-tests-'))
+# Always try strategies in their default order, whatever earlier tests recorded.
+os.environ.setdefault('STRATEGY_EXPLORE_RATE', '1')
@@ -0,0 +1,89 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+
+_PAGE = app_module._WARMUP_HTML
+_URL = 'https://example.com/recipes/buttered-toast'
+
+
+class TestSharedTree(unittest.TestCase):
+    """recipe_scrapers must build its schema.org data from the page's shared lxml tree."""
+
+    def test_generic_scraper_uses_shared_tree_schema(self):
+        scraper, path = app_module._create_scraper(app_module._as_page(_PAGE), _URL)
+        self.assertEqual(path, app_module.PATH_GENERIC)
+        self.assertIsInstance(scraper.schema, app_module._SharedTreeSchemaOrg)
+        self.assertEqual(scraper.title(), 'Buttered toast')
+
+    def test_page_is_parsed_once(self):
+        page = app_module._as_page(_PAGE)
+        with patch.object(app_module.lxml.html, 'fromstring', wraps=app_module.lxml.html.fromstring) as parse:
+            scraper, _ = app_module._create_scraper(page, _URL)
+            app_module._scraper_result(scraper)
+            app_module._extract_og_image(page)
+        self.assertEqual(parse.call_count, 1)
+
+    def test_plain_string_still_scrapes(self):
+        scraper, _ = app_module._create_scraper(str(_PAGE), _URL)
+        self.assertEqual(scraper.ingredients(), ['2 slices of white bread', '1 tbsp salted butter'])
+
+
+class TestClassifierTimeout(unittest.TestCase):
+
+    def setUp(self):
+        url = patch.object(app_module, '_CLASSIFIER_URL', 'http://classifier:5000')
+        url.start()
+        self.addCleanup(url.stop)
+
+    def test_uses_the_configured_timeout_without_a_deadline(self):
+        self.assertEqual(app_module._classifier_timeout(['flour']), app_module._CLASSIFIER_TIMEOUT)
+
+    def test_disabled_timeout_without_a_deadline_skips_the_call(self):
+        with patch.object(app_module, '_CLASSIFIER_TIMEOUT', 0):
+            self.assertIsNone(app_module._classifier_timeout(['flour']))
+
+    def test_spent_deadline_skips_the_call(self):
+        deadline = app_module.Deadline(0)
+        self.assertIsNone(app_module._classifier_timeout(['flour'], deadline))
+        self.assertIn('classify', deadline.skipped)
+
+    def test_no_names_or_no_url_skips_the_call(self):
+        self.assertIsNone(app_module._classifier_timeout([]))
+        with patch.object(app_module, '_CLASSIFIER_URL', ''):
+            self.assertIsNone(app_module._classifier_timeout(['flour']))
+
+
+class TestProviderBreakers(unittest.TestCase):
+
+    def setUp(self):
+        breakers = patch.object(app_module, '_breakers', {})
+        breakers.start()
+        self.addCleanup(breakers.stop)
+        self.cfg = {'provider': 'ollama', 'model': 'llava', 'vision_model': '', 'api_key': '', 'base_url': '',
+                    'fallbacks': [{'provider': 'gemini', 'model': 'gemini-2.0-flash', 'vision_model': ''}]}
+
+    def test_vision_calls_have_their_own_breakers(self):
+        _, vision_cfg = app_module._vision_request('https://example.com/card.jpg', self.cfg)
+        text, vision = app_module._provider_breaker(self.cfg), app_module._provider_breaker(vision_cfg)
+        self.assertIsNot(text, vision)
+        self.assertEqual(vision.name, 'ollama/llava#vision')
+        fallback = app_module._provider_breaker(vision_cfg['fallbacks'][0])
+        self.assertEqual(fallback.name, 'gemini/gemini-2.0-flash#vision')
+
+    def test_slow_photo_imports_do_not_open_text_extraction(self):
+        _, vision_cfg = app_module._vision_request('https://example.com/card.jpg', self.cfg)
+        slow = app_module._BREAKER_SETTINGS['slow_call_seconds'] * 1.5
+        for _ in range(app_module._BREAKER_SETTINGS['window']):
+            app_module._provider_breaker(vision_cfg).record(True, slow)
+        self.assertTrue(app_module._provider_breaker(vision_cfg).allow())
+        self.assertTrue(app_module._provider_breaker(self.cfg).allow())
+        self.assertEqual(app_module._llm_chain(self.cfg)[0]['model'], 'llava')
+
+
+if __name__ == '__main__':
+    unittest.main()
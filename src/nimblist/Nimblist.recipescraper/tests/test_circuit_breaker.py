@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def _breaker(**kwargs):
+    settings = dict(window=10, min_calls=4, failure_rate=0.5, slow_call_seconds=5.0, slow_call_rate=0.75,
+                    cooldown=0.0)
+    settings.update(kwargs)
+    return CircuitBreaker('test/model', **settings)
+
+
+def _state(breaker):
+    return breaker.snapshot()['state']
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def _trip(self, breaker):
+        for _ in range(4):
+            breaker.record(False, 0.1)
+        self.assertEqual(_state(breaker), OPEN)
+
+    def test_stays_closed_below_min_calls(self):
+        breaker = _breaker()
+        for _ in range(3):
+            breaker.record(False, 0.1)
+        self.assertEqual(_state(breaker), CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_opens_on_failure_rate(self):
+        breaker = _breaker()
+        for ok in (True, True, False, False):
+            breaker.record(ok, 0.1)
+        self.assertEqual(_state(breaker), OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_opens_on_slow_call_rate(self):
+        breaker = _breaker()
+        for elapsed in (6.0, 6.0, 6.0, 0.1):
+            breaker.record(True, elapsed)
+        self.assertEqual(_state(breaker), OPEN)
+
+    def test_healthy_calls_keep_it_closed(self):
+        breaker = _breaker()
+        for ok in (True, False, True, True, False, True):
+            breaker.record(ok, 0.1)
+        self.assertEqual(_state(breaker), CLOSED)
+
+    def test_probe_waits_for_cooldown(self):
+        breaker = _breaker(cooldown=60.0)
+        self._trip(breaker)
+        self.assertFalse(breaker.start_probe())
+        self.assertEqual(_state(breaker), OPEN)
+
+    def test_only_one_probe_is_claimed(self):
+        breaker = _breaker()
+        self._trip(breaker)
+        self.assertTrue(breaker.start_probe())
+        self.assertFalse(breaker.start_probe())
+        self.assertEqual(_state(breaker), HALF_OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_probe_success_closes_with_an_empty_window(self):
+        breaker = _breaker()
+        self._trip(breaker)
+        breaker.start_probe()
+        breaker.record_probe(True)
+        self.assertEqual(_state(breaker), CLOSED)
+        self.assertEqual(breaker.snapshot()['calls'], 0)
+        self.assertTrue(breaker.allow())
+
+    def test_probe_failure_reopens(self):
+        breaker = _breaker()
+        self._trip(breaker)
+        breaker.start_probe()
+        breaker.record_probe(False)
+        self.assertEqual(_state(breaker), OPEN)
+        self.assertTrue(breaker.start_probe())
+
+    def test_live_calls_do_not_decide_a_pending_probe(self):
+        breaker = _breaker()
+        self._trip(breaker)
+        breaker.start_probe()
+        breaker.record(True, 0.1)
+        self.assertEqual(_state(breaker), HALF_OPEN)
+        breaker.record(False, 0.1)
+        self.assertEqual(_state(breaker), HALF_OPEN)
+        breaker.record_probe(True)
+        self.assertEqual(_state(breaker), CLOSED)
+
+    def test_calls_started_before_closing_are_ignored(self):
+        breaker = _breaker()
+        self._trip(breaker)
+        breaker.start_probe()
+        started = time.monotonic()
+        breaker.record_probe(True)
+        time.sleep(0.01)
+        for _ in range(4):
+            breaker.record(False, time.monotonic() - started + 0.005)
+        self.assertEqual(_state(breaker), CLOSED)
+        self.assertEqual(breaker.snapshot()['calls'], 0)
+        for _ in range(4):
+            breaker.record(False, 0.0)
+        self.assertEqual(_state(breaker), OPEN)
+
+    def test_probe_outcome_without_a_probe_is_ignored(self):
+        breaker = _breaker()
+        breaker.record_probe(False)
+        self.assertEqual(_state(breaker), CLOSED)
+        self._trip(breaker)
+        breaker.record_probe(True)
+        self.assertEqual(_state(breaker), OPEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
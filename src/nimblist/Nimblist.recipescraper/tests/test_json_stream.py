@@ -0,0 +1,73 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_stream import FIELD, ITEM, JsonFieldStream
+
+_RECIPE = {
+    'title': 'Pancakes {fluffy}, "American" style',
+    'ingredients': ['200g flour', '2 eggs, beaten', '1 tsp "baking" powder \\ soda'],
+    'servings': 4,
+    'notes': None,
+    'nutrition': {'kcal': 310, 'tags': ['veg', 'sweet']},
+    'instructions': ['Whisk.', 'Fry [both sides].'],
+}
+
+
+def _feed_in_chunks(text, size):
+    stream = JsonFieldStream()
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(stream.feed(text[i:i + size]))
+    return stream, events
+
+
+class TestJsonFieldStream(unittest.TestCase):
+
+    def test_reports_every_field_and_array_item(self):
+        stream, events = _feed_in_chunks(json.dumps(_RECIPE), 1000)
+        self.assertTrue(stream.complete)
+        self.assertEqual(stream.fields, _RECIPE)
+        self.assertEqual([value for kind, key, value in events if kind == ITEM and key == 'ingredients'],
+                         _RECIPE['ingredients'])
+        self.assertEqual([key for kind, key, _ in events if kind == FIELD], list(_RECIPE))
+
+    def test_chunk_boundaries_do_not_change_the_events(self):
+        text = json.dumps(_RECIPE, indent=2)
+        _, whole = _feed_in_chunks(text, len(text))
+        for size in (1, 2, 7, 13):
+            with self.subTest(size=size):
+                _, events = _feed_in_chunks(text, size)
+                self.assertEqual(events, whole)
+
+    def test_items_arrive_before_the_array_closes(self):
+        stream = JsonFieldStream()
+        events = stream.feed('{"title": "Soup", "ingredients": ["1 onion", "2 leeks", ')
+        self.assertEqual(events, [(FIELD, 'title', 'Soup'), (ITEM, 'ingredients', '1 onion'),
+                                  (ITEM, 'ingredients', '2 leeks')])
+        self.assertFalse(stream.complete)
+        events = stream.feed('"salt"]}')
+        self.assertEqual(events, [(ITEM, 'ingredients', 'salt'),
+                                  (FIELD, 'ingredients', ['1 onion', '2 leeks', 'salt'])])
+        self.assertTrue(stream.complete)
+
+    def test_ignores_text_around_the_object(self):
+        stream, events = _feed_in_chunks('Sure! ```json\n{"title": "Tea"}\n```\nEnjoy {}', 5)
+        self.assertEqual(events, [(FIELD, 'title', 'Tea')])
+        self.assertEqual(stream.fields, {'title': 'Tea'})
+
+    def test_empty_array_has_no_items(self):
+        _, events = _feed_in_chunks('{"ingredients": [], "title": "Water"}', 3)
+        self.assertEqual(events, [(FIELD, 'ingredients', []), (FIELD, 'title', 'Water')])
+
+    def test_truncated_reply_keeps_the_completed_fields(self):
+        stream, _ = _feed_in_chunks('{"title": "Stew", "servings": 2, "ingredients": ["beef", "car', 4)
+        self.assertFalse(stream.complete)
+        self.assertEqual(stream.fields, {'title': 'Stew', 'servings': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+"""
+Parity of the two serving modes: every endpoint answered by app.py (sync) and
+asgi.py (async) against the same saved pages and the bench fake LLM must give
+the same status, extraction path and body.
+"""
+
+import asyncio
+import base64
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+SCRAPER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(SCRAPER_DIR)
+sys.path.append(os.path.join(SCRAPER_DIR, 'bench'))
+
+import app as app_module
+import asgi
+import fake_llm
+
+CORPUS_DIR = os.path.join(SCRAPER_DIR, 'bench', 'corpus')
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class _ClassifierHandler(BaseHTTPRequestHandler):
+    """Stand-in for the classification service's /predict-batch."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        names = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['product_names']
+        body = json.dumps({'predictions': [
+            {'predicted_primary_category': f'cat-{len(n)}', 'predicted_sub_category': None} for n in names
+        ]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def _events(text):
+    """(event, data) pairs of an SSE body."""
+    events = []
+    for block in text.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class TestServingModeParity(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.llm = fake_llm.FakeLLM(latency_ms=0)
+        cls.llm_server = fake_llm.serve(cls.llm)
+        cls.llm_url = f'http://127.0.0.1:{cls.llm_server.server_address[1]}'
+        cls.pages_server, cls.pages_url = _serve(
+            functools.partial(_QuietHandler, directory=os.path.join(CORPUS_DIR, 'pages')))
+        cls.classifier_server, classifier_url = _serve(_ClassifierHandler)
+        cls.patches = [
+            patch.object(app_module, '_ANTHROPIC_BASE_URL', cls.llm_url),
+            patch.object(app_module, '_GEMINI_BASE_URL', cls.llm_url),
+            patch.object(app_module, '_CLASSIFIER_URL', classifier_url),
+        ]
+        for p in cls.patches:
+            p.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        for p in cls.patches:
+            p.stop()
+        for server in (cls.llm_server, cls.pages_server, cls.classifier_server):
+            server.shutdown()
+
+    def _cfg(self, provider='ollama'):
+        return {'provider': provider, 'model': 'test-model', 'vision_model': 'test-vision-model',
+                'api_key': 'test', 'base_url': self.llm_url}
+
+    def _both(self, path, body):
+        """(status, headers, text) from the sync app, then the same from the async app."""
+        sync = app_module.app.test_client().post(path, json=body)
+
+        async def run_async():
+            async with asgi.app.test_app() as test_app:
+                resp = await test_app.test_client().post(path, json=body)
+                return resp.status_code, resp.headers, await resp.get_data(as_text=True)
+
+        return (sync.status_code, sync.headers, sync.get_data(as_text=True)), asyncio.run(run_async())
+
+    def assertSameJson(self, path, body):
+        (sync_status, sync_headers, sync_text), (async_status, async_headers, async_text) = self._both(path, body)
+        self.assertEqual(sync_status, async_status)
+        self.assertEqual(sync_headers.get('X-Extraction-Path'), async_headers.get('X-Extraction-Path'))
+        self.assertEqual(json.loads(sync_text), json.loads(async_text))
+        return sync_status, sync_headers, json.loads(sync_text)
+
+    def assertSameEvents(self, path, body):
+        (sync_status, _, sync_text), (async_status, _, async_text) = self._both(path, body)
+        self.assertEqual((sync_status, 200), (async_status, 200))
+        self.assertEqual(_events(sync_text), _events(async_text))
+        return _events(sync_text)
+
+    def _image_body(self, provider='ollama'):
+        with open(os.path.join(CORPUS_DIR, 'images', 'recipe_card_photo.jpg'), 'rb') as f:
+            image = base64.b64encode(f.read()).decode()
+        return {'image': image, 'media_type': 'image/jpeg', 'llm_config': self._cfg(provider)}
+
+    # ------------------------------------------------------------------
+    # /scrape
+    # ------------------------------------------------------------------
+    def test_scrape_jsonld_page(self):
+        status, headers, body = self.assertSameJson(
+            '/scrape', {'url': f'{self.pages_url}/jsonld_blog.html', 'llm_config': self._cfg()})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['X-Extraction-Path'], app_module.PATH_JSONLD)
+        self.assertTrue(body['ingredients'])
+
+    def test_scrape_falls_back_to_llm(self):
+        status, headers, body = self.assertSameJson(
+            '/scrape', {'url': f'{self.pages_url}/no_markup.html', 'llm_config': self._cfg()})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['X-Extraction-Path'], app_module.PATH_LLM)
+        self.assertEqual(body['title'], fake_llm.REPLY['title'])
+
+    def test_scrape_llm_fallback_over_anthropic_and_gemini(self):
+        for provider in ('anthropic', 'gemini'):
+            with self.subTest(provider=provider):
+                _, headers, body = self.assertSameJson(
+                    '/scrape', {'url': f'{self.pages_url}/no_markup_long.html', 'llm_config': self._cfg(provider)})
+                self.assertEqual(headers['X-Extraction-Path'], app_module.PATH_LLM)
+
+    def test_scrape_with_classification(self):
+        _, _, body = self.assertSameJson(
+            '/scrape', {'url': f'{self.pages_url}/microdata.html', 'classify': True, 'llm_config': self._cfg()})
+        self.assertIn('category', body['ingredients'][0])
+
+    def test_scrape_missing_page(self):
+        status, _, body = self.assertSameJson(
+            '/scrape', {'url': f'{self.pages_url}/missing.html', 'llm_config': self._cfg()})
+        self.assertEqual(status, 422)
+        self.assertIn('error', body)
+
+    def test_scrape_rejects_bad_url(self):
+        status, _, _ = self.assertSameJson('/scrape', {'url': 'ftp://example.com/recipe'})
+        self.assertEqual(status, 400)
+
+    # ------------------------------------------------------------------
+    # /scrape-image and /parse-ingredients
+    # ------------------------------------------------------------------
+    def test_scrape_image(self):
+        status, _, body = self.assertSameJson('/scrape-image', self._image_body())
+        self.assertEqual(status, 200)
+        self.assertEqual(body['title'], fake_llm.REPLY['title'])
+
+    def test_parse_ingredients_with_classification(self):
+        _, _, body = self.assertSameJson(
+            '/parse-ingredients', {'ingredients': ['1 cup flour', '2 eggs'], 'classify': True})
+        self.assertEqual([i['text'] for i in body], ['1 cup flour', '2 eggs'])
+
+    # ------------------------------------------------------------------
+    # /scrape-batch
+    # ------------------------------------------------------------------
+    def test_scrape_batch(self):
+        urls = [f'{self.pages_url}/{page}' for page in ('jsonld_graph.html', 'no_markup.html', 'missing.html')]
+        (sync_status, _, sync_text), (async_status, _, async_text) = self._both(
+            '/scrape-batch', {'urls': urls + ['not a url'], 'llm_config': self._cfg()})
+        self.assertEqual((sync_status, 200), (async_status, 200))
+
+        def lines(text):
+            return sorted((json.loads(line) for line in text.splitlines()), key=lambda line: line['index'])
+
+        self.assertEqual(lines(sync_text), lines(async_text))
+        self.assertEqual([line['status'] for line in lines(sync_text)], [200, 200, 422, 400])
+
+    def test_sync_batch_reports_urls_left_when_its_budget_runs_out(self):
+        slow = fake_llm.FakeLLM(latency_ms=5000)
+        slow_server = fake_llm.serve(slow)
+        self.addCleanup(slow_server.shutdown)
+        cfg = {**self._cfg(), 'base_url': f'http://127.0.0.1:{slow_server.server_address[1]}'}
+        urls = [f'{self.pages_url}/no_markup.html?n={n}' for n in range(3)]
+        with patch.object(app_module, '_BATCH_BUDGET', 1.5), patch.object(app_module, '_BATCH_CONCURRENCY', 1), \
+                patch.object(app_module, '_LLM_MIN_BUDGET', 0.1):
+            started = time.monotonic()
+            resp = app_module.app.test_client().post('/scrape-batch', json={'urls': urls, 'llm_config': cfg})
+            lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+            elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 3)
+        self.assertEqual(sorted(line['index'] for line in lines), [0, 1, 2])
+        self.assertEqual([line['status'] for line in lines if line['index'] > 0], [504, 504])
+
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+    def test_scrape_stream(self):
+        for page, path in (('jsonld_blog.html', app_module.PATH_JSONLD), ('no_markup.html', app_module.PATH_LLM)):
+            with self.subTest(page=page):
+                events = self.assertSameEvents(
+                    '/scrape-stream', {'url': f'{self.pages_url}/{page}', 'llm_config': self._cfg()})
+                self.assertEqual(events[-1][0], 'result')
+                self.assertEqual(events[-1][1]['extraction_path'], path)
+
+    def test_scrape_image_stream(self):
+        for provider in ('ollama', 'anthropic', 'gemini'):
+            with self.subTest(provider=provider):
+                events = self.assertSameEvents('/scrape-image-stream', self._image_body(provider))
+                self.assertEqual(events[-1][0], 'result')
+                self.assertEqual(events[-1][1]['recipe']['title'], fake_llm.REPLY['title'])
+
+    def test_streams_record_stage_metrics_and_reuse_ingredient_parses(self):
+        cases = (('/scrape-stream', {'url': f'{self.pages_url}/no_markup.html', 'llm_config': self._cfg()}),
+                 ('/scrape-image-stream', self._image_body()))
+        for path, body in cases:
+            with self.subTest(path=path):
+                with patch.object(app_module, '_observe_timings') as observe, \
+                        patch.object(app_module, 'parse_ingredient_texts') as parse:
+                    events = self.assertSameEvents(path, body)
+                streamed = [data for event, data in events if event == 'ingredient']
+                self.assertTrue(streamed)
+                self.assertEqual(events[-1][1]['recipe']['ingredients'], streamed)
+                parse.assert_not_called()
+                self.assertEqual(observe.call_count, 2)
+                deadline, _, extraction_path = observe.call_args.args
+                self.assertEqual(extraction_path, app_module.PATH_LLM)
+                self.assertIn(app_module.PATH_LLM, deadline.spent)
+
+
+if __name__ == '__main__':
+    unittest.main()
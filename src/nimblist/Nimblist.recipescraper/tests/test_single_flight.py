@@ -0,0 +1,123 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from single_flight import (COALESCED_LOCAL, COALESCED_REMOTE, LEADER, TAKEOVER, FlightTimeout, LeaseStore,
+                           SingleFlight)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'flights.sqlite3')
+        self.flights = SingleFlight(LeaseStore(self.path), poll_interval=0.01)
+
+    def _run_together(self, flights, n, fn, key='https://example.com/soup', timeout=5):
+        """Start n callers of flights[i % len(flights)].run(key, fn) at once; (value, role) or the exception each."""
+        results = [None] * n
+        barrier = threading.Barrier(n)
+
+        def call(i):
+            barrier.wait()
+            try:
+                results[i] = flights[i % len(flights)].run(key, fn, timeout)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_concurrent_calls_share_one_computation(self):
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'title': 'Soup'}
+
+        results = self._run_together([self.flights], 4, fn)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([value for value, _ in results], [{'title': 'Soup'}] * 4)
+        self.assertEqual(sorted(role for _, role in results), [LEADER] + [COALESCED_LOCAL] * 3)
+        stats = self.flights.store.stats()
+        self.assertEqual((stats[LEADER], stats['coalesced'], stats['in_flight']), (1, 3, 0))
+
+    def test_sequential_calls_are_not_coalesced(self):
+        self.assertEqual(self.flights.run('k', lambda: 1, 5), (1, LEADER))
+        self.assertEqual(self.flights.run('k', lambda: 2, 5), (2, LEADER))
+
+    def test_leader_error_reaches_local_followers(self):
+        def fn():
+            time.sleep(0.2)
+            raise ValueError('page gone')
+
+        results = self._run_together([self.flights], 3, fn)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(self.flights.store.stats()['in_flight'], 0)
+
+    def test_follower_times_out(self):
+        release = threading.Event()
+        leader = threading.Thread(target=self.flights.run, args=('k', release.wait, 5))
+        leader.start()
+        self.addCleanup(leader.join)
+        self.addCleanup(release.set)
+        time.sleep(0.05)
+        with self.assertRaises(FlightTimeout):
+            self.flights.run('k', lambda: 'unused', 0.05)
+
+    def test_calls_in_another_process_read_the_published_result(self):
+        other = SingleFlight(LeaseStore(self.path), poll_interval=0.01)
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['200g flour']
+
+        results = self._run_together([self.flights, other], 2, fn)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(role for _, role in results), sorted([LEADER, COALESCED_REMOTE]))
+        self.assertEqual([value for value, _ in results], [['200g flour']] * 2)
+
+    def test_follower_takes_over_from_a_failed_leader_in_another_process(self):
+        other = SingleFlight(LeaseStore(self.path), poll_interval=0.01)
+        attempts = []
+
+        def fn():
+            attempts.append(1)
+            time.sleep(0.2)
+            if len(attempts) == 1:
+                raise ValueError('upstream down')
+            return 'ok'
+
+        results = self._run_together([self.flights, other], 2, fn)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(sum(isinstance(r, ValueError) for r in results), 1)
+        self.assertIn(('ok', LEADER), results)
+        self.assertEqual(self.flights.store.stats()[TAKEOVER], 1)
+
+    def test_unserialisable_result_lets_the_other_process_take_over(self):
+        other = SingleFlight(LeaseStore(self.path), poll_interval=0.01)
+
+        def fn():
+            time.sleep(0.2)
+            return object()
+
+        results = self._run_together([self.flights, other], 2, fn)
+        self.assertEqual([role for _, role in results], [LEADER, LEADER])
+        self.assertEqual(self.flights.store.stats()[TAKEOVER], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+Warm-up of the heavy parsing libraries before the first request.
+
+recipe_scrapers, trafilatura and ingredient_parser each do expensive one-off
+work on first use: the ingredient parser loads its CRF model and NLTK data,
+the scrapers build their schema.org / extruct machinery. Left lazy, that cost
+lands on the first import after every deploy or worker recycle.
+
+app.py runs one small dummy job through each library at import. Under
+`gunicorn --preload` that import happens in the master, so the loaded models
+are shared copy-on-write by every forked worker and no worker starts cold.
+/health reports ready only once every component has warmed, with the time each
+took.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Runs named warm-up steps once and keeps a per-component startup report."""
+
+    def __init__(self):
+        self._steps = {}
+        self._results = {}   # name -> {'ms', 'ok', 'error'}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def run(self, steps):
+        """Run each (name, fn) in order; a failing step is logged and reported, not raised."""
+        self._pid = os.getpid()
+        for name, fn in steps:
+            self._steps[name] = fn
+            self._run_step(name, fn)
+
+    def retry_failed(self):
+        """Re-run the steps that failed (e.g. a model download that hit a network blip)."""
+        for name, fn in self._steps.items():
+            if not self._results[name]['ok']:
+                self._run_step(name, fn)
+
+    def _run_step(self, name, fn):
+        started = time.monotonic()
+        error = None
+        try:
+            fn()
+        except Exception as e:
+            # First meaningful line only; NLTK's LookupError is a banner-framed essay.
+            detail = next((line.strip() for line in str(e).splitlines() if any(c.isalnum() for c in line)), '')
+            error = f"{type(e).__name__}: {detail}"
+            logger.warning(f"Warm-up of {name} failed: {error}")
+        with self._lock:
+            self._results[name] = {
+                'ms': round((time.monotonic() - started) * 1000),
+                'ok': error is None,
+                'error': error,
+            }
+
+    @property
+    def ran(self):
+        return self._pid is not None
+
+    @property
+    def ready(self):
+        with self._lock:
+            return self.ran and all(r['ok'] for r in self._results.values())
+
+    def report(self):
+        with self._lock:
+            components = {name: dict(result) for name, result in self._results.items()}
+        return {
+            'ready': self.ready,
+            # Warmed in another process: the gunicorn master, before this worker was forked.
+            'preloaded': self.ran and self._pid != os.getpid(),
+            'total_ms': sum(c['ms'] for c in components.values()),
+            'components': components,
+        }